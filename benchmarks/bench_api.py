@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+API服务并发压测
+在子进程中用uvicorn启动wechat_crawler.api（或用--url指向已运行的服务），
+由多个并发客户端循环请求指定接口，输出每个接口和总体的每秒请求数、p50/p95/p99延迟和错误数，
+结果保存到benchmarks/results/下，可以用--compare与之前的提交对比
+
+本地启动时使用--redis-db指定的库，开始前会清空该库并写入模拟的cookie和access_token，
+因此不能与config.py中的REDIS_DB相同
+
+用法: python benchmarks/bench_api.py [--concurrency 100] [--duration 10]
+      [--endpoints /api/status,/api/cookies] [--url http://host:5000] [--compare benchmarks/results/xxx.json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import sys
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_crawl import configure, percentile, parse_settings, git_revision, _free_port
+
+DEFAULT_ENDPOINTS = ['/api/status', '/api/cookies', '/api/token']
+
+
+def _server_main(port, base_url, settings, cookies):
+    """子进程入口：准备Redis后启动API服务"""
+    config = configure(base_url, settings)
+    import redis
+    redis_conn = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB,
+                             password=config.REDIS_PASSWORD)
+    redis_conn.flushdb()
+    for i in range(cookies):
+        redis_conn.rpush('wechat_cookies', f"bench-cookie-{i:04d}")
+    redis_conn.set('access_token', 'bench-access-token')
+    import uvicorn
+    from wechat_crawler.api import app
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def start_server(port, base_url, settings, cookies, ctx):
+    """启动API服务子进程并等待端口可用"""
+    process = ctx.Process(target=_server_main, args=(port, base_url, settings, cookies), daemon=True)
+    process.start()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("API服务启动失败")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("API服务启动超时")
+
+
+async def run_load(base_url, endpoints, concurrency, duration, warmup):
+    """concurrency个客户端轮流请求各接口，预热期间的请求不计入结果
+
+    Returns:
+        tuple: ({接口: [延迟秒数]}, {接口: 错误数}, 计入结果的秒数)
+    """
+    samples = {endpoint: [] for endpoint in endpoints}
+    errors = {endpoint: 0 for endpoint in endpoints}
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client(session, index):
+        i = index
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                return
+            endpoint = endpoints[i % len(endpoints)]
+            i += 1
+            ok = False
+            try:
+                async with session.get(base_url + endpoint) as response:
+                    await response.read()
+                    ok = response.status < 500
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if now < measure_from:
+                continue
+            if ok:
+                samples[endpoint].append(time.perf_counter() - now)
+            else:
+                errors[endpoint] += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(client(session, i) for i in range(concurrency)))
+    return samples, errors, duration
+
+
+def summarize(name, latencies, errors, elapsed):
+    p50, p95, p99 = (percentile(latencies, pct) for pct in (50, 95, 99))
+    return {
+        'endpoint': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_p50_ms': round(p50 * 1000, 2) if p50 is not None else None,
+        'latency_p95_ms': round(p95 * 1000, 2) if p95 is not None else None,
+        'latency_p99_ms': round(p99 * 1000, 2) if p99 is not None else None,
+    }
+
+
+def print_table(results, baseline=None):
+    previous = {r['endpoint']: r for r in (baseline or {}).get('results', [])}
+    # 中文表头每个字占两列，宽度相应减小以与数据列对齐
+    header = f"{'接口':<22} {'请求数':>5} {'错误':>4} {'请求/秒':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}"
+    if previous:
+        header += f" {'吞吐对比':>8}"
+    print(header)
+    for r in results:
+        line = (f"{r['endpoint']:<24} {r['requests']:>8} {r['errors']:>6} {r['rps'] or 0:>9.1f} "
+                f"{r['latency_p50_ms'] or 0:>8.2f} {r['latency_p95_ms'] or 0:>8.2f} {r['latency_p99_ms'] or 0:>8.2f}")
+        old = previous.get(r['endpoint'])
+        if old and old.get('rps') and r['rps']:
+            line += f" {r['rps'] / old['rps']:>7.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API服务并发压测")
+    parser.add_argument('--url', default=None, help="压测已运行的API服务，如http://127.0.0.1:5000，默认在本机启动")
+    parser.add_argument('--endpoints', default=','.join(DEFAULT_ENDPOINTS), help="逗号分隔的GET接口路径")
+    parser.add_argument('--concurrency', type=int, default=50, help="并发客户端数")
+    parser.add_argument('--duration', type=float, default=10, help="计入结果的压测秒数")
+    parser.add_argument('--warmup', type=float, default=2, help="预热秒数，期间的请求不计入结果")
+    parser.add_argument('--cookies', type=int, default=20, help="本地启动时写入Redis的模拟cookie数量")
+    parser.add_argument('--redis-db', type=int, default=15, help="本地启动时使用的Redis库，开始前会被清空")
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE', help="本地启动时覆盖config.py中的配置，可重复")
+    parser.add_argument('--output', default=None, help="结果文件路径，默认写入benchmarks/results/")
+    parser.add_argument('--compare', default=None, help="与之前保存的结果文件对比吞吐")
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(',') if e]
+    settings = {}
+    server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        from wechat_crawler import config
+        if args.redis_db == config.REDIS_DB:
+            parser.error(f"--redis-db不能与config.py中的REDIS_DB({config.REDIS_DB})相同，测试会清空该库")
+        settings = dict({'REDIS_DB': args.redis_db}, **parse_settings(args.set))
+        port = _free_port()
+        server = start_server(port, config.BANKLAW_API_URL, settings, args.cookies,
+                              multiprocessing.get_context('spawn'))
+        base_url = f"http://127.0.0.1:{port}"
+    print(f"压测 {base_url}，{args.concurrency} 个并发客户端，{args.duration} 秒，接口: {', '.join(endpoints)}")
+    try:
+        samples, errors, elapsed = asyncio.run(
+            run_load(base_url, endpoints, args.concurrency, args.duration, args.warmup))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    results = [summarize(endpoint, samples[endpoint], errors[endpoint], elapsed) for endpoint in endpoints]
+    results.append(summarize('total', [s for endpoint in endpoints for s in samples[endpoint]],
+                             sum(errors.values()), elapsed))
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    commit, dirty = git_revision()
+    report = {
+        'benchmark': 'api',
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'settings': settings,
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"api-{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}"
+                                           f"{'-dirty' if dirty else ''}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+端到端吞吐量基准测试
+在本机启动mock_banklaw.py模拟服务，把BANKLAW_API_URL指向它，分别测量各种抓取模式：
+  detail-sync         Crawler逐条下载详情
+  detail-async        AsyncCrawler并发下载详情
+  listing-sync        monthly_crawler逐月串行抓取目录（经CrawlerScheduler取token）
+  listing-concurrent  monthly_crawler多个月份窗口并发抓取目录
+每个场景在独立的子进程和临时工作目录中运行，输出每秒文档数、单篇/单次请求延迟的p50/p95、
+CPU时间和峰值RSS，结果保存到benchmarks/results/下，可以用--compare与之前的提交对比
+
+爬虫依赖Redis：测试使用--redis-db指定的库，每个场景开始前会清空该库，因此不能与config.py中的REDIS_DB相同
+
+用法: python benchmarks/bench_crawl.py [--scenarios detail-sync,detail-async] [--latency-ms 50]
+      [--set CONFIG_KEY=值 ...] [--compare benchmarks/results/xxx.json]
+"""
+
+import argparse
+import ast
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import urllib.request
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import mock_banklaw
+
+SCENARIOS = ['detail-sync', 'detail-async', 'listing-sync', 'listing-concurrent']
+
+
+def percentile(values, pct):
+    """最近秩法百分位数，没有数据时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """本进程的峰值常驻内存（MB），不支持的平台返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def timed(func, samples):
+    """包装函数，把每次调用的耗时记入samples"""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+def timed_async(func, samples):
+    """timed的协程版本"""
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+def configure(base_url, settings):
+    """在导入爬虫模块之前改写配置，子进程中只能调用一次
+
+    包的__init__会立即导入crawler等模块，使它们按原配置取值，这里先登记一个不执行__init__的空包，
+    改写config后再按需导入各模块
+    """
+    package = types.ModuleType('wechat_crawler')
+    package.__path__ = [os.path.join(ROOT, 'wechat_crawler')]
+    sys.modules['wechat_crawler'] = package
+    from wechat_crawler import config
+    config.BANKLAW_API_URL = base_url
+    for key, value in settings.items():
+        setattr(config, key, value)
+    return config
+
+
+def write_listing_fixture(options, hierarchies):
+    """按模拟服务的数据生成api_responses目录文件，供详情场景读取"""
+    for hierarchy_id in hierarchies:
+        for year in range(options['start_year'], options['end_year'] + 1):
+            year_dir = f"api_responses/hierarchy_{hierarchy_id}_{mock_banklaw.HIERARCHIES[hierarchy_id]}/{year}"
+            os.makedirs(year_dir, exist_ok=True)
+            for month in range(1, 13):
+                rows = mock_banklaw.listing_rows(hierarchy_id, year, month, options['docs_per_month'])
+                with open(os.path.join(year_dir, f"api_response_{month}.json"), 'w', encoding='utf-8') as f:
+                    json.dump({'year': year, 'month': month, 'hierarchy_id': hierarchy_id, 'total': len(rows),
+                               'data': [{'statuteId': r['statuteId'], 'title': r['title']} for r in rows]},
+                              f, ensure_ascii=False)
+
+
+def count_listing_rows():
+    """统计抓取到api_responses中的目录条目数"""
+    total = 0
+    for root, _, files in os.walk('api_responses'):
+        for name in files:
+            if name.endswith('.json'):
+                with open(os.path.join(root, name), 'r', encoding='utf-8') as f:
+                    total += len(json.load(f).get('data') or [])
+    return total
+
+
+def measure(func, *args):
+    """执行func并返回(结果, 墙钟秒数, CPU秒数)，CPU时间包含所有线程"""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func(*args)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def run_detail(name, options, tokens, hierarchies, samples):
+    """详情下载场景，返回(成功数, 失败数, 墙钟秒数, CPU秒数)"""
+    write_listing_fixture(options, hierarchies)
+    if name == 'detail-async':
+        from wechat_crawler.async_crawler import AsyncCrawler
+        crawler = AsyncCrawler(access_token=tokens[0])
+        crawler._download_one = timed_async(crawler._download_one, samples)
+    else:
+        from wechat_crawler.crawler import Crawler
+        crawler = Crawler(access_token=tokens[0])
+        crawler.download_regulation = timed(crawler.download_regulation, samples)
+
+    def crawl():
+        success = failed = 0
+        for hierarchy_id in hierarchies:
+            for year in range(options['start_year'], options['end_year'] + 1):
+                ok, bad = crawler.crawl_by_api_responses(hierarchy_id, year)
+                success += ok
+                failed += bad
+        return success, failed
+
+    (success, failed), elapsed, cpu = measure(crawl)
+    return success, failed, elapsed, cpu
+
+
+def run_listing(name, options, tokens, hierarchies, samples):
+    """目录抓取场景，返回(目录条目数, 缺少的条目数, 墙钟秒数, CPU秒数)"""
+    from wechat_crawler import monthly_crawler
+    monthly_crawler.HIERARCHIES = {h: monthly_crawler.HIERARCHIES[h] for h in hierarchies}
+    monthly_crawler.call_api = timed(monthly_crawler.call_api, samples)
+    if name == 'listing-concurrent':
+        _, elapsed, cpu = measure(monthly_crawler.process_data_by_hierarchy_and_year_concurrent)
+    else:
+        _, elapsed, cpu = measure(monthly_crawler.process_data_by_hierarchy_and_year)
+    expected = len(hierarchies) * (options['end_year'] - options['start_year'] + 1) * 12 * options['docs_per_month']
+    rows = count_listing_rows()
+    return rows, max(0, expected - rows), elapsed, cpu
+
+
+def _scenario_main(name, base_url, options, settings, tokens, hierarchies, workdir, verbose, results):
+    """子进程入口：配置、准备Redis、运行场景并回传指标"""
+    os.chdir(workdir)
+    # 目录模式由场景决定
+    if name.startswith('listing'):
+        settings = dict(settings, LISTING_MODE='concurrent' if name == 'listing-concurrent' else 'sync')
+    config = configure(base_url, settings)
+
+    import redis
+    redis_conn = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB,
+                             password=config.REDIS_PASSWORD)
+    redis_conn.flushdb()
+    for token in tokens:
+        redis_conn.rpush('access_tokens', json.dumps({'token': token, 'user_name': 'bench'}))
+    urllib.request.urlopen(urllib.request.Request(f"{base_url}/_stats/reset", method='POST')).read()
+
+    samples = []
+    log = open('crawler.log', 'w', encoding='utf-8')
+    runner = run_listing if name.startswith('listing') else run_detail
+    rss_start = peak_rss_mb()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            docs, failed, elapsed, cpu = runner(name, options, tokens, hierarchies, samples)
+    finally:
+        log.close()
+    server = json.loads(urllib.request.urlopen(f"{base_url}/_stats").read())
+    p50 = percentile(samples, 50)
+    p95 = percentile(samples, 95)
+    results.put({
+        'scenario': name,
+        'docs': docs,
+        'failed': failed,
+        'elapsed_s': round(elapsed, 3),
+        'docs_per_sec': round(docs / elapsed, 2) if elapsed else None,
+        'latency_unit': 'call_api' if name.startswith('listing') else 'document',
+        'latency_p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+        'latency_p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        'cpu_s': round(cpu, 3),
+        'cpu_util': round(cpu / elapsed, 3) if elapsed else None,
+        'rss_start_mb': round(rss_start, 1) if rss_start is not None else None,
+        'rss_peak_mb': round(peak_rss_mb(), 1) if resource is not None else None,
+        'server': server,
+    })
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_mock(options, ctx):
+    """在子进程中启动模拟服务，返回(进程, 基础地址)"""
+    port = _free_port()
+    process = ctx.Process(target=mock_banklaw.run_server, args=('127.0.0.1', port), kwargs=options, daemon=True)
+    process.start()
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("模拟服务启动超时")
+
+
+def git_revision():
+    """当前提交及工作区是否有未提交的修改"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=ROOT, stderr=subprocess.DEVNULL).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def parse_settings(items):
+    """解析--set KEY=VALUE，值按Python字面量解析，解析失败时作为字符串"""
+    settings = {}
+    for item in items or []:
+        key, _, value = item.partition('=')
+        try:
+            settings[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[key] = value
+    return settings
+
+
+def print_table(results, baseline=None):
+    previous = {r['scenario']: r for r in (baseline or {}).get('results', [])}
+    header = f"{'场景':<20} {'文档数':>7} {'失败':>5} {'文档/秒':>9} {'p50ms':>8} {'p95ms':>8} {'CPU秒':>7} {'CPU占比':>7} {'峰值RSS':>8}"
+    if previous:
+        header += f" {'吞吐对比':>8}"
+    print(header)
+    for r in results:
+        line = (f"{r['scenario']:<20} {r['docs']:>7} {r['failed']:>5} {r['docs_per_sec'] or 0:>9.1f} "
+                f"{r['latency_p50_ms'] or 0:>8.1f} {r['latency_p95_ms'] or 0:>8.1f} {r['cpu_s']:>7.2f} "
+                f"{r['cpu_util'] or 0:>7.2f} {r['rss_peak_mb'] or 0:>7.1f}M")
+        old = previous.get(r['scenario'])
+        if old and old.get('docs_per_sec') and r['docs_per_sec']:
+            line += f" {r['docs_per_sec'] / old['docs_per_sec']:>7.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的端到端吞吐量基准测试")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"逗号分隔，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument('--hierarchies', default='1', help="参与测试的层级ID，逗号分隔")
+    parser.add_argument('--tokens', type=int, default=2, help="写入Redis的模拟token数量")
+    parser.add_argument('--redis-db', type=int, default=15, help="测试使用的Redis库，每个场景开始前会被清空")
+    parser.add_argument('--client-rpm', type=int, default=1000000,
+                        help="爬虫侧限流器的每分钟请求数，默认足够大以测量爬虫本身的吞吐")
+    parser.add_argument('--concurrency', type=int, default=None, help="async模式单token并发数")
+    parser.add_argument('--listing-workers', type=int, default=None, help="目录并发抓取线程数")
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE', help="覆盖config.py中的配置，可重复")
+    parser.add_argument('--output', default=None, help="结果文件路径，默认写入benchmarks/results/")
+    parser.add_argument('--compare', default=None, help="与之前保存的结果文件对比吞吐")
+    parser.add_argument('--verbose', action='store_true', help="显示爬虫输出，默认写入临时目录的crawler.log")
+    parser.add_argument('--keep-workdir', action='store_true', help="保留每个场景的临时工作目录")
+    mock_banklaw.add_arguments(parser)
+    args = parser.parse_args()
+
+    from wechat_crawler import config
+    if args.redis_db == config.REDIS_DB:
+        parser.error(f"--redis-db不能与config.py中的REDIS_DB({config.REDIS_DB})相同，测试会清空该库")
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"未知场景: {name}")
+    hierarchies = [int(h) for h in args.hierarchies.split(',') if h]
+    options = mock_banklaw.options_from_args(args)
+    settings = {
+        'REDIS_DB': args.redis_db,
+        'RATE_LIMIT_TOKEN_RPM': args.client_rpm,
+        'RATE_LIMIT_HOST_RPM': args.client_rpm,
+        'RATE_LIMIT_BURST': max(config.RATE_LIMIT_BURST, 100),
+        'START_YEAR_DOWNLOAD': args.start_year,
+        'END_YEAR_DOWNLOAD': args.end_year,
+        'REQUIRED_TOKEN_COUNT': 1,
+        # 吞吐测试默认不受每日请求预算限制，可用--set MAX_REQUESTS_PER_COOKIE=N测试token轮换
+        'MAX_REQUESTS_PER_COOKIE': 0,
+        # 自适应限流的上限同样放开，模拟服务开启限流（--quota）时可观察AIMD收敛到的速率
+        'AIMD_MAX_RPM': args.client_rpm,
+    }
+    if args.concurrency:
+        settings['ASYNC_CONCURRENCY_PER_TOKEN'] = args.concurrency
+    if args.listing_workers:
+        settings['LISTING_WORKERS'] = args.listing_workers
+    settings.update(parse_settings(args.set))
+    tokens = [f"bench-token-{i:02d}-{os.getpid()}" for i in range(max(1, args.tokens))]
+
+    # 每个场景使用全新的进程，峰值RSS和进程内缓存互不影响
+    ctx = multiprocessing.get_context('spawn')
+    mock_process, base_url = start_mock(options, ctx)
+    print(f"模拟服务: {base_url}，延迟 {args.latency_ms}±{args.jitter_ms}ms，每篇 {args.paragraphs} 段")
+    results = []
+    try:
+        for name in scenarios:
+            workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+            queue = ctx.Queue()
+            process = ctx.Process(target=_scenario_main, args=(
+                name, base_url, options, settings, tokens, hierarchies, workdir, args.verbose, queue))
+            process.start()
+            try:
+                result = queue.get()
+            except KeyboardInterrupt:
+                process.terminate()
+                raise
+            finally:
+                process.join()
+                if args.keep_workdir:
+                    print(f"{name} 工作目录: {workdir}")
+                else:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            results.append(result)
+            print(f"{name} 完成: {result['docs']} 篇，{result['docs_per_sec']} 篇/秒")
+    finally:
+        mock_process.terminate()
+        mock_process.join()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    commit, dirty = git_revision()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'mock': options,
+        'settings': settings,
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}"
+                                           f"{'-dirty' if dirty else ''}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+extract_article_from_json渲染性能对比
+用处理后的文章.txt中的段落构造不同规模的详情响应（段落带HTML标签、groupId乱序、含空段落），
+先确认新旧实现输出完全一致，再比较耗时
+
+用法: python benchmarks/bench_render.py [--repeat 次数]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from wechat_crawler.crawler import extract_article_from_json
+
+SAMPLE_FILE = os.path.join(ROOT, "处理后的文章.txt")
+
+
+def legacy_extract_article_from_json(json_data):
+    """改写前的实现，仅用于对比"""
+    data = json.loads(json_data) if isinstance(json_data, str) else json_data
+    title = data['data']['title']
+    publish_date = data['data']['publishDate']
+    article = f"# {title}\n\n发布时间: {publish_date}\n\n"
+    paragraphs = data['data']['paragraphs']
+    paragraphs.sort(key=lambda x: x['groupId'])
+    for paragraph in paragraphs:
+        content = re.sub(r'<[^>]+>', '', paragraph['content'])
+        if not content.strip():
+            continue
+        article += content + "\n\n"
+    return article
+
+
+def load_sample_paragraphs():
+    """从样例文章中取出标题、发布时间和正文段落"""
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        blocks = [b for b in f.read().split("\n\n") if b]
+    title = blocks[0][2:]
+    publish_date = blocks[1].split(": ", 1)[1]
+    return title, publish_date, blocks[2:]
+
+
+def build_document(title, publish_date, paragraphs, copies, seed=0):
+    """把样例段落重复copies次，构造一份详情接口响应"""
+    rng = random.Random(seed)
+    rows = []
+    group_id = 0
+    for _ in range(copies):
+        for text in paragraphs:
+            rows.append({'groupId': group_id, 'content': f'<p class="p{group_id % 3}"><span>{text}</span></p>'})
+            group_id += 1
+            if group_id % 7 == 0:
+                rows.append({'groupId': group_id, 'content': '<p><br/></p>'})
+                group_id += 1
+    rng.shuffle(rows)
+    return json.dumps({'code': 0, 'data': {'title': title, 'publishDate': publish_date, 'paragraphs': rows}},
+                      ensure_ascii=False)
+
+
+def best_of(func, body, repeat):
+    """重复执行取最短耗时，每次都从JSON文本开始，包含解析时间"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(body)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extract_article_from_json渲染性能对比")
+    parser.add_argument('--repeat', type=int, default=5, help="每种规模重复次数")
+    args = parser.parse_args()
+
+    title, publish_date, paragraphs = load_sample_paragraphs()
+    # 样例文章本身必须能原样还原
+    sample = build_document(title, publish_date, paragraphs, 1)
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        expected = f.read()
+    assert extract_article_from_json(sample) == legacy_extract_article_from_json(sample)
+    assert extract_article_from_json(sample).rstrip("\n") == expected.rstrip("\n"), "与处理后的文章.txt不一致"
+
+    print(f"{'段落数':>8} {'输出KB':>8} {'旧实现ms':>10} {'新实现ms':>10} {'加速比':>8}")
+    for copies in (1, 10, 100, 500):
+        body = build_document(title, publish_date, paragraphs, copies, seed=copies)
+        new_output = extract_article_from_json(body)
+        assert new_output == legacy_extract_article_from_json(body), f"{copies}倍规模输出不一致"
+        old_time = best_of(legacy_extract_article_from_json, body, args.repeat)
+        new_time = best_of(extract_article_from_json, body, args.repeat)
+        count = len(json.loads(body)['data']['paragraphs'])
+        print(f"{count:>8} {len(new_output.encode('utf-8')) // 1024:>8} "
+              f"{old_time * 1000:>10.2f} {new_time * 1000:>10.2f} {old_time / new_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
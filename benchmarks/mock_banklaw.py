@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+banklaw.com接口的本地模拟服务，供吞吐量基准测试使用
+实现目录接口/search/v1/statutes/search、/search/v1/casus/search和详情接口/v1/statutes/{id}，
+响应结构与真实接口一致，可配置响应延迟、正文大小、每页条数上限和按token的限流行为
+
+模拟数据按(层级, 年份, 月份)确定性生成，statuteId中编码了层级、年月和序号，
+详情接口的段落取自处理后的文章.txt，groupId打乱顺序并带HTML标签
+
+另有两个辅助接口：GET /_stats 返回请求计数，POST /_stats/reset 清零计数和限流窗口
+
+用法: python benchmarks/mock_banklaw.py [--port 端口] [--latency-ms 毫秒] [--paragraphs 段落数]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from functools import lru_cache
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILE = os.path.join(ROOT, "处理后的文章.txt")
+
+HIERARCHIES = {
+    1: "法律法规",
+    2: "规章制度",
+    3: "行业动态"
+}
+
+DEFAULT_OPTIONS = {
+    'latency_ms': 50.0,       # 平均响应延迟（毫秒）
+    'jitter_ms': 10.0,        # 延迟的随机波动范围（毫秒）
+    'paragraphs': 60,         # 每篇详情的段落数，决定响应大小
+    'docs_per_month': 10,     # 每个层级每月的法规数
+    'casus_total': 200,       # 处罚案例总数
+    'start_year': 2023,       # 模拟数据的起止年份
+    'end_year': 2023,
+    'max_page_size': 50,      # 目录接口支持的最大每页条数，超过时像真实接口一样重置到第一页
+    'chunked': False,         # 详情响应使用分块传输（不带Content-Length），用于测试流式解析
+    'quota': 0,               # 每个token在quota_window秒内允许的请求数，0为不限流
+    'quota_window': 60.0,
+    'limit_mode': '429',      # 超出配额时的行为：429返回HTTP 429，message返回code非0的“超过限制”
+}
+
+LIMIT_MESSAGE = "您今日请求数已超过限制"
+
+
+def load_sample_paragraphs():
+    """样例文章中的正文段落"""
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        blocks = [b for b in f.read().split("\n\n") if b.strip()]
+    return blocks[2:]
+
+
+def statute_id(hierarchy_id, year, month, index):
+    return f"mock{hierarchy_id}{year}{month:02d}{index:05d}"
+
+
+def parse_statute_id(value):
+    """解析模拟的statuteId，格式不符时返回None"""
+    if not value.startswith("mock") or len(value) != 16 or not value[4:].isdigit():
+        return None
+    return int(value[4]), int(value[5:9]), int(value[9:11]), int(value[11:])
+
+
+def statute_row(hierarchy_id, year, month, index):
+    """目录接口返回的一行"""
+    return {
+        'statuteId': statute_id(hierarchy_id, year, month, index),
+        'title': f"模拟{HIERARCHIES[hierarchy_id]}{year}年{month}月第{index + 1}号",
+        # 发布日避开每月1日，按月切分的查询不会在相邻月份重复出现
+        'publishDate': f"{year}-{month:02d}-{2 + index % 27:02d}",
+    }
+
+
+def listing_rows(hierarchy_id, year, month, docs_per_month):
+    """某个层级某月的全部目录行，按发布日期从新到旧排列"""
+    rows = [statute_row(hierarchy_id, year, month, i) for i in range(docs_per_month)]
+    rows.sort(key=lambda row: row['publishDate'], reverse=True)
+    return rows
+
+
+class MockBanklaw:
+    """模拟服务的状态：配置、请求计数和每个token的限流窗口"""
+
+    def __init__(self, **options):
+        self.options = dict(DEFAULT_OPTIONS)
+        self.options.update({k: v for k, v in options.items() if v is not None})
+        self.paragraphs = load_sample_paragraphs()
+        self.stats = {}
+        self.windows = {}
+
+    def reset(self):
+        self.stats = {}
+        self.windows = {}
+
+    def _count(self, name):
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    async def _delay(self):
+        latency = self.options['latency_ms']
+        jitter = self.options['jitter_ms']
+        delay = max(0.0, random.uniform(latency - jitter, latency + jitter))
+        if delay:
+            await asyncio.sleep(delay / 1000.0)
+
+    def _over_quota(self, request):
+        """按Access-Token计数，超出配额时返回限流响应，否则返回None"""
+        quota = self.options['quota']
+        if not quota:
+            return None
+        token = request.headers.get('Access-Token', '')
+        now = time.time()
+        start, count = self.windows.get(token, (now, 0))
+        if now - start >= self.options['quota_window']:
+            start, count = now, 0
+        count += 1
+        self.windows[token] = (start, count)
+        if count <= quota:
+            return None
+        self._count('limited')
+        if self.options['limit_mode'] == 'message':
+            return web.json_response({'code': 1, 'message': LIMIT_MESSAGE, 'data': None})
+        return web.json_response({'code': 429, 'message': LIMIT_MESSAGE}, status=429)
+
+    def _page(self, rows, body):
+        """按pageIndex和pageSize分页，超过每页上限时与真实接口一样重置到第一页"""
+        page_index = int(body.get('pageIndex') or 0)
+        page_size = int(body.get('pageSize') or 10)
+        if page_size > self.options['max_page_size']:
+            page_index = 0
+            page_size = self.options['max_page_size']
+        start = page_index * page_size
+        return {
+            'code': 0,
+            'message': '',
+            'data': {
+                'pageIndex': page_index,
+                'pageSize': page_size,
+                'total': len(rows),
+                'rows': rows[start:start + page_size],
+            }
+        }
+
+    def _months(self, begin, end):
+        """begin~end之间（含）的模拟年月，日期缺失时取全部年份"""
+        begin = (begin or '0000-00')[:7]
+        end = (end or '9999-99')[:7]
+        for year in range(self.options['end_year'], self.options['start_year'] - 1, -1):
+            for month in range(12, 0, -1):
+                if begin <= f"{year}-{month:02d}" <= end:
+                    yield year, month
+
+    async def statutes_search(self, request):
+        self._count('statutes_search')
+        limited = self._over_quota(request)
+        if limited is not None:
+            return limited
+        body = await request.json()
+        await self._delay()
+        hierarchy_id = int(body.get('hierarchyAliasId') or 1)
+        begin = body.get('beginPublishDate')
+        end = body.get('endPublishDate')
+        rows = []
+        for year, month in self._months(begin, end):
+            for row in listing_rows(hierarchy_id, year, month, self.options['docs_per_month']):
+                # endPublishDate按开区间处理，与按月切分的查询方式一致
+                if (not begin or row['publishDate'] >= begin[:10]) and (not end or row['publishDate'] < end[:10]):
+                    rows.append(row)
+        return web.json_response(self._page(rows, body))
+
+    async def casus_search(self, request):
+        self._count('casus_search')
+        limited = self._over_quota(request)
+        if limited is not None:
+            return limited
+        body = await request.json()
+        await self._delay()
+        rows = [{
+            'casusId': f"casus{i:06d}",
+            'title': f"模拟处罚案例第{i + 1}号",
+            'publishDate': f"{self.options['end_year']}-12-{28 - i % 27:02d}",
+        } for i in range(self.options['casus_total'])]
+        return web.json_response(self._page(rows, body))
+
+    @lru_cache(maxsize=4096)
+    def _detail_body(self, value):
+        """生成并缓存一篇详情的响应字节"""
+        parsed = parse_statute_id(value)
+        if parsed is None:
+            return None
+        hierarchy_id, year, month, index = parsed
+        row = statute_row(hierarchy_id, year, month, index)
+        rng = random.Random(value)
+        paragraphs = [{
+            'groupId': group_id,
+            'content': f'<p class="p{group_id % 3}"><span>{rng.choice(self.paragraphs)}</span></p>',
+            'sentences': [],
+        } for group_id in range(self.options['paragraphs'])]
+        rng.shuffle(paragraphs)
+        data = {
+            'statuteId': value,
+            'title': row['title'],
+            'publishDate': row['publishDate'],
+            'effectiveDate': row['publishDate'],
+            'documentNo': f"模拟〔{year}〕{index + 1}号",
+            'publishingDepartment': "中国人民银行",
+            'paragraphs': paragraphs,
+        }
+        return json.dumps({'code': 0, 'message': '', 'data': data}, ensure_ascii=False).encode('utf-8')
+
+    async def statute_detail(self, request):
+        self._count('statute_detail')
+        limited = self._over_quota(request)
+        if limited is not None:
+            return limited
+        body = self._detail_body(request.match_info['statute_id'])
+        await self._delay()
+        if body is None:
+            return web.json_response({'code': 404, 'message': '法规不存在'}, status=404)
+        self.stats['detail_bytes'] = self.stats.get('detail_bytes', 0) + len(body)
+        if not self.options['chunked']:
+            return web.Response(body=body, content_type='application/json')
+        response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for i in range(0, len(body), 64 * 1024):
+            await response.write(body[i:i + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def reset_stats(self, request):
+        self.reset()
+        return web.json_response({'ok': True})
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post('/search/v1/statutes/search', self.statutes_search)
+        app.router.add_post('/search/v1/casus/search', self.casus_search)
+        app.router.add_get('/v1/statutes/{statute_id}', self.statute_detail)
+        app.router.add_get('/_stats', self.get_stats)
+        app.router.add_post('/_stats/reset', self.reset_stats)
+        return app
+
+
+def run_server(host='127.0.0.1', port=8765, **options):
+    """启动模拟服务（阻塞）"""
+    web.run_app(MockBanklaw(**options).build_app(), host=host, port=port, print=None, access_log=None)
+
+
+def add_arguments(parser):
+    """把模拟服务的配置项加入命令行参数，bench_crawl.py共用"""
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_OPTIONS['latency_ms'], help="平均响应延迟（毫秒）")
+    parser.add_argument('--jitter-ms', type=float, default=DEFAULT_OPTIONS['jitter_ms'], help="延迟的随机波动范围（毫秒）")
+    parser.add_argument('--paragraphs', type=int, default=DEFAULT_OPTIONS['paragraphs'], help="每篇详情的段落数")
+    parser.add_argument('--docs-per-month', type=int, default=DEFAULT_OPTIONS['docs_per_month'], help="每个层级每月的法规数")
+    parser.add_argument('--casus-total', type=int, default=DEFAULT_OPTIONS['casus_total'], help="处罚案例总数")
+    parser.add_argument('--start-year', type=int, default=DEFAULT_OPTIONS['start_year'], help="模拟数据开始年份")
+    parser.add_argument('--end-year', type=int, default=DEFAULT_OPTIONS['end_year'], help="模拟数据结束年份")
+    parser.add_argument('--max-page-size', type=int, default=DEFAULT_OPTIONS['max_page_size'], help="目录接口每页条数上限")
+    parser.add_argument('--chunked', action='store_true', help="详情响应使用分块传输")
+    parser.add_argument('--quota', type=int, default=DEFAULT_OPTIONS['quota'], help="每个token在窗口内允许的请求数，0为不限流")
+    parser.add_argument('--quota-window', type=float, default=DEFAULT_OPTIONS['quota_window'], help="限流窗口（秒）")
+    parser.add_argument('--limit-mode', choices=['429', 'message'], default=DEFAULT_OPTIONS['limit_mode'],
+                        help="超出配额时返回HTTP 429或code非0的“超过限制”消息")
+
+
+def options_from_args(args):
+    """从命令行参数中取出模拟服务的配置项"""
+    return {key: getattr(args, key) for key in DEFAULT_OPTIONS}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="banklaw.com接口的本地模拟服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口")
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"模拟服务已启动: http://{args.host}:{args.port}")
+    run_server(args.host, args.port, **options_from_args(args))
@@ -11,7 +11,8 @@ import time
 import json
 from wechat_crawler.main import main, print_help
 from wechat_crawler.monthly_crawler import process_data_by_hierarchy_and_year
-from wechat_crawler.config import IF_CHERK
+from wechat_crawler.config import IF_CHERK, METRICS_PORT
+from wechat_crawler.metrics import start_metrics_server
 
 def check_monthly_data():
     """检查monthly_crawler的数据是否已生成"""
@@ -71,8 +72,12 @@ if __name__ == "__main__":
     print("2 - 爬取规章制度")
     print("3 - 爬取行业动态")
     print("使用方法：python run.py [方向ID]")
+    print("多进程模式：python run.py --supervisor（按层级和年份分片并行爬取）")
     print("=" * 60)
     
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    
     try:
         main()
     except KeyboardInterrupt:
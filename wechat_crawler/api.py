@@ -7,30 +7,56 @@
 """
 
 # 导入所需模块
-from fastapi import FastAPI, HTTPException, Response, BackgroundTasks, status  # FastAPI相关
+from fastapi import FastAPI, HTTPException, Response, BackgroundTasks, Query, status  # FastAPI相关
 from fastapi.responses import FileResponse, JSONResponse  # 响应类型
 from pydantic import BaseModel  # 数据验证
+from contextlib import asynccontextmanager  # 应用生命周期
+import asyncio  # 异步等待
 import redis  # Redis数据库操作
+import redis.asyncio as aioredis  # 异步Redis客户端，接口中的Redis操作不阻塞事件循环
 import threading  # 多线程支持
 import time  # 时间控制
 import os  # 文件路径操作
-from typing import List, Optional  # 类型提示
+from typing import Dict, List, Optional  # 类型提示
 from .wechat_login import WechatLogin  # 微信登录模块
+from .search_index import get_search_index, index_text_tree, index_archive, SEARCH_FIELDS  # 全文检索
+from .metrics import register_redis_collector, render_latest  # 监控指标
+from .failure_store import get_failure_store  # 失败重试队列和死信
 from .config import (  # 配置文件
     REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
-    QR_CODE_PATH
+    QR_CODE_PATH, API_REDIS_MAX_CONNECTIONS, API_REDIS_POOL_TIMEOUT, QR_CODE_WAIT_TIMEOUT
 )
 
-# 创建FastAPI应用实例
-app = FastAPI(title="微信登录爬虫API", description="提供二维码获取和cookie管理的HTTP接口")
-
-# 初始化Redis连接
-redis_conn = redis.Redis(
+# 所有请求共用的异步Redis连接池，连接在首次使用时建立；
+# 连接数达到上限时请求排队等待空闲连接，而不是直接报Too many connections
+redis_pool = aioredis.BlockingConnectionPool(
     host=REDIS_HOST,  # Redis主机地址
     port=REDIS_PORT,  # Redis端口
     db=REDIS_DB,  # Redis数据库编号
-    password=REDIS_PASSWORD  # Redis密码
+    password=REDIS_PASSWORD,  # Redis密码
+    max_connections=API_REDIS_MAX_CONNECTIONS,  # 最大连接数
+    timeout=API_REDIS_POOL_TIMEOUT  # 等待空闲连接的最长时间（秒）
 )
+redis_conn = aioredis.Redis(connection_pool=redis_pool)
+
+@asynccontextmanager
+async def lifespan(app):
+    """服务退出时关闭连接池"""
+    yield
+    await redis_conn.aclose()
+    await redis_pool.disconnect()
+
+# 创建FastAPI应用实例
+app = FastAPI(title="微信登录爬虫API", description="提供二维码获取和cookie管理的HTTP接口", lifespan=lifespan)
+
+# 抓取指标时顺带读取任务队列深度、token池大小等共享状态；
+# prometheus_client同步调用采集器，/metrics在线程池中执行，因此这里使用同步连接
+register_redis_collector(redis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD
+))
 
 # 全局变量，用于控制登录线程
 login_thread = None  # 登录线程实例
@@ -62,6 +88,61 @@ class TokenRequest(BaseModel):
     """设置token请求模型"""
     token: str  # 要设置的access_token
 
+class SearchHit(BaseModel):
+    """检索结果条目"""
+    statute_id: Optional[str]  # 法规ID，仅从文本文件建立的索引没有ID
+    title: Optional[str]  # 标题
+    document_no: Optional[str]  # 发文字号
+    publish_date: Optional[str]  # 发布日期
+    hierarchy_id: Optional[int]  # 层级ID
+    hierarchy_name: Optional[str]  # 层级名称
+    department: Optional[str]  # 发布机构
+    path: Optional[str]  # 文本文件路径
+    snippet: str  # 正文摘要
+
+class FacetCount(BaseModel):
+    """分面统计"""
+    value: str  # 取值
+    count: int  # 命中数量
+
+class SearchResponse(BaseModel):
+    """检索响应模型"""
+    total: int  # 命中总数
+    page: int  # 当前页码
+    page_size: int  # 每页条数
+    results: List[SearchHit]  # 当前页结果
+    facets: Dict[str, List[FacetCount]]  # 按层级、年份、发布机构的分面统计
+
+class SearchDocument(BaseModel):
+    """法规全文响应模型"""
+    statute_id: str  # 法规ID
+    title: Optional[str]  # 标题
+    document_no: Optional[str]  # 发文字号
+    publish_date: Optional[str]  # 发布日期
+    hierarchy_id: Optional[int]  # 层级ID
+    hierarchy_name: Optional[str]  # 层级名称
+    department: Optional[str]  # 发布机构
+    path: Optional[str]  # 文本文件路径
+    body: str  # 全文
+
+class FailureEntry(BaseModel):
+    """失败条目"""
+    statuteId: str  # 法规ID
+    title: Optional[str]  # 标题
+    hierarchy_id: Optional[int]  # 层级ID
+    year: Optional[int]  # 年份
+    attempts: int  # 已计入的失败次数
+    error_class: str  # 错误类别，如network、http_500、parse
+    error: str  # 最近一次的错误信息
+    first_failed_at: float  # 首次失败时间戳
+    last_failed_at: float  # 最近一次失败时间戳
+    next_retry_at: Optional[float]  # 下次重试时间戳，死信没有
+
+class FailureListResponse(BaseModel):
+    """失败条目列表响应模型"""
+    count: int  # 条目数量
+    items: List[FailureEntry]  # 条目列表
+
 def login_worker():
     """微信登录工作线程"""
     global login_in_progress
@@ -80,19 +161,38 @@ def login_worker():
         if 'login' in locals():
             login.close()  # 关闭浏览器
 
-def start_login_process(background_tasks: BackgroundTasks):
-    """启动登录进程"""
+def start_login_process():
+    """启动登录进程
+
+    Returns:
+        bool: 是否新启动了登录线程，已有登录在进行中时返回False
+    """
     global login_thread, login_in_progress
     
-    if not login_in_progress:  # 如果当前没有登录进程
-        login_in_progress = True  # 标记登录进行中
-        background_tasks.add_task(login_worker)  # 添加登录任务到后台任务
-        time.sleep(2)  # 等待二维码生成
+    if login_in_progress:  # 已有登录进程
+        return False
+    login_in_progress = True  # 标记登录进行中
+    # 后台任务要等响应发出后才执行，这里直接启动线程，使二维码在本次请求等待期间生成
+    login_thread = threading.Thread(target=login_worker, daemon=True)
+    login_thread.start()
+    return True
+
+def qrcode_generated_since(timestamp):
+    """二维码文件是否在指定时间之后生成"""
+    try:
+        return os.path.getmtime(QR_CODE_PATH) >= timestamp
+    except OSError:
+        return False
 
 @app.get("/api/qrcode", response_class=FileResponse)
-async def get_qrcode(background_tasks: BackgroundTasks):
+async def get_qrcode():
     """获取登录二维码"""
-    start_login_process(background_tasks)  # 启动登录进程
+    started_at = time.time()
+    if start_login_process():  # 启动登录进程
+        # 异步等待新二维码生成，期间事件循环继续处理其他请求
+        while (login_in_progress and not qrcode_generated_since(started_at)
+               and time.time() - started_at < QR_CODE_WAIT_TIMEOUT):
+            await asyncio.sleep(0.2)
     
     if os.path.exists(QR_CODE_PATH):  # 如果二维码文件存在
         return FileResponse(QR_CODE_PATH, media_type="image/png")  # 返回二维码图片
@@ -102,7 +202,7 @@ async def get_qrcode(background_tasks: BackgroundTasks):
 @app.get("/api/cookies", response_model=CookieResponse)
 async def get_cookies():
     """获取所有可用的cookie"""
-    cookies = redis_conn.lrange('wechat_cookies', 0, -1)  # 从Redis获取所有cookies
+    cookies = await redis_conn.lrange('wechat_cookies', 0, -1)  # 从Redis获取所有cookies
     cookie_list = [cookie.decode('utf-8') for cookie in cookies]  # 将bytes转换为字符串
     return {"cookies": cookie_list, "count": len(cookie_list)}  # 返回cookies列表和数量
 
@@ -113,7 +213,7 @@ async def delete_cookie(cookie_data: CookieDelete):
     if not cookie:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="缺少cookie参数")
     
-    count = redis_conn.lrem('wechat_cookies', 0, cookie)  # 从Redis删除指定cookie
+    count = await redis_conn.lrem('wechat_cookies', 0, cookie)  # 从Redis删除指定cookie
     if count > 0:
         return {"success": True, "message": f"成功删除 {count} 个cookie"}
     else:
@@ -122,13 +222,16 @@ async def delete_cookie(cookie_data: CookieDelete):
 @app.get("/api/status", response_model=StatusResponse)
 async def get_status():
     """获取当前状态"""
-    cookie_count = redis_conn.llen('wechat_cookies')  # 获取当前cookie数量
-    access_token = redis_conn.get('access_token')  # 获取access_token
+    # 一次往返读取cookie数量和access_token是否存在
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        pipe.llen('wechat_cookies')
+        pipe.exists('access_token')
+        cookie_count, access_token_exists = await pipe.execute()
     return {
         "login_in_progress": login_in_progress,  # 登录状态
         "cookie_count": cookie_count,  # cookie数量
         "qrcode_available": os.path.exists(QR_CODE_PATH),  # 二维码可用性
-        "access_token_available": access_token is not None  # access_token可用性
+        "access_token_available": bool(access_token_exists)  # access_token可用性
     }
 
 @app.post("/api/token", response_model=SuccessResponse)
@@ -138,17 +241,15 @@ async def set_token(token_data: TokenRequest):
     if not token:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="缺少token参数")
     
-    # 存储token到Redis
-    redis_conn.set('access_token', token)
-    # 设置过期时间，假设token有效期为2小时
-    redis_conn.expire('access_token', 7200)
+    # 存储token到Redis，假设token有效期为2小时
+    await redis_conn.set('access_token', token, ex=7200)
     
     return {"success": True, "message": "成功设置access_token"}
 
 @app.get("/api/token", response_model=SuccessResponse)
 async def get_token():
     """获取当前的access_token"""
-    token = redis_conn.get('access_token')
+    token = await redis_conn.get('access_token')
     if not token:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到access_token")
     
@@ -157,12 +258,86 @@ async def get_token():
 @app.delete("/api/token", response_model=SuccessResponse)
 async def delete_token():
     """删除当前的access_token"""
-    if not redis_conn.exists('access_token'):
+    if not await redis_conn.delete('access_token'):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到access_token")
     
-    redis_conn.delete('access_token')
     return {"success": True, "message": "成功删除access_token"}
 
+# 检索、失败队列和指标接口使用同步函数，由FastAPI放到线程池中执行SQLite和同步Redis操作，不阻塞事件循环
+@app.get("/api/search", response_model=SearchResponse)
+def search_regulations(
+    q: str = "",
+    field: Optional[str] = None,
+    hierarchy_id: Optional[int] = None,
+    year: Optional[int] = None,
+    department: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    """全文检索已下载的法规，多个词用空格分隔；field可选title、document_no、department、body"""
+    if field and field not in SEARCH_FIELDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"不支持的检索字段: {field}")
+    return get_search_index().search(q, field, hierarchy_id, year, department, page, page_size)
+
+@app.get("/api/search/documents/{statute_id}", response_model=SearchDocument)
+def get_search_document(statute_id: str):
+    """按法规ID获取全文"""
+    document = get_search_index().get(statute_id)
+    if document is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到该法规")
+    return document
+
+@app.get("/api/search/stats")
+def get_search_stats():
+    """获取检索索引状态"""
+    return get_search_index().stats()
+
+@app.post("/api/search/reindex", response_model=SuccessResponse)
+async def reindex_regulations(background_tasks: BackgroundTasks, archive: bool = False):
+    """在后台增量索引已下载的文本文件，archive为true时先从原始响应归档建立索引"""
+    def reindex():
+        search_index = get_search_index()
+        if archive:
+            index_archive(search_index)
+        index_text_tree(search_index)
+    background_tasks.add_task(reindex)
+    return {"success": True, "message": "已开始增量建立索引"}
+
+@app.get("/api/failures", response_model=FailureListResponse)
+def get_failures():
+    """获取等待重试的失败条目，按下次重试时间排列"""
+    items = get_failure_store().pending()
+    return {"count": len(items), "items": items}
+
+@app.get("/api/failures/dead", response_model=FailureListResponse)
+def get_dead_letters():
+    """获取已达到最大尝试次数、不再自动重试的死信"""
+    items = get_failure_store().dead_letters()
+    return {"count": len(items), "items": items}
+
+@app.post("/api/failures/dead/{statute_id}/requeue", response_model=SuccessResponse)
+def requeue_dead_letter(statute_id: str):
+    """把死信放回重试队列，尝试次数清零，下一轮抓取时重试"""
+    if not get_failure_store().requeue(statute_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到该死信")
+    return {"success": True, "message": f"已重新加入重试队列: {statute_id}"}
+
+@app.delete("/api/failures/dead/{statute_id}", response_model=SuccessResponse)
+def delete_dead_letter(statute_id: str):
+    """删除一条死信"""
+    if not get_failure_store().delete_dead(statute_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到该死信")
+    return {"success": True, "message": f"已删除死信: {statute_id}"}
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus指标"""
+    latest = render_latest()
+    if latest is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="未安装prometheus_client")
+    body, content_type = latest
+    return Response(content=body, media_type=content_type)
+
 def run_api(host='0.0.0.0', port=5000, reload=False):
     """运行API服务器"""
     import uvicorn
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+法规详情原始响应归档
+把/v1/statutes/{id}返回的原始JSON字节逐条压缩后追加到滚动分片文件中，
+每个分片配一个偏移索引文件，重新渲染或修复解析问题时直接读取归档，无需再请求接口
+
+分片文件：{ARCHIVE_DIR}/statutes-{主机名}-{进程号}-{序号}.zst
+索引文件：同名加.idx，每行一条JSON记录 {id, shard, offset, length, hierarchy_id, year, title, fetched_at}
+每条记录是独立的压缩帧，可以按偏移单独解压
+"""
+
+import glob
+import gzip
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .config import (
+    RAW_ARCHIVE_ENABLED, ARCHIVE_DIR,
+    ARCHIVE_SHARD_MAX_BYTES, ARCHIVE_ZSTD_LEVEL
+)
+
+
+def _compress(body, ext, level):
+    if ext == '.zst':
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return gzip.compress(body)
+
+
+def _compressobj(ext, level):
+    """流式压缩器，输出与_compress相同格式的单个压缩帧"""
+    if ext == '.zst':
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(9, zlib.DEFLATED, 31)
+
+
+def decompress_frame(frame, ext):
+    """按分片扩展名解压一条记录"""
+    if ext == '.zst':
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+
+class RawArchive:
+    """只追加的原始响应归档，写入线程安全"""
+
+    def __init__(self, archive_dir=None, kind='statutes', shard_max_bytes=None, level=None):
+        """初始化归档
+
+        Args:
+            archive_dir: 归档目录，默认取ARCHIVE_DIR
+            kind: 归档类型，作为分片文件名前缀
+            shard_max_bytes: 单个分片的最大字节数，超过后滚动到新分片
+            level: zstd压缩级别
+        """
+        self.archive_dir = archive_dir or ARCHIVE_DIR
+        self.shard_max_bytes = shard_max_bytes or ARCHIVE_SHARD_MAX_BYTES
+        self.level = level or ARCHIVE_ZSTD_LEVEL
+        # 未安装zstandard时退回标准库gzip，读取时按扩展名识别
+        self.ext = '.zst' if zstandard is not None else '.gz'
+        if zstandard is None:
+            print("未安装zstandard，原始响应归档改用gzip压缩")
+        # 每个进程写自己的分片，多进程、多机器共用一个目录也不会互相覆盖
+        self.prefix = f"{kind}-{socket.gethostname()}-{os.getpid()}"
+        self._lock = threading.Lock()
+        self._shard = None
+        self._index = None
+        self._offset = 0
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+    def _open_next_shard(self):
+        """关闭当前分片，打开下一个未使用的序号"""
+        self.close()
+        existing = glob.glob(os.path.join(self.archive_dir, f"{self.prefix}-*{self.ext}"))
+        seq = len(existing)
+        while True:
+            path = os.path.join(self.archive_dir, f"{self.prefix}-{seq:05d}{self.ext}")
+            if not os.path.exists(path):
+                break
+            seq += 1
+        self._shard = open(path, 'ab')
+        self._index = open(path + '.idx', 'a', encoding='utf-8')
+        self._offset = 0
+
+    def append(self, doc_id, body, hierarchy_id=None, year=None, title=None):
+        """追加一条原始响应
+
+        Args:
+            doc_id: 文档ID（statuteId）
+            body: 接口返回的原始字节，不做解析和重新序列化
+
+        Returns:
+            dict: 索引记录
+        """
+        return self.append_frame(doc_id, _compress(body, self.ext, self.level), hierarchy_id, year, title)
+
+    def stream_writer(self):
+        """边下载边压缩一条响应，下载完成后调用commit写入归档"""
+        return FrameWriter(self)
+
+    def append_frame(self, doc_id, frame, hierarchy_id=None, year=None, title=None):
+        """追加一个已压缩的帧，返回索引记录"""
+        with self._lock:
+            if self._shard is None or self._offset + len(frame) > self.shard_max_bytes:
+                self._open_next_shard()
+            record = {
+                'id': doc_id,
+                'shard': os.path.basename(self._shard.name),
+                'offset': self._offset,
+                'length': len(frame),
+                'hierarchy_id': hierarchy_id,
+                'year': year,
+                'title': title,
+                'fetched_at': int(time.time())
+            }
+            self._shard.write(frame)
+            self._shard.flush()
+            # 先写数据再写索引，进程中断时最多丢失一条未登记的数据
+            self._index.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._index.flush()
+            self._offset += len(frame)
+        return record
+
+    def close(self):
+        if self._shard is not None:
+            self._shard.close()
+            self._index.close()
+            self._shard = None
+            self._index = None
+
+
+class FrameWriter:
+    """流式写入单条响应：只在内存中保留压缩后的字节"""
+
+    def __init__(self, archive):
+        self._archive = archive
+        self._compressor = _compressobj(archive.ext, archive.level)
+        self._parts = []
+
+    def write(self, chunk):
+        data = self._compressor.compress(chunk)
+        if data:
+            self._parts.append(data)
+
+    def commit(self, doc_id, hierarchy_id=None, year=None, title=None):
+        self._parts.append(self._compressor.flush())
+        frame = b''.join(self._parts)
+        self._parts = []
+        return self._archive.append_frame(doc_id, frame, hierarchy_id, year, title)
+
+
+def iter_index(archive_dir=None, kind='statutes'):
+    """按分片依次读取索引记录，写到一半的最后一行会被忽略
+
+    Yields:
+        dict: 索引记录，shard为分片文件名
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    for index_path in sorted(glob.glob(os.path.join(archive_dir, f"{kind}-*.idx"))):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def latest_records(archive_dir=None, kind='statutes'):
+    """每个ID最新一次归档的索引记录 {id: 记录}，按fetched_at比较，相同时取索引中靠后的"""
+    latest = {}
+    for record in iter_index(archive_dir, kind):
+        previous = latest.get(record['id'])
+        if previous is None or record.get('fetched_at', 0) >= previous.get('fetched_at', 0):
+            latest[record['id']] = record
+    return latest
+
+
+def iter_index_from(offsets, archive_dir=None, kind='statutes'):
+    """从上次读到的位置继续读取索引，用于增量处理
+
+    Args:
+        offsets: {索引文件名: 已处理的字节数}，不在其中的索引文件从头读取
+
+    Yields:
+        tuple: (索引文件名, 该行起始字节, 该行结束字节, 索引记录)，只返回以换行结尾的完整行
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    for index_path in sorted(glob.glob(os.path.join(archive_dir, f"{kind}-*.idx"))):
+        name = os.path.basename(index_path)
+        with open(index_path, 'rb') as f:
+            position = offsets.get(name, 0)
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                start, position = position, position + len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield name, start, position, record
+
+
+def read_record(record, archive_dir=None):
+    """按索引记录读取并解压一条原始响应，返回原始字节"""
+    path = os.path.join(archive_dir or ARCHIVE_DIR, record['shard'])
+    with open(path, 'rb') as f:
+        f.seek(record['offset'])
+        frame = f.read(record['length'])
+    return decompress_frame(frame, os.path.splitext(path)[1])
+
+
+def iter_records(archive_dir=None, kind='statutes'):
+    """顺序读取归档中的全部原始响应，同一分片只打开一次
+
+    Yields:
+        tuple: (索引记录, 原始字节)
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    current_path = None
+    f = None
+    try:
+        for record in iter_index(archive_dir, kind):
+            path = os.path.join(archive_dir, record['shard'])
+            if path != current_path:
+                if f is not None:
+                    f.close()
+                f = open(path, 'rb')
+                current_path = path
+            f.seek(record['offset'])
+            yield record, decompress_frame(f.read(record['length']), os.path.splitext(path)[1])
+    finally:
+        if f is not None:
+            f.close()
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_raw_archive():
+    """获取进程内共享的原始响应归档，未开启RAW_ARCHIVE_ENABLED时返回None"""
+    global _archive
+    if not RAW_ARCHIVE_ENABLED:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = RawArchive()
+        return _archive
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基于asyncio的法规详情并发下载器
+与Crawler读取相同的api_responses目录文件、写入相同的保存路径，
+只是把逐条阻塞下载换成单token内有上限的并发下载
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from .crawler import (
+    Crawler, HIERARCHIES, statute_detail_url, DOWNLOAD_OK, DOWNLOAD_CLAIMED, DOWNLOAD_RETRY, DOWNLOAD_DEAD, DOWNLOAD_FAILED,
+    DOWNLOAD_SETTLED
+)
+from .rate_limiter import observe_response, observe_error
+from .failure_store import DownloadHTTPError, ThrottledError
+from .token_health import OUTCOME_THROTTLED
+from .config import (
+    ASYNC_CONCURRENCY_PER_TOKEN, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, STREAM_CHUNK_SIZE,
+    THROTTLE_MAX_RETRIES
+)
+from .stream_render import ArticleStreamWriter, AsyncChunkReader, stream_to_writer_async
+from . import metrics
+from . import timing
+
+
+class AsyncCrawler(Crawler):
+    """并发版爬虫，crawl_by_api_responses的返回值与Crawler保持一致"""
+
+    def __init__(self, cookie=None, access_token=None, concurrency=None):
+        """初始化并发爬虫实例
+
+        Args:
+            concurrency: 单个token同时在途的请求数，默认取ASYNC_CONCURRENCY_PER_TOKEN
+        """
+        super().__init__(cookie=cookie, access_token=access_token)
+        self.concurrency = concurrency or ASYNC_CONCURRENCY_PER_TOKEN
+        # aiohttp不支持zstd/br解码，这里只声明gzip和deflate
+        self.async_headers = dict(self.headers)
+        self.async_headers["Accept-Encoding"] = "gzip, deflate"
+        print(f"并发下载模式，单token并发数: {self.concurrency}")
+
+    async def _download_one(self, session, semaphore, regulation, hierarchy_id, year):
+        """并发下载单个法规，返回值与Crawler.download_regulation一致"""
+        statute_id = regulation.get('statuteId') or regulation.get('id')
+        title = regulation.get('title')
+        hierarchy = metrics.hierarchy_label(hierarchy_id)
+        if not statute_id:
+            print(f"下载法规失败: 未找到法规ID ({title})")
+            metrics.DOCUMENTS.labels(hierarchy, 'failed').inc()
+            return DOWNLOAD_DEAD
+
+        loop = asyncio.get_event_loop()
+        async with semaphore:
+            with timing.span('detail.total'):
+                # 取得并发名额后再占用，排在月末的条目不会在等待期间占用过期
+                # 先查去重索引，已下载或其他进程正在下载时不发请求
+                with timing.span('detail.dedup'):
+                    result = await loop.run_in_executor(None, self._claim, statute_id, title, hierarchy)
+                if result is not None:
+                    return result
+                # 从取得并发名额开始计时，与同步模式的单篇耗时可比
+                started = time.perf_counter()
+                try:
+                    with timing.span('detail.dedup'):
+                        safe_title = await loop.run_in_executor(
+                            None, self._resolve_path, statute_id, title, hierarchy_id, year)
+                    if safe_title is None:
+                        print(f"文件已存在，跳过: {title}")
+                        metrics.DOCUMENTS.labels(hierarchy, 'skipped').inc()
+                        return DOWNLOAD_OK
+                    print(f"下载法规: {title} (ID: {statute_id})")
+                    # 被限流时限流器已降速或暂停该token，稍后重试本条
+                    for attempt in range(THROTTLE_MAX_RETRIES + 1):
+                        try:
+                            await self._fetch_and_save_async(session, statute_id, safe_title, title, hierarchy_id, year)
+                            break
+                        except ThrottledError as e:
+                            if attempt == THROTTLE_MAX_RETRIES:
+                                raise
+                            print(f"{title} {e}，降速后重试...")
+                    await loop.run_in_executor(None, self.dedup.mark_done, statute_id, safe_title)
+                    metrics.DOCUMENTS.labels(hierarchy, 'success').inc()
+                    metrics.DOWNLOAD_SECONDS.labels(hierarchy).observe(time.perf_counter() - started)
+                    print(f"成功下载法规: {title}")
+                    print(f"保存到: {safe_title}")
+                    return DOWNLOAD_OK
+                except Exception as e:
+                    await loop.run_in_executor(None, self.dedup.release, statute_id)
+                    metrics.DOCUMENTS.labels(hierarchy, 'failed').inc()
+                    print(f"下载法规失败: {title} {e}")
+                    recorded = await loop.run_in_executor(None, self._record_failure, regulation, hierarchy_id, year, e)
+                    return recorded or DOWNLOAD_FAILED
+
+    async def _fetch_and_save_async(self, session, statute_id, safe_title, title, hierarchy_id, year):
+        """请求一次法规详情，格式化为文章并保存文件"""
+        loop = asyncio.get_event_loop()
+        token = await loop.run_in_executor(None, self._reserve_token)
+        with timing.span('detail.rate_limit'):
+            timing.record('detail.sleep', await self.rate_limiter.acquire_async(token, endpoint='statute_detail'))
+        request_started = time.perf_counter()
+        with timing.span('detail.request'):
+            try:
+                # 切换token后会话的默认请求头已过时，逐个请求指定Access-Token
+                response = await session.get(statute_detail_url(statute_id), headers={"Access-Token": token})
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.record_request('statute_detail', 'error', time.perf_counter() - request_started, token)
+                await loop.run_in_executor(None, observe_error, token, 'statute_detail', e)
+                raise
+        metrics.record_request('statute_detail', response.status, time.perf_counter() - request_started, token)
+        async with response:
+            if response.status != 200:
+                body = await response.read()
+                outcome, reason = await loop.run_in_executor(
+                    None, observe_response, token, 'statute_detail', response.status)
+                print(f"请求失败: HTTP {response.status}")
+                print(f"响应内容: {body[:200].decode('utf-8', 'replace')}")
+                if outcome == OUTCOME_THROTTLED:
+                    raise ThrottledError(f"请求被限流: {reason}")
+                raise DownloadHTTPError(response.status)
+
+            if self._should_stream(response.headers.get('Content-Length')):
+                await self._stream_render_async(response, safe_title, statute_id, title, hierarchy_id, year)
+            else:
+                with timing.span('detail.read'):
+                    body = await response.read()
+                # 解析和写文件放到线程池，避免阻塞事件循环
+                await loop.run_in_executor(None, self._render_and_save, body, safe_title,
+                                           statute_id, title, hierarchy_id, year)
+
+    def _reserve_token(self):
+        """确定本次请求使用的token并扣减每日预算
+
+        aiohttp的请求不经过BanklawSession，需要在这里单独扣减
+        """
+        token = self._ensure_token_budget()
+        self.token_budget.consume(token)
+        return token
+
+    async def _stream_render_async(self, response, file_path, statute_id, title, hierarchy_id, year):
+        """边接收边解析响应，段落写入临时文件，结束后在线程池中生成最终文件"""
+        loop = asyncio.get_event_loop()
+        frame_writer = self.archive.stream_writer() if self.archive is not None else None
+        writer = ArticleStreamWriter(file_path)
+        try:
+            # 下载、解析和写临时文件交替进行，合并统计为detail.stream
+            with timing.span('detail.stream'):
+                await stream_to_writer_async(AsyncChunkReader(response.content, STREAM_CHUNK_SIZE, frame_writer), writer)
+            await loop.run_in_executor(None, self._commit_stream, writer, frame_writer,
+                                       statute_id, title, hierarchy_id, year)
+        finally:
+            writer.close()
+
+    async def _crawl_async(self, hierarchy_id, year):
+        """并发下载指定层级和年份的所有法规"""
+        total_success = 0
+        total_failed = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        loop = asyncio.get_event_loop()
+
+        async with aiohttp.ClientSession(headers=self.async_headers, timeout=timeout,
+                                         connector=connector) as session:
+            for month, file_path, progress in self._iter_month_items(hierarchy_id, year):
+                if progress is None:
+                    total_failed += 1
+                    continue
+
+                async def download(index, item):
+                    return index, item, await self._download_one(session, semaphore, item, hierarchy_id, year)
+
+                tasks = [asyncio.ensure_future(download(index, item)) for index, item in progress.pending()]
+                # 按完成顺序统计结果并立即记录进度，失败的条目已转入重试队列；
+                # 其他进程正在下载的、以及失败后没能记入重试队列的不记为完成
+                for future in asyncio.as_completed(tasks):
+                    index, item, result = await future
+                    if result in DOWNLOAD_SETTLED:
+                        await loop.run_in_executor(None, progress.complete, index, item)
+                    if result == DOWNLOAD_OK:
+                        total_success += 1
+                    elif result != DOWNLOAD_CLAIMED:
+                        total_failed += 1
+                print(f"{year}年{month}月处理完成，累计成功: {total_success}, 失败: {total_failed}")
+
+        return total_success, total_failed
+
+    async def _crawl_queue_async(self, queue, batch_size, idle_wait):
+        """并发消费任务队列，每批领取batch_size个任务，同时在途的请求数仍受并发数限制"""
+        total_success = 0
+        total_failed = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        loop = asyncio.get_event_loop()
+        failed_ids = set()
+
+        async def handle(item):
+            result = await self._download_one(session, semaphore, item, item.get('hierarchy_id'), item.get('year'))
+            if result in (DOWNLOAD_OK, DOWNLOAD_DEAD):
+                await loop.run_in_executor(None, queue.ack, item['statuteId'])
+                if result == DOWNLOAD_OK:
+                    await loop.run_in_executor(None, self._resolve_retried, item)
+            elif result == DOWNLOAD_RETRY:
+                # 等到重试队列安排的时间再被领取，退避期间不会被反复重试
+                await loop.run_in_executor(None, self._defer, queue, item)
+            else:
+                # 其他进程正在下载、或失败后没能记入重试队列的任务放回队列
+                await loop.run_in_executor(None, queue.release, item['statuteId'])
+            return result
+
+        async with aiohttp.ClientSession(headers=self.async_headers, timeout=timeout,
+                                         connector=connector) as session:
+            while True:
+                with timing.span('queue.claim'):
+                    items = await loop.run_in_executor(None, queue.claim, batch_size)
+                if not items:
+                    if await loop.run_in_executor(None, queue.is_drained):
+                        break
+                    with timing.span('queue.sleep'):
+                        await asyncio.sleep(idle_wait)
+                    continue
+                # 又领到了本轮失败过的任务，结束本轮交给调度器处理
+                if any(item['statuteId'] in failed_ids for item in items):
+                    for item in items:
+                        await loop.run_in_executor(None, queue.release, item['statuteId'])
+                    break
+                results = await asyncio.gather(*[handle(item) for item in items])
+                for item, result in zip(items, results):
+                    if result == DOWNLOAD_OK:
+                        total_success += 1
+                    elif result == DOWNLOAD_CLAIMED:
+                        failed_ids.add(item['statuteId'])
+                    else:
+                        failed_ids.add(item['statuteId'])
+                        total_failed += 1
+
+        print(f"任务队列已处理完毕，成功: {total_success}, 失败: {total_failed}")
+        timing.report("任务队列")
+        return total_success, total_failed
+
+    def crawl_from_queue(self, queue, batch_size=None, idle_wait=5):
+        """从分布式任务队列并发领取法规并下载，返回值与Crawler.crawl_from_queue一致
+
+        Args:
+            batch_size: 每次领取的任务数，默认与并发数一致
+        """
+        return asyncio.run(self._crawl_queue_async(queue, batch_size or self.concurrency, idle_wait))
+
+    def crawl_by_api_responses(self, hierarchy_id, year=2022, if_chufa=0):
+        """根据层级以及年份并发爬取对应类型的法规
+
+        Args:
+            if_chufa: 是否直接导出处罚案例
+            hierarchy_id: 法规层级ID（1:法律法规, 2:规章制度, 3:行业动态）
+            year: 年份
+
+        Returns:
+            tuple: (成功爬取数量, 失败数量)
+        """
+        if if_chufa == 1:
+            print("*"*50+"直接处理处罚案例"+"*"*50)
+            return 0, 0
+        result = asyncio.run(self._crawl_async(hierarchy_id, year))
+        timing.report(f"{HIERARCHIES.get(hierarchy_id, '法律法规')} {year}年")
+        return result
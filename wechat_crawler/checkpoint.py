@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按(层级, 年份, 月份)保存的详情下载进度
+每个月份记录已连续完成的条目偏移、目录条目总数、目录文件签名和是否全部完成，另有一个已完成ID集合；
+重试或重启后已完成的月份不再读取目录文件，未完成的月份从偏移处继续，偏移之后已完成的条目按ID跳过
+
+目录文件被重新抓取或增量合并后签名会变化，此时偏移从0重新计算，已完成ID集合仍然有效
+
+用法: python -m wechat_crawler.checkpoint [--hierarchy 层级ID] [--year 年份] [--reset]
+"""
+
+import argparse
+import os
+import threading
+
+import redis
+
+from .config import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD, CHECKPOINT_ENABLED
+
+
+def listing_signature(file_path):
+    """目录文件的签名（大小和修改时间），文件被重写后签名随之变化"""
+    stat = os.stat(file_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def item_id(item):
+    return item.get('statuteId') or item.get('id')
+
+
+class MonthProgress:
+    """一个月份目录的下载进度
+
+    pending()给出还需要下载的条目，每条处理完（下载成功或已转入失败重试队列）后调用complete()；
+    不传store时只在内存中跟踪，用于关闭断点续传的情况
+    """
+
+    def __init__(self, items, store=None, keys=None, offset=0, done_ids=()):
+        self.items = items
+        self.store = store
+        self.keys = keys
+        self.offset = min(offset, len(items))
+        self.done_ids = set(done_ids)
+        self._completed = [False] * len(items)
+        for index in range(self.offset):
+            self._completed[index] = True
+        for index in range(self.offset, len(items)):
+            if item_id(items[index]) in self.done_ids:
+                self._completed[index] = True
+        self._lock = threading.Lock()
+        self._advance()
+
+    def _advance(self):
+        # 并发下载时完成顺序不定，偏移只推进到第一个未完成的条目
+        while self.offset < len(self.items) and self._completed[self.offset]:
+            self.offset += 1
+
+    def pending(self):
+        """还未完成的(序号, 条目)"""
+        return [(index, self.items[index]) for index in range(self.offset, len(self.items))
+                if not self._completed[index]]
+
+    @property
+    def done(self):
+        return self.offset >= len(self.items)
+
+    def complete(self, index, item):
+        """记录一条已完成：推进连续完成的偏移，并把ID写入已完成集合"""
+        with self._lock:
+            self._completed[index] = True
+            self._advance()
+        if self.store is not None:
+            self.store.save(self.keys, self.offset, len(self.items), item_id(item))
+
+
+class CrawlCheckpoint:
+    """保存在Redis中的详情下载进度"""
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+
+    @staticmethod
+    def _keys(hierarchy_id, year, month):
+        prefix = f"crawl:checkpoint:{hierarchy_id}:{year}:{month}"
+        return prefix, prefix + ":ids"
+
+    def is_done(self, hierarchy_id, year, month, signature):
+        """该月份是否已全部完成且目录文件没有变化，是则无需读取目录文件"""
+        state_key, _ = self._keys(hierarchy_id, year, month)
+        done, saved = self.redis_conn.hmget(state_key, 'done', 'signature')
+        return done == b'1' and saved is not None and saved.decode('utf-8') == signature
+
+    def begin(self, hierarchy_id, year, month, items, signature):
+        """读取月份进度，返回MonthProgress；目录文件有变化时偏移从0重新计算"""
+        keys = self._keys(hierarchy_id, year, month)
+        state_key, ids_key = keys
+        pipe = self.redis_conn.pipeline()
+        pipe.hmget(state_key, 'offset', 'signature')
+        pipe.smembers(ids_key)
+        (offset, saved), done_ids = pipe.execute()
+        done_ids = {i.decode('utf-8') for i in done_ids}
+        if saved is None or saved.decode('utf-8') != signature:
+            offset = 0
+            self.redis_conn.hset(state_key, mapping={
+                'offset': 0, 'total': len(items), 'signature': signature, 'done': 0
+            })
+        offset = int(offset or 0)
+        progress = MonthProgress(items, self, keys, offset, done_ids)
+        # 偏移之后紧接着的条目可能已按ID记为完成，把推进后的偏移写回
+        if progress.offset != offset:
+            self.save(keys, progress.offset, len(items))
+        return progress
+
+    def save(self, keys, offset, total, doc_id=None):
+        """写入偏移，全部完成时同时标记done"""
+        state_key, ids_key = keys
+        pipe = self.redis_conn.pipeline(transaction=False)
+        if doc_id:
+            pipe.sadd(ids_key, doc_id)
+        pipe.hset(state_key, mapping={'offset': offset, 'total': total, 'done': int(offset >= total)})
+        pipe.execute()
+
+    def _scan(self, hierarchy_id=None, year=None):
+        pattern = f"crawl:checkpoint:{hierarchy_id or '*'}:{year or '*'}:*"
+        return sorted(key.decode('utf-8') for key in self.redis_conn.scan_iter(match=pattern, count=1000))
+
+    def status(self, hierarchy_id=None, year=None):
+        """各月份的进度
+
+        Returns:
+            list: [(层级ID, 年份, 月份, 偏移, 总数, 是否完成)]
+        """
+        rows = []
+        for key in self._scan(hierarchy_id, year):
+            if key.endswith(':ids'):
+                continue
+            _, _, h, y, m = key.split(':')
+            offset, total, done = self.redis_conn.hmget(key, 'offset', 'total', 'done')
+            rows.append((int(h), int(y), int(m), int(offset or 0), int(total or 0), done == b'1'))
+        rows.sort()
+        return rows
+
+    def reset(self, hierarchy_id=None, year=None):
+        """删除进度，下次从头检查（已下载的文档仍由去重索引跳过）
+
+        Returns:
+            int: 删除的键数
+        """
+        keys = self._scan(hierarchy_id, year)
+        if not keys:
+            return 0
+        return self.redis_conn.delete(*keys)
+
+
+def get_checkpoint():
+    """按配置返回进度存储，关闭断点续传时返回None"""
+    if not CHECKPOINT_ENABLED:
+        return None
+    return CrawlCheckpoint()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或重置详情下载进度")
+    parser.add_argument('--hierarchy', type=int, default=None, help="层级ID")
+    parser.add_argument('--year', type=int, default=None, help="年份")
+    parser.add_argument('--reset', action='store_true', help="删除匹配的进度")
+    args = parser.parse_args()
+    checkpoint = CrawlCheckpoint()
+    if args.reset:
+        print(f"已删除 {checkpoint.reset(args.hierarchy, args.year)} 个进度键")
+        return
+    rows = checkpoint.status(args.hierarchy, args.year)
+    if not rows:
+        print("没有保存的进度")
+        return
+    for hierarchy_id, year, month, offset, total, done in rows:
+        print(f"层级{hierarchy_id} {year}年{month:>2}月: {offset}/{total} {'已完成' if done else '未完成'}")
+
+
+if __name__ == "__main__":
+    main()
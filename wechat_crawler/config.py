@@ -13,10 +13,29 @@ REDIS_PASSWORD = None  # 如果有密码，请填写
 REQUIRED_TOKEN_COUNT = 1  # 需要的access_token数量
 
 # 爬虫配置
-MAX_REQUESTS_PER_COOKIE = 100  # 每个cookie最大请求次数
+MAX_REQUESTS_PER_COOKIE = 100  # 每个access_token每天最大请求次数（所有机器合计），0为不限制
+TOKEN_BUDGET_MARGIN = 5  # 当天剩余请求数不超过该值时切换到用量最少的token
+TOKEN_HEALTH_TTL = 600  # token健康状态缓存有效期（秒），过期后才重新发起探测请求
+TOKEN_REJECTED_CODES = [401, 403]  # 响应体业务错误码中表示token未登录、已失效或额度用完的值，其他非0错误码不影响token健康
+TOKEN_PROBE_WORKERS = 20  # 并发检查token健康状态的线程数
 NUM_THREADS = 1  # 爬虫线程数，不用
 MAX_PAGES_PER_THREAD = 5  # 每个线程爬取的最大页数，不用
 THREAD_ID = 1
+USE_WORK_QUEUE = False  # 是否使用Redis任务队列分发下载任务，开启后THREAD_ID不再生效
+SUPERVISOR_ENABLED = False  # 是否以多进程分片模式运行run.py（也可用python run.py --supervisor），按(层级, 年份)分片并行爬取
+SUPERVISOR_WORKERS = 0  # 多进程模式的工作进程数，0为CPU核数
+SUPERVISOR_HIERARCHIES = [1, 2, 3]  # 多进程模式爬取的层级
+SUPERVISOR_MAX_RESTARTS = 3  # 分片的工作进程异常退出后最多重启的次数
+SUPERVISOR_REPORT_INTERVAL = 30  # 主进程汇总打印进度的间隔（秒）
+SUPERVISOR_LOG_DIR = "logs"  # 工作进程的输出目录，每个分片一个日志文件
+SUPERVISOR_TOKEN_WAIT = 30  # 工作进程没有可用token时等待主进程扫码补充的秒数
+WORK_QUEUE_LEASE_SECONDS = 300  # 任务租约时长（秒），超时未确认的任务自动重新分配
+DEDUP_CLAIM_TTL = 300  # 下载去重占用的有效期（秒），进程异常退出后占用自动释放
+CHECKPOINT_ENABLED = True  # 是否按(层级, 年份, 月份)记录下载进度，重试或重启后从中断处继续
+RETRY_MAX_ATTEMPTS = 5  # 单个条目失败多少次后转入死信，不再自动重试（token不可用、限流导致的失败不计入）
+RETRY_BASE_DELAY = 30  # 失败条目首次重试前的等待秒数，之后每次失败翻倍并加随机抖动
+RETRY_MAX_DELAY = 3600  # 失败条目重试等待的上限秒数
+DEDUP_LEGACY_FILE_CHECK = False  # 同名文件已存在且索引记录该文件属于同一statuteId时补记后跳过，否则以带ID的文件名另存
 IF_ON = 1
 IF_CHUFA = 0
 START_YEAR = 2022  # 开始年份
@@ -29,15 +48,52 @@ ACCESS_TOKEN_TTL = 7200  # access_token有效期（秒）
 
 # 爬虫对文档下载配置
 SAVE_DIR = "downloaded_regulations"  # 法规保存目录
-DOWNLOAD_DELAY_MIN = 1.5  # 下载延迟最小值（秒）
-DOWNLOAD_DELAY_MAX = 3.5  # 下载延迟最大值（秒）
+DOWNLOAD_DELAY_MIN = 1.5  # 下载延迟最小值（秒），已由RATE_LIMIT_*取代
+DOWNLOAD_DELAY_MAX = 3.5  # 下载延迟最大值（秒），已由RATE_LIMIT_*取代
 PAGE_DELAY_MIN = 3  # 页面间延迟最小值（秒）
 PAGE_DELAY_MAX = 6  # 页面间延迟最大值（秒）
+RATE_LIMIT_TOKEN_RPM = 20  # 单个access_token每分钟请求数上限（目录与详情合计，所有机器共享；开启自适应限流时同时是每个接口的初始速率）
+RATE_LIMIT_HOST_RPM = 60  # api2.banklaw.com每分钟请求数上限（所有token合计）
+RATE_LIMIT_BURST = 3  # 令牌桶容量，允许的瞬时突发请求数
+ADAPTIVE_RATE_ENABLED = True  # 按服务器响应自动调节每个token每个接口的请求速率（加性增、乘性减），关闭时固定为RATE_LIMIT_TOKEN_RPM
+AIMD_MIN_RPM = 2  # 自适应速率的下限（每分钟请求数）
+AIMD_MAX_RPM = 60  # 单个接口自适应速率的上限（每分钟请求数），同一token各接口合计仍受RATE_LIMIT_TOKEN_RPM约束，所有token合计受RATE_LIMIT_HOST_RPM约束
+AIMD_INCREASE_RPM = 5  # 持续成功时速率每分钟约提高的请求数
+AIMD_DECREASE_FACTOR = 0.5  # 被限流或服务端过载时速率乘以该系数
+AIMD_DECREASE_COOLDOWN = 5  # 降速后该秒数内的其他限流响应不再重复降速（并发请求往往同时被限流）
+BREAKER_THRESHOLD = 3  # token连续被限流多少次后暂停使用（熔断）
+BREAKER_BASE_SECONDS = 60  # 首次熔断的暂停秒数，恢复后再次被限流时翻倍
+BREAKER_MAX_SECONDS = 1800  # 熔断暂停秒数的上限
+THROTTLE_MAX_RETRIES = 3  # 目录或详情请求被限流时降速后重试的次数，不小于BREAKER_THRESHOLD时最后一次重试在熔断暂停之后
+HTTP_POOL_SIZE = 10  # 每个token连接池保持的最大连接数
+HTTP_CONNECT_TIMEOUT = 5  # 连接超时（秒）
+HTTP_READ_TIMEOUT = 30  # 读取超时（秒）
+CRAWL_MODE = 'sync'  # 详情下载模式：sync逐条下载，async并发下载
+ASYNC_CONCURRENCY_PER_TOKEN = 4  # async模式下单个token同时在途的请求数
+RAW_ARCHIVE_ENABLED = True  # 是否归档法规详情的原始响应，用于离线重新渲染
+ARCHIVE_DIR = "raw_archive"  # 原始响应归档目录
+ARCHIVE_SHARD_MAX_BYTES = 256 * 1024 * 1024  # 单个归档分片的最大字节数
+ARCHIVE_ZSTD_LEVEL = 10  # zstd压缩级别
+STREAM_PARSE_ENABLED = True  # 是否流式解析详情响应，需要安装ijson，未安装时自动整体解析
+STREAM_PARSE_MIN_BYTES = 1024 * 1024  # Content-Length不小于该值（或未知）时流式解析
+STREAM_CHUNK_SIZE = 64 * 1024  # 流式读取响应的块大小（字节）
+SEARCH_INDEX_PATH = "search_index.db"  # 全文检索索引（SQLite）文件路径
+SEARCH_INDEX_ON_WRITE = True  # 下载写入文件时是否同步加入全文检索索引
+EXPORT_DIR = "corpus_export"  # 语料导出目录（按层级和年份分区的Parquet/JSONL分片）
+EXPORT_FORMATS = ["parquet", "jsonl"]  # 默认导出格式，未安装pyarrow时跳过parquet
+EXPORT_BATCH_BYTES = 128 * 1024 * 1024  # 内存中累积多少正文字节后写出一批分片
+METRICS_PORT = 0  # 爬虫进程的Prometheus指标端口，0为不启动；API服务固定在/metrics暴露指标
+TIMING_SPANS_ENABLED = False  # 是否统计目录抓取、请求、解析、写入和限流休眠各阶段耗时，每轮结束时打印汇总
 
 # 下载目录配置
 START_YEAR_DOWNLOAD = 2023  # 开始年份
 END_YEAR_DOWNLOAD = 2024  # 结束年份
-MULU_DOWNLODA_TIMEOUT = 10  # 目录下载休息时间（秒）
+MULU_DOWNLODA_TIMEOUT = 10  # 目录下载休息时间（秒），已由RATE_LIMIT_*取代
+LISTING_MODE = 'sync'  # 目录抓取模式：sync逐月串行，concurrent多个月份窗口并发，incremental从水位线增量抓取
+LISTING_WORKERS = 6  # concurrent模式下的目录抓取线程数，请求节奏仍受RATE_LIMIT_*约束
+ADAPTIVE_PAGE_SIZE = True  # 是否自动协商目录接口支持的最大每页条数
+LISTING_PAGE_SIZE_CANDIDATES = [100, 50, 30, 20]  # 协商时依次尝试的每页条数
+LISTING_PAGE_SIZE_TTL = 86400  # 协商结果在Redis中的缓存时间（秒）
 IF_CHERK = False
 
 # 浏览器配置
@@ -48,6 +104,9 @@ BROWSER_TIMEOUT = 30  # 浏览器操作超时时间（秒）
 # API配置
 API_HOST = '0.0.0.0'  # API监听地址，0.0.0.0表示监听所有网卡
 API_PORT = 5000  # API监听端口
+API_REDIS_MAX_CONNECTIONS = 50  # API服务异步Redis连接池的最大连接数，所有请求共用
+API_REDIS_POOL_TIMEOUT = 5  # 连接池用满时请求等待空闲连接的最长时间（秒），超时返回错误
+QR_CODE_WAIT_TIMEOUT = 15  # /api/qrcode等待新二维码生成的最长时间（秒），等待期间不阻塞其他请求
 
 # 搜索配置
 # DEFAULT_SEARCH_KEYWORDS = [
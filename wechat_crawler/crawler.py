@@ -6,16 +6,32 @@ import random
 import json
 from datetime import datetime
 from .config import (
-    TARGET_URL, SAVE_DIR, 
+    TARGET_URL, SAVE_DIR, BANKLAW_API_URL,
     DOWNLOAD_DELAY_MIN, DOWNLOAD_DELAY_MAX,
-    PAGE_DELAY_MIN, PAGE_DELAY_MAX
+    PAGE_DELAY_MIN, PAGE_DELAY_MAX,
+    DEDUP_LEGACY_FILE_CHECK,
+    STREAM_PARSE_ENABLED, STREAM_PARSE_MIN_BYTES, STREAM_CHUNK_SIZE,
+    THROTTLE_MAX_RETRIES
 )
 import json
 import re
+from operator import itemgetter
+from .rate_limiter import get_rate_limiter, observe_response, observe_error
+from .http_client import build_headers, get_session
+from .token_health import get_token_health_cache, OUTCOME_THROTTLED, OUTCOME_REJECTED, OUTCOME_ERROR
+from .token_budget import get_token_budget
+from .dedup import get_dedup_index
+from .archive import get_raw_archive
+from .search_index import get_write_index, document_from_detail
+from .checkpoint import get_checkpoint, listing_signature, MonthProgress
+from .failure_store import get_failure_store, DownloadHTTPError, TokenUnavailableError, ThrottledError
+from . import stream_render
+from . import metrics
+from . import timing
+from .stream_render import HTML_TAG_RE, ArticleStreamWriter, ChunkReader, stream_to_writer
 
-# API相关常量
-BANKLAW_API_URL = "https://api2.banklaw.com"
-STATUTE_API_URL = "https://api2.banklaw.com/v1/statutes/{statute_id}"
+# API相关常量，基础地址取自配置BANKLAW_API_URL
+STATUTE_API_URL = BANKLAW_API_URL + "/v1/statutes/{statute_id}"
 
 # 分类定义
 HIERARCHIES = {
@@ -24,6 +40,70 @@ HIERARCHIES = {
     3: "行业动态"
 }
 
+# 单条下载的结果
+DOWNLOAD_OK = 'ok'  # 下载成功，或此前已下载
+DOWNLOAD_CLAIMED = 'claimed'  # 其他进程正在下载，本次未处理，不能记为完成
+DOWNLOAD_RETRY = 'retry'  # 下载失败，已记入重试队列
+DOWNLOAD_DEAD = 'dead'  # 下载失败，已转入死信不再重试
+DOWNLOAD_FAILED = 'failed'  # 下载失败，且没能记入重试队列，不能记为完成
+# 可以在断点进度中记为已处理的结果
+DOWNLOAD_SETTLED = (DOWNLOAD_OK, DOWNLOAD_RETRY, DOWNLOAD_DEAD)
+
+def statute_detail_url(statute_id):
+    """构造法规详情接口地址（带段落和句子）"""
+    return f'{BANKLAW_API_URL}/v1/statutes/{statute_id}?focusBatchId=&needSentence=true&tagProjectId=51&needParagraph=true&1742199313084'
+
+def regulation_path(save_dir, title, hierarchy_id=None, year=None, statute_id=None):
+    """构造法规文本的保存路径：save_dir/hierarchy_{id}_{名称}/{year}/{title}.txt
+    
+    传入statute_id时文件名为{title}_{statute_id}.txt，用于区分同名的不同法规
+    """
+    if hierarchy_id:
+        hierarchy_name = HIERARCHIES.get(hierarchy_id, "其他")
+        save_dir = os.path.join(save_dir, f"hierarchy_{hierarchy_id}_{hierarchy_name}")
+    if year is not None:
+        save_dir = os.path.join(save_dir, str(year))
+    if statute_id:
+        return os.path.join(save_dir, f"{title}_{statute_id}.txt")
+    return os.path.join(save_dir, f"{title}.txt")
+
+def extract_article_from_json(json_data):
+    """
+    从JSON数据中提取文章内容，并进行格式化处理
+    
+    参数:
+        json_data: JSON字符串、字节或已解析的JSON对象
+        
+    返回:
+        格式化后的文章内容字符串
+    """
+    # 解析JSON
+    data = json.loads(json_data) if isinstance(json_data, (str, bytes)) else json_data
+    detail = data['data']
+    
+    # 标题和发布时间
+    header = f"# {detail['title']}\n\n发布时间: {detail['publishDate']}\n\n"
+    return header + render_paragraphs(detail['paragraphs'])
+
+def render_paragraphs(paragraphs):
+    """按groupId排序并清理段落，返回正文（不含标题和发布时间）
+    
+    正文片段先收集到列表中最后一次拼接，避免长文档反复复制字符串
+    """
+    parts = []
+    # 按照groupId排序段落，不修改调用方的数据
+    strip_tags = HTML_TAG_RE.sub
+    for paragraph in sorted(paragraphs, key=itemgetter('groupId')):
+        # 清理HTML标签
+        content = strip_tags('', paragraph['content'])
+        # 跳过空段落
+        if not content or content.isspace():
+            continue
+        parts.append(content)
+        parts.append("\n\n")
+    
+    return "".join(parts)
+
 def process_legal_regulation(data):
     """处理法律法规类型的数据"""
     content = []
@@ -136,18 +216,9 @@ class Crawler:
         #     'sec-ch-ua-platform': 'Windows',
         #     'sourceType': '1'
         # }
-        self.headers = {
-                "Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "zh-CN,zh;q=0.9",
-                "Access-Token": access_token,
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "application/json; charset=utf-8",
-                "Host": "api2.banklaw.com",
-                "Origin": "https://www.banklaw.com",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
-        }
+        self.headers = build_headers(access_token)
+        # 同一token共用一个keep-alive连接池，预热后不再重复握手
+        self.session = get_session(access_token)
         
         # if self.access_token:
         #     self.headers['Access-Token'] = self.access_token
@@ -157,6 +228,26 @@ class Crawler:
             
         self.base_url = BANKLAW_API_URL  #无用
         self.save_dir = SAVE_DIR
+        # 所有进程共享的分布式限流器，取代下载后的固定随机休眠
+        self.rate_limiter = get_rate_limiter()
+        # 真实请求的结果会被动更新token健康缓存
+        self.health_cache = get_token_health_cache()
+        # 每个token每天的请求预算，接近上限时切换token
+        self.token_budget = get_token_budget()
+        # 按statuteId去重，取代按标题路径判断文件是否存在
+        self.dedup = get_dedup_index('statutes')
+        # 原始响应归档，未开启时为None
+        self.archive = get_raw_archive()
+        # 写入文件后同步加入全文检索索引，未开启时为None
+        self.search_index = get_write_index()
+        # 按(层级, 年份, 月份)保存的下载进度，重试时从中断处继续，未开启时为None
+        self.checkpoint = get_checkpoint()
+        # 失败条目的重试计划和死信，重试只针对失败的条目
+        self.failures = get_failure_store('statutes')
+        # 大响应边下载边解析，需要安装ijson
+        self.stream_parse = STREAM_PARSE_ENABLED and stream_render.ijson is not None
+        if STREAM_PARSE_ENABLED and not self.stream_parse:
+            print("未安装ijson，详情响应改为整体解析")
         
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
@@ -166,7 +257,18 @@ class Crawler:
             print(f"使用Access-Token: {self.access_token[:10]}...")
 
     def download_regulation(self, regulation, hierarchy_id=None, year=None):
-        """下载单个法规文本"""
+        """下载单个法规文本
+
+        Returns:
+            str: DOWNLOAD_OK、DOWNLOAD_CLAIMED，失败时为DOWNLOAD_RETRY、DOWNLOAD_DEAD或DOWNLOAD_FAILED
+        """
+        with timing.span('detail.total'):
+            return self._download_regulation(regulation, hierarchy_id, year)
+
+    def _download_regulation(self, regulation, hierarchy_id=None, year=None):
+        claimed = False
+        started = time.perf_counter()
+        hierarchy = metrics.hierarchy_label(hierarchy_id)
         try:
             # 构建爬取路径
             statute_id = regulation.get('statuteId') or regulation.get('id')
@@ -175,18 +277,22 @@ class Crawler:
             if not statute_id:
                 raise Exception("未找到法规ID")
             
-            # 检查文件是否已存在
-            save_dir = os.path.join(self.save_dir, 
-                                  f"hierarchy_{hierarchy_id}_{HIERARCHIES.get(hierarchy_id, '其他')}", 
-                                  str(year))
-            safe_title = os.path.join(save_dir, f"{title}.txt")
-            print(safe_title)
+            # 先查去重索引，已下载或其他进程正在下载时不发请求
+            with timing.span('detail.dedup'):
+                result = self._claim(statute_id, title, hierarchy)
+            if result is not None:
+                return result
+            claimed = True
             
-            if os.path.exists(safe_title):
+            with timing.span('detail.dedup'):
+                safe_title = self._resolve_path(statute_id, title, hierarchy_id, year)
+            if safe_title is None:
                 print(f"文件已存在，跳过: {title}")
-                return True
+                metrics.DOCUMENTS.labels(hierarchy, 'skipped').inc()
+                return DOWNLOAD_OK
+            print(safe_title)
             
-            api_url = f'https://api2.banklaw.com/v1/statutes/{statute_id}?focusBatchId=&needSentence=true&tagProjectId=51&needParagraph=true&1742199313084'
+            api_url = statute_detail_url(statute_id)
             self.base_url = api_url
             print(f"下载法规: {title} (ID: {statute_id})")
             
@@ -209,69 +315,259 @@ class Crawler:
             #     "Origin": "https://www.banklaw.com",
             #     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
             # }
-            response = requests.get(api_url, headers=self.headers)
-            # print(self.headers)
-            # print(response.text)
-            if response.status_code != 200:
-                print(f"请求失败: HTTP {response.status_code}")
-                print(f"响应内容: {response.text[:200]}")
-                raise Exception(f"下载法规失败: {response.status_code}")
-            
-            data = response.json()
-            # print(data)
-
-            #直接调用json处理变成美化文章
-            content = self.extract_article_from_json(data)
-            # content = "nihao,woshiceshi"
-            # print(content)
-            
-            #下面是要写对应的处理函数是啥把，这里先简单写了一个，后面再改
-            
-            #直接保存试试
-
-            
-            # # 根据不同分类处理数据
-            # if hierarchy_id and hierarchy_id in HIERARCHY_PROCESSORS:
-            #     content = HIERARCHY_PROCESSORS[hierarchy_id](data)
-            # else:
-            #     content = self._extract_regulation_content(data)
-            
-            # if not content:
-            #     raise Exception("未找到法规内容")
-            
-            # 构造保存目录
-            save_dir = self.save_dir
-            if hierarchy_id:
-                hierarchy_name = HIERARCHIES.get(hierarchy_id, "其他")
-                save_dir = os.path.join(save_dir, f"hierarchy_{hierarchy_id}_{hierarchy_name}")
-                if not os.path.exists(save_dir):
-                    os.makedirs(save_dir)
-            
-            # 构造保存文件名，将上面的save_dir\year和title拼接起来
-            temp_dir = f'{save_dir}\{str(year)}'
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir)
-            safe_title = os.path.join(temp_dir, title+'.txt')
-            #hierarchy_dir = f'api_responses/hierarchy_{hierarchy_id}_{hierarchy_name}'
-
-            # filename = os.path.join(save_dir, f"{statute_id}_{safe_title}.txt")
-            
-            # 保存文件
-            with open(safe_title, 'w', encoding='utf-8') as f:
-                # formatted_data = json.dumps(data, ensure_ascii=False, indent=2)
-                f.write(content)
+            # 被限流时限流器已降速或暂停该token，稍后重试本条，不必等到失败重试队列
+            for attempt in range(THROTTLE_MAX_RETRIES + 1):
+                try:
+                    self._fetch_and_save(api_url, safe_title, statute_id, title, hierarchy_id, year)
+                    break
+                except ThrottledError as e:
+                    if attempt == THROTTLE_MAX_RETRIES:
+                        raise
+                    print(f"{e}，降速后重试...")
+                
+                # # 根据不同分类处理数据
+                # if hierarchy_id and hierarchy_id in HIERARCHY_PROCESSORS:
+                #     content = HIERARCHY_PROCESSORS[hierarchy_id](data)
+                # else:
+                #     content = self._extract_regulation_content(data)
+            with timing.span('detail.dedup'):
+                self.dedup.mark_done(statute_id, safe_title)
+            metrics.DOCUMENTS.labels(hierarchy, 'success').inc()
+            metrics.DOWNLOAD_SECONDS.labels(hierarchy).observe(time.perf_counter() - started)
             
             print(f"成功下载法规: {title}")
             print(f"保存到: {safe_title}")
             print("*"*50)
-
-            
-            time.sleep(random.uniform(DOWNLOAD_DELAY_MIN, DOWNLOAD_DELAY_MAX))
-            return True
+            return DOWNLOAD_OK
             
         except Exception as e:
+            if claimed:
+                self.dedup.release(statute_id)
+            metrics.DOCUMENTS.labels(hierarchy, 'failed').inc()
             print(f"下载法规失败: {e}")
+            return self._record_failure(regulation, hierarchy_id, year, e) or DOWNLOAD_FAILED
+
+    def _claim(self, statute_id, title, hierarchy):
+        """在去重索引中占用ID
+
+        Returns:
+            str: 已下载时为DOWNLOAD_OK，其他进程正在下载时为DOWNLOAD_CLAIMED，占用成功时为None
+        """
+        if self.dedup.claim(statute_id):
+            return None
+        metrics.DOCUMENTS.labels(hierarchy, 'skipped').inc()
+        if self.dedup.contains(statute_id):
+            print(f"已下载，跳过: {title}")
+            return DOWNLOAD_OK
+        print(f"正在由其他进程下载，稍后再处理: {title}")
+        return DOWNLOAD_CLAIMED
+
+    def _fetch_and_save(self, api_url, safe_title, statute_id, title, hierarchy_id=None, year=None):
+        """请求一次法规详情，格式化为文章并保存文件"""
+        # 当前token今日请求数接近上限时先换token，再从限流器取得令牌后发请求
+        self._ensure_token_budget()
+        with timing.span('detail.rate_limit'):
+            timing.record('detail.sleep', self.rate_limiter.acquire(self.access_token, endpoint='statute_detail'))
+        # 开启流式解析时按流读取响应，大文档边下载边渲染
+        with timing.span('detail.request'):
+            try:
+                response = self.session.get(api_url, stream=self.stream_parse)
+            except requests.exceptions.RequestException as e:
+                observe_error(self.access_token, 'statute_detail', e)
+                raise
+        with response:
+            if response.status_code != 200:
+                # 响应分类同时反馈给token健康缓存和自适应限流
+                outcome, reason = observe_response(self.access_token, 'statute_detail', response.status_code)
+                print(f"请求失败: HTTP {response.status_code}")
+                print(f"响应内容: {response.text[:200]}")
+                if outcome == OUTCOME_THROTTLED:
+                    raise ThrottledError(f"请求被限流: {reason}")
+                raise DownloadHTTPError(response.status_code)
+
+            # 格式化为文章并保存文件，写入成功后记入去重索引
+            if self._should_stream(response.headers.get('Content-Length')):
+                self._stream_render_and_save(response.iter_content(STREAM_CHUNK_SIZE), safe_title,
+                                             statute_id, title, hierarchy_id, year)
+            else:
+                # 非流式请求时requests已读完响应体，这里只是取出内容
+                with timing.span('detail.read'):
+                    body = response.content
+                self._render_and_save(body, safe_title, statute_id, title, hierarchy_id, year)
+
+    def _record_failure(self, regulation, hierarchy_id, year, error):
+        """把失败条目记入重试队列
+
+        Returns:
+            str: DOWNLOAD_RETRY或DOWNLOAD_DEAD，记录失败时为None
+        """
+        if not (regulation.get('statuteId') or regulation.get('id')):
+            # 没有ID的条目无法重试，按放弃处理，不会一直阻塞所在月份的进度
+            return DOWNLOAD_DEAD
+        try:
+            return self.failures.record_failure(regulation, hierarchy_id, year, error)
+        except Exception as e:
+            print(f"记录失败条目出错: {e}")
+            return None
+
+    def _ensure_token_budget(self):
+        """当前token今日请求数接近MAX_REQUESTS_PER_COOKIE时切换到token池中用量最少的token
+
+        Returns:
+            str: 本次请求使用的token
+        """
+        token = self.token_budget.ensure(self.access_token)
+        if token != self.access_token:
+            self.access_token = token
+            self.headers = build_headers(token)
+            self.session = get_session(token)
+        return token
+
+    def _regulation_path(self, title, hierarchy_id=None, year=None, statute_id=None):
+        """构造本爬虫保存目录下的法规文本路径，见regulation_path"""
+        return regulation_path(self.save_dir, title, hierarchy_id, year, statute_id)
+
+    def _resolve_path(self, statute_id, title, hierarchy_id=None, year=None):
+        """确定去重索引中没有的法规的保存路径
+        
+        同名文件已存在时：开启DEDUP_LEGACY_FILE_CHECK且索引记录该文件正是本ID写入的
+        （如bootstrap_from_disk重建时），补记索引后返回None表示跳过；
+        否则视为另一篇同名法规，改用带ID的文件名
+        """
+        path = self._regulation_path(title, hierarchy_id, year)
+        if not os.path.exists(path):
+            return path
+        if DEDUP_LEGACY_FILE_CHECK and self.dedup.file_owner(path) == statute_id:
+            self.dedup.mark_done(statute_id)
+            return None
+        return self._regulation_path(title, hierarchy_id, year, statute_id)
+
+    def _should_stream(self, content_length):
+        """是否流式解析：长度未知（分块传输）或不小于STREAM_PARSE_MIN_BYTES时流式解析"""
+        if not self.stream_parse:
             return False
+        return content_length is None or int(content_length) >= STREAM_PARSE_MIN_BYTES
+
+    def _render_and_save(self, body, file_path, statute_id, title, hierarchy_id=None, year=None):
+        """整体解析响应：归档原始响应，再格式化为文章并写入文件"""
+        with timing.span('detail.parse'):
+            data = json.loads(body)
+        self._check_detail_response(data)
+        self._archive_raw(body, statute_id, title, hierarchy_id, year)
+        with timing.span('detail.render'):
+            content = self.extract_article_from_json(data)
+        self._save_regulation(content, file_path)
+        self._index_document(statute_id, data['data'], file_path, hierarchy_id, content)
+
+    def _stream_render_and_save(self, chunks, file_path, statute_id, title, hierarchy_id=None, year=None):
+        """流式解析响应：段落边到达边写入临时文件，原始字节同时压缩进归档"""
+        frame_writer = self.archive.stream_writer() if self.archive is not None else None
+        writer = ArticleStreamWriter(file_path)
+        try:
+            # 下载、解析和写临时文件交替进行，合并统计为detail.stream
+            with timing.span('detail.stream'):
+                stream_to_writer(ChunkReader(chunks, frame_writer), writer)
+            self._commit_stream(writer, frame_writer, statute_id, title, hierarchy_id, year)
+        finally:
+            writer.close()
+
+    def _commit_stream(self, writer, frame_writer, statute_id, title, hierarchy_id=None, year=None):
+        """流式解析结束后检查token状态，写入归档并生成最终文件"""
+        self._check_detail_response(writer.meta)
+        if frame_writer is not None:
+            try:
+                with timing.span('detail.archive'):
+                    record = frame_writer.commit(statute_id, hierarchy_id, year, title)
+                metrics.BYTES_WRITTEN.labels('archive').inc(record['length'])
+            except Exception as e:
+                print(f"归档原始响应失败: {e}")
+        with timing.span('detail.write'):
+            writer.commit()
+        metrics.BYTES_WRITTEN.labels('article').inc(os.path.getsize(writer.file_path))
+        self._index_document(statute_id, writer.meta, writer.file_path, hierarchy_id)
+
+    def _check_detail_response(self, data):
+        """对HTTP 200的详情响应分类，被限流时抛出ThrottledError，token不可用时抛出TokenUnavailableError，
+        其他业务错误抛出ValueError，按普通失败计入重试次数"""
+        outcome, reason = observe_response(self.access_token, 'statute_detail', 200, data)
+        if outcome == OUTCOME_THROTTLED:
+            raise ThrottledError(f"请求被限流: {reason}")
+        if outcome == OUTCOME_REJECTED:
+            raise TokenUnavailableError(f"access_token不可用: {reason}")
+        if outcome == OUTCOME_ERROR:
+            raise ValueError(f"详情接口返回错误: {reason}")
+
+    def _index_document(self, statute_id, detail, file_path, hierarchy_id=None, content=None):
+        """把刚写入的文档加入全文检索索引，索引失败不影响本次下载
+
+        content为None时（流式渲染）由索引从已写入的文件按块读取正文
+        """
+        if self.search_index is None:
+            return
+        try:
+            with timing.span('detail.index'):
+                self.search_index.add(document_from_detail(statute_id, detail, content, hierarchy_id, file_path))
+        except Exception as e:
+            print(f"写入全文检索索引失败: {e}")
+
+    def _archive_raw(self, body, statute_id, title, hierarchy_id=None, year=None):
+        """把详情接口的原始响应字节写入归档，归档失败不影响本次下载"""
+        if self.archive is None:
+            return
+        try:
+            with timing.span('detail.archive'):
+                record = self.archive.append(statute_id, body, hierarchy_id, year, title)
+            metrics.BYTES_WRITTEN.labels('archive').inc(record['length'])
+        except Exception as e:
+            print(f"归档原始响应失败: {e}")
+
+    def _save_regulation(self, content, file_path):
+        """将格式化后的法规文本写入文件，目录不存在时自动创建"""
+        with timing.span('detail.write'):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        metrics.BYTES_WRITTEN.labels('article').inc(os.path.getsize(file_path))
+
+    def _iter_month_items(self, hierarchy_id, year):
+        """按月份依次读取api_responses中的目录文件
+        
+        已全部完成且目录文件没有变化的月份直接跳过，不再读取文件
+        
+        Yields:
+            tuple: (月份, 文件路径, MonthProgress)，文件无效时为None
+        """
+        hierarchy_name = HIERARCHIES.get(hierarchy_id, "法律法规")
+        dir_path = f'api_responses/hierarchy_{hierarchy_id}_{hierarchy_name}/{year}'
+        if not os.path.exists(dir_path):
+            return
+        for month in range(1, 13):
+            file_path = f'{dir_path}/api_response_{month}.json'
+            print("*"*50)
+            print(f"正在处理{year}年{month}月份的数据")
+            if not os.path.exists(file_path):
+                continue
+            signature = listing_signature(file_path)
+            if self.checkpoint is not None and self.checkpoint.is_done(hierarchy_id, year, month, signature):
+                print(f"{year}年{month}月已全部下载，跳过")
+                continue
+            try:
+                with timing.span('crawl.read_listing'):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                if not data.get('data'):
+                    raise Exception("无效的数据")
+            except Exception as e:
+                print(f"处理文件 {file_path} 时发生错误: {e}")
+                yield month, file_path, None
+                continue
+            if self.checkpoint is None:
+                yield month, file_path, MonthProgress(data['data'])
+                continue
+            progress = self.checkpoint.begin(hierarchy_id, year, month, data['data'], signature)
+            if progress.offset:
+                print(f"{year}年{month}月已完成 {progress.offset}/{len(progress.items)} 条，从中断处继续")
+            yield month, file_path, progress
 
 
     # def extract_article_from_json(json_data):
@@ -330,41 +626,8 @@ class Crawler:
     #         print(f"提取法规内容失败: {e}")
     #         return ""
     def extract_article_from_json(self, json_data):
-        """
-        从JSON数据中提取文章内容，并进行格式化处理
-        
-        参数:
-            json_data: JSON字符串或已解析的JSON对象
-            
-        返回:
-            格式化后的文章内容字符串
-        """
-        # 解析JSON
-        data = json.loads(json_data) if isinstance(json_data, str) else json_data
-        
-        # 获取标题和发布时间
-        title = data['data']['title']
-        publish_date = data['data']['publishDate']
-        
-        # 初始化文章内容
-        article = f"# {title}\n\n发布时间: {publish_date}\n\n"
-        
-        # 提取段落内容
-        paragraphs = data['data']['paragraphs']
-        
-        # 按照groupId排序段落
-        paragraphs.sort(key=lambda x: x['groupId'])
-        
-        # 遍历段落并添加到文章中
-        for paragraph in paragraphs:
-            # 清理HTML标签
-            content = re.sub(r'<[^>]+>', '', paragraph['content'])
-            # 跳过空段落
-            if not content.strip():
-                continue
-            article += content + "\n\n"
-        
-        return article
+        """从JSON数据中提取文章内容，见模块级extract_article_from_json"""
+        return extract_article_from_json(json_data)
     def crawl_by_api_responses(self, hierarchy_id, year=2022,if_chufa = 0):
         """根据层级以及年份爬取对应类型的法规
         
@@ -385,36 +648,25 @@ class Crawler:
             print("*"*50+"直接处理处罚案例"+"*"*50)
             #这里直接调用处理函数，不用再调用下载函数
             return 0, 0
-        #读取api_responses文件夹下的json文件
-        dir_path = f'api_responses/hierarchy_{hierarchy_id}_{hierarchy_name}/{year}'
-        if not os.path.exists(dir_path):
-            return 0, 0
-        #循环读取此路径下的json文件，每读一个，爬虫一个
+        #读取api_responses文件夹下的json文件，每读一个，爬虫一个
         total_success = 0
         total_failed = 0
-        for month in range(1, 13):
-            file_path = f'{dir_path}/api_response_{month}.json'
-            print("*"*50)
-            print(f"正在处理{year}年{month}月份的数据")
-            if not os.path.exists(file_path):
-                continue
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # print(data)
-                if not data.get('data'):
-                    raise Exception("无效的数据")
-                
-                for item in data['data']:
-                    # 下载法规详情
-                    success = self.download_regulation(item, hierarchy_id, year)
-                    if success:
-                        total_success += 1
-                    else:
-                        total_failed += 1
-            except Exception as e:
-                print(f"处理文件 {file_path} 时发生错误: {e}")
+        for month, file_path, progress in self._iter_month_items(hierarchy_id, year):
+            if progress is None:
                 total_failed += 1
+                continue
+            # 只下载进度中未完成的条目；失败的条目已转入重试队列，同样记为已处理，之后只重试这些条目；
+            # 其他进程正在下载的、以及失败后没能记入重试队列的条目不记为完成，下一轮再处理
+            for index, item in progress.pending():
+                # 下载法规详情
+                result = self.download_regulation(item, hierarchy_id, year)
+                if result in DOWNLOAD_SETTLED:
+                    progress.complete(index, item)
+                if result == DOWNLOAD_OK:
+                    total_success += 1
+                elif result != DOWNLOAD_CLAIMED:
+                    total_failed += 1
+        timing.report(f"{hierarchy_name} {year}年")
         # print(f"开始爬取 {hierarchy_name}，层级ID: {hierarchy_id}")
         
         # # 确保保存目录存在
@@ -491,3 +743,87 @@ class Crawler:
         
         # print(f"{hierarchy_name} 爬取完成，成功: {total_success}, 失败: {total_failed}")
         return total_success, total_failed
+
+    def retry_failed(self, hierarchy_id, year):
+        """重试指定层级和年份中已到重试时间的失败条目
+
+        Returns:
+            tuple: (本次重试成功数量, 仍在等待重试的数量)，转入死信的条目不计入
+        """
+        recovered = 0
+        for entry in self.failures.due(hierarchy_id, year):
+            print(f"重试失败条目（已失败 {entry['attempts']} 次，{entry['error_class']}）: {entry['title']}")
+            item = {'statuteId': entry['statuteId'], 'title': entry['title']}
+            if self.download_regulation(item, hierarchy_id, year) == DOWNLOAD_OK:
+                self.failures.resolve(entry['statuteId'], hierarchy_id, year)
+                recovered += 1
+        pending = self.failures.pending_count(hierarchy_id, year)
+        if recovered or pending:
+            print(f"{year}年失败条目重试成功: {recovered}, 仍待重试: {pending}")
+        return recovered, pending
+
+    def _defer(self, queue, item):
+        """把失败待重试的任务推迟到失败记录的下次重试时间"""
+        retry_at = self.failures.retry_at(item['statuteId'], item.get('hierarchy_id'), item.get('year'))
+        queue.defer(item, retry_at or time.time())
+
+    def _resolve_retried(self, item):
+        """重试成功的任务从失败重试队列中移除"""
+        if item.get('retry'):
+            self.failures.resolve(item['statuteId'], item.get('hierarchy_id'), item.get('year'))
+
+    def crawl_from_queue(self, queue, batch_size=1, idle_wait=5):
+        """从分布式任务队列领取法规并下载，直到队列中没有等待和租约中的任务
+        
+        Args:
+            queue: WorkQueue实例
+            batch_size: 每次领取的任务数
+            idle_wait: 队列暂时为空但仍有租约未完成时的等待秒数
+            
+        Returns:
+            tuple: (成功爬取数量, 失败数量)
+        """
+        total_success = 0
+        total_failed = 0
+        failed_ids = set()
+        while True:
+            with timing.span('queue.claim'):
+                items = queue.claim(batch_size)
+            if not items:
+                if queue.is_drained():
+                    break
+                # 其他节点的租约可能到期回到队列，稍后再试
+                with timing.span('queue.sleep'):
+                    time.sleep(idle_wait)
+                continue
+            # 又领到了本轮失败过的任务，说明队列里剩下的都在失败，结束本轮交给调度器处理
+            if any(item['statuteId'] in failed_ids for item in items):
+                for item in items:
+                    queue.release(item['statuteId'])
+                break
+            for item in items:
+                result = self.download_regulation(item, item.get('hierarchy_id'), item.get('year'))
+                if result == DOWNLOAD_OK:
+                    queue.ack(item['statuteId'])
+                    self._resolve_retried(item)
+                    total_success += 1
+                elif result == DOWNLOAD_CLAIMED:
+                    # 其他进程正在下载，放回队列，由其成功后写入的去重索引决定是否还需下载
+                    queue.release(item['statuteId'])
+                    failed_ids.add(item['statuteId'])
+                elif result == DOWNLOAD_DEAD:
+                    # 已转入死信的任务不再留在队列中反复领取
+                    queue.ack(item['statuteId'])
+                    total_failed += 1
+                elif result == DOWNLOAD_RETRY:
+                    # 等到重试队列安排的时间再被领取，退避期间不会被反复重试
+                    self._defer(queue, item)
+                    failed_ids.add(item['statuteId'])
+                    total_failed += 1
+                else:
+                    queue.release(item['statuteId'])
+                    failed_ids.add(item['statuteId'])
+                    total_failed += 1
+        print(f"任务队列已处理完毕，成功: {total_success}, 失败: {total_failed}")
+        timing.report("任务队列")
+        return total_success, total_failed
@@ -5,14 +5,22 @@ import time  # 导入time库，用于实现延时功能
 import threading  # 导入threading库，用于实现多线程操作
 import json  # 导入json库，用于处理JSON数据
 import requests  # 导入requests库，用于发送HTTP请求
+from concurrent.futures import ThreadPoolExecutor  # 线程池，用于并发检查token
 from .wechat_login import WechatLogin  # 从当前包中导入WechatLogin类，用于微信登录
 from .crawler import Crawler  # 从当前包中导入Crawler类，用于爬取数据
+from .http_client import get_session, close_session  # 按token复用的HTTP连接池
+from .token_health import get_token_health_cache, classify_response, OUTCOME_OK, OUTCOME_REJECTED  # token健康状态缓存和响应分类
+from .token_budget import get_token_budget  # token每日请求预算
 from .config import (  # 从配置文件导入所需的配置参数
     REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,  # Redis连接参数
     MAX_REQUESTS_PER_COOKIE,  # 每个cookie可以发送的最大请求数
     REQUIRED_TOKEN_COUNT,  # 需要的access_token数量
-    BANKLAW_API_URL  # API基础URL
+    TOKEN_PROBE_WORKERS,  # 并发检查token的线程数
+    BANKLAW_API_URL,  # API基础URL
+    CRAWL_MODE,  # 详情下载模式
+    SUPERVISOR_TOKEN_WAIT  # 工作进程等待主进程补充token的秒数
 )
+from .work_queue import WorkQueue, enqueue_from_api_responses  # 分布式任务队列
 HIERARCHIES = {
     1: "法律法规",
     2: "规章制度",
@@ -20,7 +28,8 @@ HIERARCHIES = {
 }
 
 class CrawlerScheduler:  # 定义爬虫调度器类
-    def __init__(self):  # 初始化方法
+    def __init__(self, allow_login=True):  # 初始化方法
+        """allow_login为False时不弹出扫码登录，由其他进程补充token（多进程分片的工作进程）"""
         self.redis_conn = redis.Redis(  # 创建Redis连接
             host=REDIS_HOST,  # Redis服务器地址
             port=REDIS_PORT,  # Redis服务器端口
@@ -28,11 +37,14 @@ class CrawlerScheduler:  # 定义爬虫调度器类
             password=REDIS_PASSWORD  # Redis连接密码
         )
         self.max_requests_per_cookie = MAX_REQUESTS_PER_COOKIE  # 设置每个cookie的最大请求数
+        self.token_budget = get_token_budget()  # 按token统计当天请求数，由所有请求路径共同扣减
         # self.cookie_usage = {}  # 初始化cookie使用计数字典
         self.lock = threading.Lock()  # 创建线程锁，用于多线程环境下对共享资源的访问控制
         self.access_token = None  # 初始化access_token为None
         self.wechat_login = None
         self.is_running = True
+        self.allow_login = allow_login
+        self.health_cache = get_token_health_cache()  # 带有效期的token健康缓存
         
         # 检查是否已有access_token
         self._check_access_token()
@@ -53,23 +65,36 @@ class CrawlerScheduler:  # 定义爬虫调度器类
             return True
         return False
     
-    def check_token_health(self, token):
-        """检查token是否健康"""
+    def check_token_health(self, token, use_cache=True):
+        """检查token是否健康，缓存未过期时直接使用缓存结果，否则主动探测并写入缓存
+        
+        Args:
+            token: 要检查的access_token
+            use_cache: 是否使用健康缓存，False时强制发起探测请求
+        """
+        if use_cache:
+            cached = self.health_cache.is_healthy(token)
+            if cached is not None:
+                return cached
+        # 今日请求数已用完的token无法探测，次日会自动恢复，不能当作失效移除
+        if self.token_budget.is_exhausted(token):
+            return True
+        healthy, reason = self._probe_token_health(token)
+        if healthy is None:
+            # 被限流、网络错误等无法判断token本身，不写缓存也不移除，下次再探测
+            return True
+        self.health_cache.set(token, healthy, reason)
+        return healthy
+
+    def _probe_token_health(self, token):
+        """发起一次真实的搜索请求探测token是否健康
+        
+        Returns:
+            tuple: (是否健康, 原因)，只有token被拒绝时为False；被限流、服务端错误或网络异常时为None
+        """
         print(f"正在检查token健康状态: {token}...")
         try:
             # 使用token调用一个简单的API，例如获取用户信息
-            headers = {
-                "Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "zh-CN,zh;q=0.9",
-                "Access-Token": token,
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "application/json; charset=utf-8",
-                "Host": "api2.banklaw.com",
-                "Origin": "https://www.banklaw.com",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
-            }
             body = {
                 "pageIndex": 2,
                 "pageSize": 10,
@@ -89,42 +114,75 @@ class CrawlerScheduler:  # 定义爬虫调度器类
             }
             
             # 尝试访问一个简单的API端点
-            response = requests.post(
-                f"https://api2.banklaw.com/search/v1/statutes/search?1742280914627",
-                headers=headers,
+            response = get_session(token).post(
+                f"{BANKLAW_API_URL}/search/v1/statutes/search?1742280914627",
                 json=body,
                 timeout=10
             )
             
             # 检查响应状态码和响应内容
+            response_data = None
             if response.status_code == 200:
-                # 解析响应内容
                 try:
                     response_data = response.json()
-                    # 检查是否有错误码
-                    if 'code' in response_data and response_data['code'] != 0:
-                        error_message = response_data.get('message', '未知错误')
-                        print(f"Token健康检查失败，错误信息: {error_message}")
-                        return False
-                    # 检查是否包含"您今日请求数已超过限制"等错误信息
-                    if 'message' in response_data and '超过限制' in response_data['message']:
-                        print(f"Token健康检查失败，错误信息: {response_data['message']}")
-                        return False
-                    #对目录的非第一页查询是否会跳入第一页
-                    if response_data['data']['pageIndex'] == 0:
-                        return False
-                    print(f"Token健康检查通过: {token[:10]}...")
-                    return True
                 except json.JSONDecodeError:
-                    print(f"Token健康检查失败，无法解析响应内容")
-                    return False
-            else:
-                print(f"Token健康检查失败，状态码: {response.status_code}")
-                return False
+                    print(f"Token健康检查无法解析响应内容")
+                    return None, "无法解析响应内容"
+            # 与目录、详情请求共用同一套分类：错误码、“您今日请求数已超过限制”、非第一页查询被重置到第一页
+            outcome, reason = classify_response(response.status_code, response_data,
+                                                body['pageIndex'], body['pageSize'])
+            if outcome == OUTCOME_OK:
+                print(f"Token健康检查通过: {token[:10]}...")
+                return True, ''
+            if outcome == OUTCOME_REJECTED:
+                print(f"Token健康检查失败，错误信息: {reason}")
+                return False, reason
+            print(f"Token健康检查未能判断token状态: {reason}")
+            return None, reason
         except Exception as e:
             print(f"Token健康检查异常: {e}")
-            return False
+            return None, str(e)
     
+    def _check_tokens_concurrently(self, all_tokens):
+        """并发检查多个token的健康状态，总耗时取决于最慢的一次探测
+        
+        Args:
+            all_tokens: Redis列表access_tokens中的原始数据
+            
+        Returns:
+            list: [(原始数据, token信息字典或None, 是否健康)]，顺序与输入一致
+        """
+        def check(token_data):
+            try:
+                token_info = json.loads(token_data.decode('utf-8'))
+                return token_data, token_info, self.check_token_health(token_info['token'])
+            except Exception as e:
+                print(f"检查token健康状态时出错: {e}")
+                return token_data, None, False
+
+        if not all_tokens:
+            return []
+        max_workers = min(TOKEN_PROBE_WORKERS, len(all_tokens))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(check, all_tokens))
+
+    def _remove_tokens(self, results):
+        """用一个pipeline批量移除不健康或格式错误的token"""
+        if not results:
+            return
+        pipe = self.redis_conn.pipeline()
+        for token_data, token_info, _ in results:
+            pipe.lrem('access_tokens', 0, token_data)
+        pipe.execute()
+        for token_data, token_info, _ in results:
+            if token_info:
+                token = token_info.get('token', '')
+                print(f"移除不健康的token: {token[:10]}... (用户: {token_info.get('user_name', '未知')})")
+                self.health_cache.invalidate(token)
+                close_session(token)
+            else:
+                print("移除格式错误的token")
+
     def get_healthy_token(self):
         """获取一个健康的token"""
         # 获取所有token
@@ -133,32 +191,31 @@ class CrawlerScheduler:  # 定义爬虫调度器类
             print("Redis中没有存储的token")
             return None
             
-        # 随机打乱token顺序，避免总是使用同一个token
-        all_tokens_list = list(all_tokens)
-        random.shuffle(all_tokens_list)
-        
-        for token_data in all_tokens_list:
-            try:
-                # 解析token数据（包含token和用户信息）
-                token_info = json.loads(token_data.decode('utf-8'))
-                token = token_info['token']
-                user_name = token_info.get('user_name', '未知')
-                
-                # 进行健康检查
-                if self.check_token_health(token):
-                    print(f"找到健康的token: {token[:10]}... (用户: {user_name})")
-                    return token
-                else:
-                    # 移除不健康的token
-                    print(f"移除不健康的token: {token[:10]}... (用户: {user_name})")
-                    self.redis_conn.lrem('access_tokens', 0, token_data)
-            except Exception as e:
-                print(f"检查token健康状态时出错: {e}")
-                # 移除格式错误的token
-                self.redis_conn.lrem('access_tokens', 0, token_data)
-                
-        return None
+        # 并发检查所有token，缓存未过期的token不会发请求
+        results = self._check_tokens_concurrently(all_tokens)
+        healthy = {info['token']: info for data, info, ok in results if ok}
+        self._remove_tokens([r for r in results if not r[2]])
+        if not healthy:
+            return None
+            
+        # 选择今日用量最少的token，使各token的请求数均匀增长
+        token = self.token_budget.pick(list(healthy))
+        if token is None:
+            print(f"所有健康token今日请求数都已接近上限 {self.max_requests_per_cookie}")
+            return None
+        token_info = healthy[token]
+        print(f"找到健康的token: {token[:10]}... (用户: {token_info.get('user_name', '未知')}，"
+              f"今日已请求 {self.token_budget.usage(token)} 次)")
+        return token
     
+    def get_healthy_tokens(self):
+        """获取当前所有健康的token，供目录并发抓取等需要token池的场景使用"""
+        all_tokens = self.redis_conn.lrange('access_tokens', 0, -1)
+        results = self._check_tokens_concurrently(all_tokens)
+        self._remove_tokens([r for r in results if not r[2]])
+        # 今日请求数已接近上限的token不再分配任务，用量少的排在前面
+        return self.token_budget.available(info['token'] for _, info, ok in results if ok)
+
     def get_access_token(self):  # 获取access_token的方法
         """获取access_token，如果Redis中存在则使用，否则返回None"""
         with self.lock:  # 使用线程锁，确保对共享资源的安全访问
@@ -204,6 +261,10 @@ class CrawlerScheduler:  # 定义爬虫调度器类
             print(f"Redis中已有足够的token: {token_count} 个")
             return True
         
+        if not self.allow_login:
+            # 不在本进程扫码，先用池中已有的token
+            return False
+        
         print(f"需要获取 {needed_tokens} 个新token")
         
         # 连续获取多个token
@@ -232,31 +293,37 @@ class CrawlerScheduler:  # 定义爬虫调度器类
             return
             
         print("\n当前Token状态:")
-        print("-" * 80)
-        print(f"{'用户':20} {'创建时间':20} {'过期时间':20} {'状态':10}")
-        print("-" * 80)
+        print("-" * 100)
+        print(f"{'用户':20} {'创建时间':20} {'过期时间':20} {'状态':10} {'检查时间':20} {'今日请求':10}")
+        print("-" * 100)
         
-        for token_data in all_tokens:
-            try:
-                token_info = json.loads(token_data.decode('utf-8'))
-                token = token_info.get('token', '')
-                user_name = token_info.get('user_name', '未知')
-                created_at = token_info.get('created_at', '未知')
-                expires_at = token_info.get('expires_at', '未知')
-                
-                # 检查token健康状态
-                is_healthy = self.check_token_health(token)
-                status = "正常" if is_healthy else "失效"
-                
-                print(f"{user_name:20} {created_at:20} {expires_at:20} {status:10}")
-            except Exception as e:
-                print(f"无法解析token数据: {e}")
+        # 并发检查，缓存未过期的token不会发请求
+        results = self._check_tokens_concurrently(all_tokens)
+        usage = self.token_budget.usage_many([info['token'] for _, info, _ in results if info])
+        for token_data, token_info, is_healthy in results:
+            if token_info is None:
+                print("无法解析token数据")
+                continue
+            token = token_info.get('token', '')
+            user_name = token_info.get('user_name', '未知')
+            created_at = token_info.get('created_at', '未知')
+            expires_at = token_info.get('expires_at', '未知')
+            status = "正常" if is_healthy else "失效"
+            entry = self.health_cache.get(token)
+            checked_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['checked_at'])) if entry else '未知'
+            
+            used = f"{usage.get(token, 0)}/{self.max_requests_per_cookie or '不限'}"
+            print(f"{user_name:20} {created_at:20} {expires_at:20} {status:10} {checked_at:20} {used:10}")
                 
-        print("-" * 80)
+        print("-" * 100)
     
  
     def refresh_access_token(self):  # 刷新access_token的方法
         """刷新access_token"""
+        if not self.allow_login:
+            print(f"本进程不扫码登录，等待主进程补充token，{SUPERVISOR_TOKEN_WAIT} 秒后重试")
+            time.sleep(SUPERVISOR_TOKEN_WAIT)
+            return False
         try:
             self.wechat_login = WechatLogin()
             login_success = False
@@ -290,6 +357,14 @@ class CrawlerScheduler:  # 定义爬虫调度器类
         if self.wechat_login:
             self.wechat_login.stop()
         
+    def _create_crawler(self, access_token):
+        """根据CRAWL_MODE创建爬虫实例，两种模式的crawl_by_api_responses返回值一致"""
+        if CRAWL_MODE == 'async':
+            # 仅在并发模式下才需要aiohttp
+            from .async_crawler import AsyncCrawler
+            return AsyncCrawler(access_token=access_token)
+        return Crawler(access_token=access_token)
+
     def start_crawler(self, hierarchy_id=1, year=2022,if_chufa = 0):  # 修改方法参数
         """启动爬虫，爬取banklaw.com的法规
         
@@ -313,7 +388,7 @@ class CrawlerScheduler:  # 定义爬虫调度器类
                         print(f"使用access_token: {access_token[:10]}... 爬取banklaw.com")
                         
                         # 创建爬虫实例，只传入access_token
-                        crawler = Crawler(access_token=access_token)
+                        crawler = self._create_crawler(access_token)
                         
                         # 使用指定的层级ID爬取内容
                         total, failed = crawler.crawl_by_api_responses(hierarchy_id, year,if_chufa)
@@ -357,15 +432,24 @@ class CrawlerScheduler:  # 定义爬虫调度器类
                     print(f"使用access_token: {access_token[:10]}... 爬取banklaw.com")
                     
                     # 创建爬虫实例，只传入access_token
-                    crawler = Crawler(access_token=access_token)
+                    crawler = self._create_crawler(access_token)
                     
                     # 使用指定的层级ID爬取内容
                     total, failed = crawler.crawl_by_api_responses(hierarchy_id, year,if_chufa)
+                    # 只重试失败的条目，已到重试时间的才发请求
+                    recovered, pending = crawler.retry_failed(hierarchy_id, year)
                     
-                    print(f"爬取完成，共下载 {total} 条{hierarchy_name}，失败 {failed} 条")
-                    #这里需要根据一定条件跳出循环，这里可以根据failed的数量来判断
-                    if failed == 0:
+                    print(f"爬取完成，共下载 {total} 条{hierarchy_name}，失败 {failed} 条，待重试 {pending} 条")
+                    #失败的条目都已重试成功或转入死信时结束，死信不再阻塞本年份
+                    if failed == 0 and pending == 0:
                         break
+                    if total == 0 and failed == 0:
+                        # 本轮没有新条目要下载，只剩退避中的失败条目，与token无关，等到最早的重试时间
+                        next_retry_at = crawler.failures.next_retry_at(hierarchy_id, year)
+                        wait = max(1, next_retry_at - time.time()) if next_retry_at else 1
+                        print(f"只剩 {pending} 条等待重试，{wait:.0f} 秒后到期")
+                        time.sleep(wait)
+                        continue
                     # 如果失败率过高，可能是token失效
                     if total == 0 or (total > 0 and failed / total > 0.5):
                         print("失败率过高，可能access_token已失效")
@@ -386,6 +470,44 @@ class CrawlerScheduler:  # 定义爬虫调度器类
                 self.refresh_access_token()  # 获取新token
                 time.sleep(5)  # 等待5秒后继续
 
+    def start_queue_worker(self, enqueue_existing=True, idle_wait=5):
+        """以任务队列工作进程的方式运行，可在任意多台机器上同时启动
+
+        Args:
+            enqueue_existing: 启动前是否把本机已有的目录文件入队（重复入队会被忽略）
+            idle_wait: 一轮没有任何进展时（如任务都在其他节点下载中）等待的秒数
+        """
+        queue = WorkQueue()
+        if enqueue_existing:
+            enqueue_from_api_responses(queue)
+
+        while not queue.is_drained():
+            access_token = self.get_access_token()
+            if not access_token:
+                print("没有可用的access_token，尝试获取...")
+                self.refresh_access_token()
+                time.sleep(5)
+                continue
+            try:
+                print(f"使用access_token: {access_token[:10]}... 消费任务队列，当前状态: {queue.stats()}")
+                crawler = self._create_crawler(access_token)
+                total, failed = crawler.crawl_from_queue(queue, idle_wait=idle_wait)
+                print(f"本轮完成，成功 {total} 条，失败 {failed} 条")
+                if total == 0 and failed > 0:
+                    # 失败的任务已推迟到各自的重试时间，等到最早的重试时间再开始下一轮
+                    next_retry_at = crawler.failures.next_retry_at()
+                    wait = max(1, next_retry_at - time.time()) if next_retry_at else 5
+                    print(f"本轮没有任何进展，{wait:.0f} 秒后重试，队列状态: {queue.stats()}")
+                    time.sleep(wait)
+                elif total == 0:
+                    # 领到的任务都在其他节点下载中，稍后再领取，避免反复领取和放回
+                    print(f"领到的任务都在其他节点处理中，{idle_wait} 秒后重试，队列状态: {queue.stats()}")
+                    time.sleep(idle_wait)
+            except Exception as e:
+                print(f"消费任务队列失败: {e}")
+                time.sleep(5)
+        print("任务队列已清空")
+
     def check_year_data(self, hierarchy_id, year):
         """检查指定层级和年份的数据是否已爬取"""
         file_lujing = f"downloaded_regulations/hierarchy_{hierarchy_id}_{HIERARCHIES[hierarchy_id]}/{year}"
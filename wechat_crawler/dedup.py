@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按statuteId/casusId去重的下载索引
+已下载的ID保存在Redis集合中，本进程内保留一份内存镜像；
+下载前先检查索引并以短期租约占用该ID，写入成功后原子地记入索引并释放占用，
+多个进程、多台机器不会重复下载同一篇文档
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+
+import redis
+
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    SAVE_DIR, DEDUP_CLAIM_TTL
+)
+
+# 写入完成：记入已下载集合并释放占用
+# KEYS: 已下载集合, 占用键；ARGV: id
+MARK_DONE_SCRIPT = """
+redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+
+class DedupIndex:
+    """分布式下载去重索引"""
+
+    def __init__(self, name='statutes', redis_conn=None, claim_ttl=None):
+        """初始化去重索引
+
+        Args:
+            name: 索引名称，法规使用statutes，处罚案例使用casus
+            redis_conn: Redis连接，默认按配置文件新建
+            claim_ttl: 下载占用的有效期（秒），进程崩溃后占用会自动释放
+        """
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self.claim_ttl = claim_ttl or DEDUP_CLAIM_TTL
+        self.done_key = f"crawl:dedup:{name}"
+        self.claim_prefix = f"crawl:dedup:{name}:claim:"
+        # 文件路径 -> 写入该文件的ID，区分同名的不同法规
+        self.files_key = f"crawl:dedup:{name}:files"
+        self._local = set()
+        self._lock = threading.Lock()
+        self._mark_done = self.redis_conn.register_script(MARK_DONE_SCRIPT)
+
+    def contains(self, doc_id):
+        """ID是否已下载，先查内存镜像，未命中再查Redis"""
+        with self._lock:
+            if doc_id in self._local:
+                return True
+        if self.redis_conn.sismember(self.done_key, doc_id):
+            with self._lock:
+                self._local.add(doc_id)
+            return True
+        return False
+
+    def claim(self, doc_id):
+        """占用一个ID准备下载
+
+        Returns:
+            bool: True表示由本进程下载；已下载或其他进程正在下载时返回False
+        """
+        if self.contains(doc_id):
+            return False
+        return bool(self.redis_conn.set(self.claim_prefix + doc_id, 1, nx=True, ex=self.claim_ttl))
+
+    def mark_done(self, doc_id, path=None):
+        """写入成功后记入索引并释放占用，path为写入的文件时同时记录该文件属于此ID"""
+        self._mark_done(keys=[self.done_key, self.claim_prefix + doc_id], args=[doc_id])
+        with self._lock:
+            self._local.add(doc_id)
+        if path:
+            self.claim_file(path, doc_id)
+
+    def claim_file(self, path, doc_id):
+        """记录文件属于doc_id，文件已属于其他ID时不覆盖
+
+        Returns:
+            bool: 文件是否属于doc_id
+        """
+        if self.redis_conn.hsetnx(self.files_key, path, doc_id):
+            return True
+        return self.file_owner(path) == doc_id
+
+    def file_owner(self, path):
+        """写入该文件的ID，没有记录时返回None"""
+        owner = self.redis_conn.hget(self.files_key, path)
+        return owner.decode('utf-8') if owner is not None else None
+
+    def files_by_id(self):
+        """已记录归属的文件 {ID: 文件路径}"""
+        files = {}
+        for path, doc_id in self.redis_conn.hscan_iter(self.files_key, count=1000):
+            files[doc_id.decode('utf-8')] = path.decode('utf-8')
+        return files
+
+    def release(self, doc_id):
+        """下载失败时释放占用，允许其他进程重试"""
+        self.redis_conn.delete(self.claim_prefix + doc_id)
+
+    def warm_up(self, batch_size=10000):
+        """把Redis中的已下载集合整体加载到内存镜像"""
+        loaded = 0
+        for doc_id in self.redis_conn.sscan_iter(self.done_key, count=batch_size):
+            with self._lock:
+                self._local.add(doc_id.decode('utf-8'))
+            loaded += 1
+        return loaded
+
+    def size(self):
+        return self.redis_conn.scard(self.done_key)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_dedup_index(name='statutes'):
+    """获取进程内共享的去重索引，同一名称只建一个内存镜像"""
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            index = DedupIndex(name)
+            _indexes[name] = index
+        return index
+
+
+def assign_paths(records, save_dir=None, index=None, taken=None):
+    """按下载时确定的文件归属为文档分配文本文件路径，用于离线重新渲染和建立索引
+
+    去重索引记录了文件属于哪个ID的，沿用该文件；没有记录的使用{标题}.txt，
+    该路径已属于其他ID时改用带ID的文件名，与Crawler._resolve_path一致
+
+    Args:
+        records: 可迭代的(ID, 标题, 层级ID, 年份)
+        save_dir: 输出目录，与SAVE_DIR不同时把记录的路径换到该目录下
+        index: DedupIndex，默认取get_dedup_index()，读取失败时只按标题分配
+        taken: 其他已被占用的路径 {路径: ID}
+
+    Returns:
+        dict: {ID: 路径}
+    """
+    from .crawler import regulation_path
+    save_dir = save_dir or SAVE_DIR
+    try:
+        recorded = (index or get_dedup_index()).files_by_id()
+    except redis.RedisError as e:
+        print(f"读取去重索引的文件归属失败，只按标题分配路径: {e}")
+        recorded = {}
+    owners = dict(taken or {})
+    files = {}
+    for doc_id, path in recorded.items():
+        relative = os.path.relpath(path, SAVE_DIR)
+        if relative.startswith(os.pardir):
+            continue
+        path = os.path.join(save_dir, relative)
+        owners[path] = doc_id
+        files[doc_id] = path
+    paths = {}
+    for doc_id, title, hierarchy_id, year in records:
+        path = files.get(doc_id)
+        if path is None:
+            path = regulation_path(save_dir, title, hierarchy_id, year)
+            if owners.setdefault(path, doc_id) != doc_id:
+                path = regulation_path(save_dir, title, hierarchy_id, year, doc_id)
+        paths[doc_id] = path
+    return paths
+
+
+def bootstrap_from_disk(index, base_dir='api_responses', save_dir=SAVE_DIR):
+    """根据目录文件和已下载的文本文件重建去重索引，用于迁移旧数据
+
+    目录文件记录了statuteId和标题，对应的{标题}.txt已存在时视为已下载；
+    同名的多篇法规只有第一篇（或文件已记录属于的那篇）记入索引，其余的之后以带ID的文件名下载
+
+    Returns:
+        int: 新记入索引的数量
+    """
+    pattern = os.path.join(base_dir, 'hierarchy_*', '*', 'api_response_*.json')
+    added = 0
+    for file_path in sorted(glob.glob(pattern)):
+        year_dir = os.path.dirname(file_path)
+        hierarchy_dir = os.path.basename(os.path.dirname(year_dir))
+        if not re.match(r'hierarchy_\d+_', hierarchy_dir):
+            continue
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取目录文件 {file_path} 失败: {e}")
+            continue
+        ids = []
+        for item in data.get('data') or []:
+            statute_id = item.get('statuteId')
+            path = os.path.join(save_dir, hierarchy_dir, os.path.basename(year_dir), f"{item.get('title')}.txt")
+            if statute_id and os.path.exists(path) and index.claim_file(path, statute_id):
+                ids.append(statute_id)
+        if ids:
+            added += index.redis_conn.sadd(index.done_key, *ids)
+    print(f"去重索引重建完成，新增 {added} 个ID，索引共 {index.size()} 个ID")
+    return added
+
+
+if __name__ == "__main__":
+    bootstrap_from_disk(DedupIndex())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+语料导出
+把原始响应归档按层级和年份分区导出为Parquet和JSONL分片，下游分析不用再逐个打开文本文件，
+同时保留发文字号、发布机构、生效日期等渲染文本时丢弃的字段
+
+输出目录（Hive分区格式，pandas/pyarrow/duckdb/spark可以直接按目录读取）：
+  {EXPORT_DIR}/parquet/hierarchy_id={层级ID}/year={年份}/part-{批次}-{序号}.parquet
+  {EXPORT_DIR}/jsonl/hierarchy_id={层级ID}/year={年份}/part-{批次}-{序号}.jsonl
+每种格式目录下的_state.json记录各归档索引文件已导出到的字节位置，_ids.txt记录已导出的statuteId，
+再次运行时只追加新文档，已有的分片文件不会改写
+
+用法: python -m wechat_crawler.export [--format parquet,jsonl] [--workers 进程数]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .archive import iter_index_from, decompress_frame
+from .config import ARCHIVE_DIR, EXPORT_DIR, EXPORT_FORMATS, EXPORT_BATCH_BYTES
+
+# 导出的列，顺序即Parquet文件中的列顺序
+COLUMNS = [
+    'statute_id', 'title', 'document_no', 'publish_date', 'effective_date',
+    'hierarchy_id', 'hierarchy_name', 'year', 'department', 'fetched_at', 'body',
+]
+FORMAT_EXT = {'parquet': '.parquet', 'jsonl': '.jsonl'}
+# 分区值缺失时使用Hive的默认分区名
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _parquet_schema():
+    return pyarrow.schema([
+        ('statute_id', pyarrow.string()),
+        ('title', pyarrow.string()),
+        ('document_no', pyarrow.string()),
+        ('publish_date', pyarrow.string()),
+        ('effective_date', pyarrow.string()),
+        ('hierarchy_id', pyarrow.int32()),
+        ('hierarchy_name', pyarrow.string()),
+        ('year', pyarrow.int32()),
+        ('department', pyarrow.string()),
+        ('fetched_at', pyarrow.int64()),
+        ('body', pyarrow.string()),
+    ])
+
+
+def _record_year(record, detail):
+    """分区年份：优先取抓取时的年份，其次取发布日期的年份"""
+    if record.get('year') is not None:
+        return int(record['year'])
+    publish_date = detail.get('publishDate') or ''
+    return int(publish_date[:4]) if publish_date[:4].isdigit() else None
+
+
+def _decode_chunk(archive_dir, records):
+    """在子进程中解压并整理一批归档记录，同一分片只打开一次
+
+    Returns:
+        tuple: (行列表, 失败列表[(id, 错误)])
+    """
+    from .crawler import HIERARCHIES, render_paragraphs
+
+    handles = {}
+    rows = []
+    failed = []
+    try:
+        for record in records:
+            try:
+                shard = record['shard']
+                if shard not in handles:
+                    handles[shard] = open(os.path.join(archive_dir, shard), 'rb')
+                f = handles[shard]
+                f.seek(record['offset'])
+                data = json.loads(decompress_frame(f.read(record['length']), os.path.splitext(shard)[1]))
+                detail = data['data']
+                hierarchy_id = record.get('hierarchy_id')
+                rows.append({
+                    'statute_id': record['id'],
+                    'title': detail.get('title') or record.get('title'),
+                    'document_no': detail.get('documentNo'),
+                    'publish_date': detail.get('publishDate'),
+                    'effective_date': detail.get('effectiveDate'),
+                    'hierarchy_id': hierarchy_id,
+                    'hierarchy_name': HIERARCHIES.get(hierarchy_id) if hierarchy_id else None,
+                    'year': _record_year(record, detail),
+                    'department': detail.get('publishingDepartment') or detail.get('department'),
+                    'fetched_at': record.get('fetched_at'),
+                    'body': render_paragraphs(detail.get('paragraphs') or []),
+                })
+            except Exception as e:
+                failed.append((record.get('id'), str(e)))
+    finally:
+        for f in handles.values():
+            f.close()
+    return rows, failed
+
+
+def _write_parquet(rows, file_path):
+    table = pyarrow.Table.from_pydict({col: [row[col] for row in rows] for col in COLUMNS},
+                                      schema=_parquet_schema())
+    pyarrow.parquet.write_table(table, file_path, compression='zstd')
+
+
+def _write_jsonl(rows, file_path):
+    # 整批序列化后一次写入
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+
+
+_WRITERS = {'parquet': _write_parquet, 'jsonl': _write_jsonl}
+
+
+class CorpusExporter:
+    """把归档增量导出为分区分片，每种格式单独记录进度"""
+
+    def __init__(self, export_dir=None, formats=None, archive_dir=None, batch_bytes=None):
+        """初始化导出器
+
+        Args:
+            export_dir: 导出目录，默认取EXPORT_DIR
+            formats: 导出格式列表，可选parquet、jsonl，默认取EXPORT_FORMATS
+            archive_dir: 归档目录，默认取ARCHIVE_DIR
+            batch_bytes: 内存中累积多少正文字节后写出一批分片
+        """
+        self.export_dir = export_dir or EXPORT_DIR
+        self.archive_dir = archive_dir or ARCHIVE_DIR
+        self.batch_bytes = batch_bytes or EXPORT_BATCH_BYTES
+        formats = list(formats or EXPORT_FORMATS)
+        for fmt in formats:
+            if fmt not in _WRITERS:
+                raise ValueError(f"不支持的导出格式: {fmt}")
+        if 'parquet' in formats and pyarrow is None:
+            print("未安装pyarrow，跳过Parquet导出")
+            formats.remove('parquet')
+        if not formats:
+            raise ValueError("没有可用的导出格式")
+        self.formats = formats
+        # 本次运行写出的文件名前缀，保证多次运行的分片不重名
+        self.batch_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self._seq = 0
+        self.offsets = {}
+        self.exported = {}
+        for fmt in self.formats:
+            self.offsets[fmt], self.exported[fmt] = self._load_state(fmt)
+
+    def _format_dir(self, fmt):
+        return os.path.join(self.export_dir, fmt)
+
+    def _load_state(self, fmt):
+        """读取某种格式的导出进度：({索引文件名: 字节位置}, 已导出的statuteId集合)"""
+        offsets = {}
+        exported = set()
+        state_path = os.path.join(self._format_dir(fmt), '_state.json')
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                offsets = json.load(f).get('offsets', {})
+        ids_path = os.path.join(self._format_dir(fmt), '_ids.txt')
+        if os.path.exists(ids_path):
+            with open(ids_path, 'r', encoding='utf-8') as f:
+                exported = {line.rstrip("\n") for line in f if line.strip()}
+        return offsets, exported
+
+    def _save_offsets(self, fmt, offsets):
+        os.makedirs(self._format_dir(fmt), exist_ok=True)
+        state_path = os.path.join(self._format_dir(fmt), '_state.json')
+        tmp_path = f"{state_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'offsets': offsets, 'documents': len(self.exported[fmt]),
+                       'updated_at': int(time.time())}, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+
+    def plan(self):
+        """读取新增的索引记录，确定每篇文档要导出到哪些格式
+
+        同一ID在归档中出现多次时取最后一次；已导出过的ID跳过
+
+        Returns:
+            tuple: ([(索引记录, 目标格式集合)]按分片和偏移排序, {格式: 新的索引位置})
+        """
+        start_offsets = {}
+        for fmt in self.formats:
+            for name, position in self.offsets[fmt].items():
+                start_offsets[name] = min(position, start_offsets.get(name, position))
+        # 某种格式从未读过的索引文件要从头读
+        for fmt in self.formats:
+            for name in start_offsets:
+                if name not in self.offsets[fmt]:
+                    start_offsets[name] = 0
+
+        new_offsets = {fmt: dict(self.offsets[fmt]) for fmt in self.formats}
+        latest = {}
+        for name, start, end, record in iter_index_from(start_offsets, self.archive_dir):
+            targets = set()
+            for fmt in self.formats:
+                if start < self.offsets[fmt].get(name, 0):
+                    continue
+                new_offsets[fmt][name] = end
+                if record['id'] not in self.exported[fmt]:
+                    targets.add(fmt)
+            if targets:
+                latest[record['id']] = (record, targets)
+        jobs = sorted(latest.values(), key=lambda job: (job[0]['shard'], job[0]['offset']))
+        return jobs, new_offsets
+
+    def _flush(self, partitions):
+        """每个分区每种格式写出一个分片文件，写完后登记已导出的ID"""
+        written = {fmt: [] for fmt in self.formats}
+        for (hierarchy_id, year), items in partitions.items():
+            partition = os.path.join(
+                f"hierarchy_id={DEFAULT_PARTITION if hierarchy_id is None else hierarchy_id}",
+                f"year={DEFAULT_PARTITION if year is None else year}"
+            )
+            for fmt in self.formats:
+                rows = [row for row, targets in items if fmt in targets]
+                if not rows:
+                    continue
+                directory = os.path.join(self._format_dir(fmt), partition)
+                os.makedirs(directory, exist_ok=True)
+                file_path = os.path.join(directory, f"part-{self.batch_id}-{self._seq:05d}{FORMAT_EXT[fmt]}")
+                tmp_path = f"{file_path}.tmp"
+                _WRITERS[fmt](rows, tmp_path)
+                os.replace(tmp_path, file_path)
+                written[fmt].extend(row['statute_id'] for row in rows)
+            self._seq += 1
+        # 数据文件落盘后再登记ID，中途中断重跑时不会重复导出
+        for fmt, ids in written.items():
+            if not ids:
+                continue
+            with open(os.path.join(self._format_dir(fmt), '_ids.txt'), 'a', encoding='utf-8') as f:
+                f.write("".join(doc_id + "\n" for doc_id in ids))
+            self.exported[fmt].update(ids)
+
+    def run(self, workers=None, chunk_size=200):
+        """执行增量导出
+
+        Args:
+            workers: 解压和解析的进程数，默认为CPU核数
+            chunk_size: 每个子任务处理的记录数
+
+        Returns:
+            tuple: (导出文档数, 失败数)
+        """
+        jobs, new_offsets = self.plan()
+        if not jobs:
+            for fmt in self.formats:
+                self._save_offsets(fmt, new_offsets[fmt])
+            print(f"没有需要导出的新文档，格式: {', '.join(self.formats)}")
+            return 0, 0
+        workers = workers or os.cpu_count() or 1
+        targets = {}
+        for record, fmts in jobs:
+            targets[record['id']] = fmts
+        chunks = [[record for record, _ in jobs[i:i + chunk_size]] for i in range(0, len(jobs), chunk_size)]
+        print(f"开始导出 {len(jobs)} 篇文档，格式: {', '.join(self.formats)}，进程数: {workers}")
+
+        start = time.time()
+        exported = 0
+        failed_count = 0
+        body_bytes = 0
+        partitions = {}
+        buffered = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 分批提交，避免解析结果在内存中堆积
+            wave = workers * 4
+            for i in range(0, len(chunks), wave):
+                futures = [executor.submit(_decode_chunk, self.archive_dir, chunk) for chunk in chunks[i:i + wave]]
+                for future in futures:
+                    rows, failed = future.result()
+                    for doc_id, error in failed:
+                        print(f"导出失败: {doc_id} {error}")
+                    failed_count += len(failed)
+                    for row in rows:
+                        partitions.setdefault((row['hierarchy_id'], row['year']), []).append(
+                            (row, targets[row['statute_id']]))
+                        buffered += len(row['body'])
+                    exported += len(rows)
+                if buffered >= self.batch_bytes:
+                    self._flush(partitions)
+                    body_bytes += buffered
+                    partitions = {}
+                    buffered = 0
+                elapsed = time.time() - start
+                print(f"进度: {exported + failed_count}/{len(jobs)}，{(exported + failed_count) / elapsed:.1f} 篇/秒")
+        if partitions:
+            self._flush(partitions)
+            body_bytes += buffered
+        # 全部写完才推进索引位置；失败的记录不登记ID，下次从头读取索引时会重试
+        for fmt in self.formats:
+            self._save_offsets(fmt, new_offsets[fmt] if not failed_count else self.offsets[fmt])
+
+        elapsed = time.time() - start
+        print(f"导出完成，成功: {exported}, 失败: {failed_count}，耗时 {elapsed:.1f} 秒，"
+              f"{exported / elapsed:.1f} 篇/秒，正文 {body_bytes / elapsed / 1024 / 1024:.1f} MB/秒")
+        return exported, failed_count
+
+
+def export_corpus(export_dir=None, formats=None, archive_dir=None, workers=None, chunk_size=200):
+    """把归档中新增的文档导出为分区分片，返回(导出文档数, 失败数)"""
+    return CorpusExporter(export_dir, formats, archive_dir).run(workers, chunk_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把原始响应归档导出为按层级和年份分区的Parquet/JSONL分片")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help="归档目录")
+    parser.add_argument('--export-dir', default=EXPORT_DIR, help="导出目录")
+    parser.add_argument('--format', default=','.join(EXPORT_FORMATS), help="导出格式，逗号分隔，可选parquet、jsonl")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument('--chunk-size', type=int, default=200, help="每个子任务处理的记录数")
+    args = parser.parse_args()
+    export_corpus(args.export_dir, [fmt for fmt in args.format.split(',') if fmt], args.archive_dir,
+                  args.workers, args.chunk_size)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+下载失败的条目及其重试计划
+每个失败条目记录错误类别、错误信息和尝试次数，按指数退避加随机抖动安排下次重试；
+尝试RETRY_MAX_ATTEMPTS次仍失败的条目转入死信，不再自动重试，可通过API查看或重新入队
+
+token不可用、限流、今日预算用完等与条目本身无关的失败只推迟重试，不计入尝试次数
+
+Redis结构:
+    crawl:retry:statutes:{层级}:{年份}        有序集合，成员为statuteId，分数为下次重试时间
+    crawl:retry:statutes:{层级}:{年份}:items  哈希，statuteId -> 失败记录JSON
+    crawl:deadletter:statutes                哈希，statuteId -> 失败记录JSON
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+import redis
+import requests
+
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+)
+from .token_budget import TokenBudgetExceeded
+
+# 与条目本身无关的错误类别，不计入尝试次数
+TOKEN_ERROR_CLASSES = {'token', 'token_budget', 'throttled', 'http_401', 'http_403', 'http_429'}
+
+
+class DownloadHTTPError(Exception):
+    """详情接口返回非200状态码"""
+
+    def __init__(self, status):
+        super().__init__(f"下载法规失败: {status}")
+        self.status = status
+
+
+class TokenUnavailableError(Exception):
+    """响应表明access_token不可用（如今日请求数已超过限制）"""
+
+
+class ThrottledError(TokenUnavailableError):
+    """响应表明请求被限流（HTTP 429、超过限制等），降速后可以重试"""
+
+
+def error_class(exc):
+    """把异常归类为便于统计和判断是否重试的类别"""
+    if isinstance(exc, TokenBudgetExceeded):
+        return 'token_budget'
+    if isinstance(exc, ThrottledError):
+        return 'throttled'
+    if isinstance(exc, TokenUnavailableError):
+        return 'token'
+    if isinstance(exc, DownloadHTTPError):
+        return f"http_{exc.status}"
+    if isinstance(exc, (requests.exceptions.RequestException, asyncio.TimeoutError, ConnectionError)):
+        return 'network'
+    # aiohttp是可选依赖，按模块名判断即可
+    if type(exc).__module__.startswith('aiohttp'):
+        return 'network'
+    if isinstance(exc, ValueError):
+        return 'parse'
+    if isinstance(exc, OSError):
+        return 'io'
+    return 'other'
+
+
+def backoff_delay(attempts, base=None, cap=None):
+    """第attempts次失败后的等待秒数：指数退避，在[一半, 全部]之间随机抖动"""
+    base = RETRY_BASE_DELAY if base is None else base
+    cap = RETRY_MAX_DELAY if cap is None else cap
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+class FailureStore:
+    """失败条目的重试队列和死信"""
+
+    def __init__(self, name='statutes', redis_conn=None, max_attempts=None):
+        """初始化
+
+        Args:
+            name: 文档类型，法规使用statutes
+            redis_conn: Redis连接，默认按配置文件新建
+            max_attempts: 转入死信前的最大尝试次数，默认取RETRY_MAX_ATTEMPTS
+        """
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self.name = name
+        self.max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+        self.dead_key = f"crawl:deadletter:{name}"
+
+    def _keys(self, hierarchy_id, year):
+        schedule_key = f"crawl:retry:{self.name}:{hierarchy_id}:{year}"
+        return schedule_key, schedule_key + ":items"
+
+    def record_failure(self, item, hierarchy_id, year, exc):
+        """记录一次失败并安排重试，达到最大尝试次数时转入死信
+
+        Returns:
+            str: 'retry'或'dead'
+        """
+        statute_id = item.get('statuteId') or item.get('id')
+        schedule_key, items_key = self._keys(hierarchy_id, year)
+        now = time.time()
+        raw = self.redis_conn.hget(items_key, statute_id)
+        entry = json.loads(raw) if raw else {
+            'statuteId': statute_id,
+            'title': item.get('title'),
+            'hierarchy_id': hierarchy_id,
+            'year': year,
+            'attempts': 0,
+            'first_failed_at': now,
+        }
+        entry['error_class'] = error_class(exc)
+        entry['error'] = str(exc)[:500]
+        entry['last_failed_at'] = now
+        if entry['error_class'] not in TOKEN_ERROR_CLASSES:
+            entry['attempts'] += 1
+
+        pipe = self.redis_conn.pipeline()
+        if entry['attempts'] >= self.max_attempts:
+            entry.pop('next_retry_at', None)
+            pipe.zrem(schedule_key, statute_id)
+            pipe.hdel(items_key, statute_id)
+            pipe.hset(self.dead_key, statute_id, json.dumps(entry, ensure_ascii=False))
+            pipe.execute()
+            print(f"已尝试 {entry['attempts']} 次仍失败，转入死信: {entry['title']} ({entry['error_class']})")
+            return 'dead'
+        entry['next_retry_at'] = now + backoff_delay(max(1, entry['attempts']))
+        pipe.hset(items_key, statute_id, json.dumps(entry, ensure_ascii=False))
+        pipe.zadd(schedule_key, {statute_id: entry['next_retry_at']})
+        pipe.execute()
+        return 'retry'
+
+    def resolve(self, statute_id, hierarchy_id, year):
+        """条目重试成功后移出重试队列"""
+        schedule_key, items_key = self._keys(hierarchy_id, year)
+        pipe = self.redis_conn.pipeline()
+        pipe.zrem(schedule_key, statute_id)
+        pipe.hdel(items_key, statute_id)
+        pipe.execute()
+
+    def due(self, hierarchy_id, year, limit=None):
+        """已到重试时间的失败记录，按到期时间排列"""
+        schedule_key, items_key = self._keys(hierarchy_id, year)
+        if limit:
+            ids = self.redis_conn.zrangebyscore(schedule_key, '-inf', time.time(), start=0, num=limit)
+        else:
+            ids = self.redis_conn.zrangebyscore(schedule_key, '-inf', time.time())
+        if not ids:
+            return []
+        return [json.loads(raw) for raw in self.redis_conn.hmget(items_key, ids) if raw]
+
+    def pending_count(self, hierarchy_id, year):
+        """等待重试的条目数（不含死信）"""
+        schedule_key, _ = self._keys(hierarchy_id, year)
+        return self.redis_conn.zcard(schedule_key)
+
+    def retry_at(self, statute_id, hierarchy_id, year):
+        """条目的下次重试时间（时间戳），不在重试队列中时为None"""
+        schedule_key, _ = self._keys(hierarchy_id, year)
+        return self.redis_conn.zscore(schedule_key, statute_id)
+
+    def next_retry_at(self, hierarchy_id=None, year=None):
+        """最早的下次重试时间（时间戳），没有等待重试的条目时为None
+
+        不指定层级和年份时取所有层级和年份中最早的，供任务队列模式使用
+        """
+        if hierarchy_id is not None and year is not None:
+            schedule_keys = [self._keys(hierarchy_id, year)[0]]
+        else:
+            schedule_keys = [key for key in self.redis_conn.scan_iter(match=f"crawl:retry:{self.name}:*", count=1000)
+                             if not key.endswith(b':items')]
+        times = []
+        for schedule_key in schedule_keys:
+            first = self.redis_conn.zrange(schedule_key, 0, 0, withscores=True)
+            if first:
+                times.append(first[0][1])
+        return min(times) if times else None
+
+    def pending(self):
+        """所有等待重试的失败记录，按下次重试时间排列"""
+        entries = []
+        for key in self.redis_conn.scan_iter(match=f"crawl:retry:{self.name}:*:items", count=1000):
+            entries.extend(json.loads(raw) for raw in self.redis_conn.hvals(key))
+        entries.sort(key=lambda entry: entry.get('next_retry_at', 0))
+        return entries
+
+    def is_dead(self, statute_id):
+        return bool(self.redis_conn.hexists(self.dead_key, statute_id))
+
+    def dead_letters(self):
+        """所有死信，最近失败的在前"""
+        entries = [json.loads(raw) for raw in self.redis_conn.hvals(self.dead_key)]
+        entries.sort(key=lambda entry: entry.get('last_failed_at', 0), reverse=True)
+        return entries
+
+    def requeue(self, statute_id):
+        """把死信重新放回重试队列，尝试次数清零并立即到期
+
+        Returns:
+            bool: 是否存在该死信
+        """
+        raw = self.redis_conn.hget(self.dead_key, statute_id)
+        if not raw:
+            return False
+        entry = json.loads(raw)
+        entry['attempts'] = 0
+        entry['next_retry_at'] = time.time()
+        schedule_key, items_key = self._keys(entry['hierarchy_id'], entry['year'])
+        pipe = self.redis_conn.pipeline()
+        pipe.hdel(self.dead_key, statute_id)
+        pipe.hset(items_key, statute_id, json.dumps(entry, ensure_ascii=False))
+        pipe.zadd(schedule_key, {statute_id: entry['next_retry_at']})
+        pipe.execute()
+        return True
+
+    def delete_dead(self, statute_id):
+        """删除一条死信，返回是否存在"""
+        return bool(self.redis_conn.hdel(self.dead_key, statute_id))
+
+
+_failure_stores = {}
+_failure_stores_lock = threading.Lock()
+
+
+def get_failure_store(name='statutes'):
+    """获取进程内共享的失败记录存储"""
+    with _failure_stores_lock:
+        store = _failure_stores.get(name)
+        if store is None:
+            store = FailureStore(name)
+            _failure_stores[name] = store
+        return store
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+banklaw.com HTTP客户端
+统一维护请求头，并为每个access_token复用一个带连接池的keep-alive Session，
+避免每次请求都重新建立TCP和TLS连接
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from . import metrics
+from .token_budget import get_token_budget
+
+# 所有banklaw.com接口共用的请求头，Host由requests根据URL自动填写
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "Accept-Language": "zh-CN,zh;q=0.9",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Content-Type": "application/json; charset=utf-8",
+    "Origin": "https://www.banklaw.com",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
+}
+
+
+def build_headers(access_token=None):
+    """构造请求头，传入access_token时附带Access-Token"""
+    headers = dict(DEFAULT_HEADERS)
+    if access_token:
+        headers["Access-Token"] = access_token
+    return headers
+
+
+class BanklawSession(requests.Session):
+    """带连接池和默认超时的Session"""
+
+    def __init__(self, access_token=None, pool_size=None, timeout=None):
+        """初始化Session
+
+        Args:
+            access_token: 绑定到该Session的access_token
+            pool_size: 每个主机保持的最大连接数，默认取HTTP_POOL_SIZE
+            timeout: 默认超时(连接超时, 读取超时)，单个请求可以通过timeout参数覆盖
+        """
+        super().__init__()
+        self.access_token = access_token
+        self.headers.clear()
+        self.headers.update(build_headers(access_token))
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        pool_size = pool_size or HTTP_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        """发送请求，未指定超时时使用默认超时，按接口和状态码记录监控指标
+
+        发出前先扣减token的每日请求预算，已达上限时抛出TokenBudgetExceeded，请求不会发出
+        """
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        get_token_budget().consume(self.access_token)
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            metrics.record_request(metrics.endpoint_of(url), 'error', time.perf_counter() - started, self.access_token)
+            raise
+        metrics.record_request(metrics.endpoint_of(url), response.status_code,
+                               time.perf_counter() - started, self.access_token)
+        return response
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(access_token=None):
+    """获取access_token对应的共享Session，同一进程内同一token只建一个连接池"""
+    with _sessions_lock:
+        session = _sessions.get(access_token)
+        if session is None:
+            session = BanklawSession(access_token)
+            _sessions[access_token] = session
+        return session
+
+
+def close_session(access_token=None):
+    """关闭并移除access_token对应的Session，token失效后调用"""
+    with _sessions_lock:
+        session = _sessions.pop(access_token, None)
+    if session is not None:
+        session.close()
+
+
+def close_all_sessions():
+    """关闭所有Session"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -10,7 +10,9 @@ import sys
 # 导入random模块，用于生成随机数
 import random
 # 从配置文件导入必要的常量参数
-from .config import MAX_PAGES_PER_THREAD,START_YEAR, END_YEAR, IF_CHUFA,THREAD_ID,IF_ON
+from .config import MAX_PAGES_PER_THREAD,START_YEAR, END_YEAR, IF_CHUFA,THREAD_ID,IF_ON,USE_WORK_QUEUE,SUPERVISOR_ENABLED
+# 多进程分片模式
+from .supervisor import run_supervisor
 
 # banklaw.com网站的URL
 BANKLAW_URL = "https://www.banklaw.com"
@@ -34,6 +36,8 @@ def parse_args():
         if arg == '--help' or arg == '-h':
             print_help()
             sys.exit(0)
+        elif arg == '--supervisor':
+            continue  # 在main中处理
         elif arg.isdigit() and 1 <= int(arg) <= 3:
             args['thread_id'] = int(arg)
         else:
@@ -49,18 +53,21 @@ def print_help():
 爬取banklaw.com法规的爬虫程序
 
 用法: python run.py [线程ID]
+      python run.py --supervisor
 
 线程ID:
   1       爬取法律法规 (默认)
   2       爬取规章制度
   3       爬取行业动态
   
+  --supervisor       多进程模式，按(层级, 年份)分片并行爬取所有层级
   --help, -h         显示此帮助信息
 
 示例:
   python run.py 1    # 爬取法律法规
   python run.py 2    # 爬取规章制度
   python run.py 3    # 爬取行业动态
+  python run.py --supervisor  # 多进程爬取所有层级
     """)
 
 def main():
@@ -74,6 +81,7 @@ def main():
     else:
         thread_id = THREAD_ID
         if_chufa = IF_CHUFA
+    supervisor = SUPERVISOR_ENABLED or '--supervisor' in sys.argv[1:]
         
     
     # 创建爬虫调度器实例
@@ -88,6 +96,18 @@ def main():
         # 确保有足够的token
         scheduler.ensure_enough_tokens()
     
+    #任务队列模式下不再按层级和年份分工，所有机器共同消费同一个队列
+    if USE_WORK_QUEUE and if_chufa != 1:
+        print("启动任务队列工作进程")
+        scheduler.start_queue_worker()
+        return
+
+    #多进程模式下由主进程启动各分片的工作进程，本进程只负责补充token和汇总进度
+    if supervisor and if_chufa != 1:
+        print("启动多进程分片爬取")
+        run_supervisor(scheduler)
+        return
+
     # 获取线程对应的层级ID和名称
     hierarchy_id = thread_id
     hierarchy_name = HIERARCHIES[hierarchy_id]
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Prometheus监控指标
+请求、下载、写入、限流和目录抓取的计数器与直方图集中定义在这里，各模块直接调用；
+未安装prometheus_client时所有指标都是空操作，不影响爬虫运行
+
+API服务在/metrics暴露指标，并附带从Redis读取的任务队列深度、token池大小等状态；
+run.py启动的爬虫进程在METRICS_PORT上启动独立的指标端口
+"""
+
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+try:
+    import prometheus_client
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prometheus_client = None
+
+import redis
+
+
+class _NoopMetric:
+    """未安装prometheus_client时使用的空指标"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def set(self, value):
+        pass
+
+
+def _counter(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def _histogram(name, documentation, labelnames=(), buckets=None):
+    if prometheus_client is None:
+        return _NoopMetric()
+    if buckets is None:
+        return prometheus_client.Histogram(name, documentation, labelnames)
+    return prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+def _gauge(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Gauge(name, documentation, labelnames)
+
+
+# 接口请求耗时的分桶（秒），覆盖从本地模拟服务到慢速大文档的范围
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+API_REQUESTS = _counter(
+    'banklaw_api_requests_total', "发往banklaw.com接口的请求数", ['endpoint', 'status'])
+API_REQUEST_SECONDS = _histogram(
+    'banklaw_api_request_duration_seconds', "接口请求耗时（到收到响应头）", ['endpoint'], _LATENCY_BUCKETS)
+TOKEN_REQUESTS = _counter(
+    'banklaw_token_requests_total', "每个access_token发出的请求数，token以摘要表示", ['token'])
+RATE_LIMIT_HITS = _counter(
+    'banklaw_rate_limit_hits_total', "被接口限流的次数：http_429、quota_exceeded（超过限制）或page_reset（被重置到第一页）",
+    ['token', 'reason'])
+ADAPTIVE_RATE = _gauge(
+    'crawler_adaptive_rate_rpm', "自适应限流为每个token每个接口调整后的每分钟请求数", ['token', 'endpoint'])
+BREAKER_OPENS = _counter(
+    'crawler_breaker_opens_total', "token因连续被限流而暂停的次数", ['token'])
+DOCUMENTS = _counter(
+    'crawler_documents_total', "法规详情处理结果：success、skipped、failed", ['hierarchy', 'result'])
+DOWNLOAD_SECONDS = _histogram(
+    'crawler_download_duration_seconds', "单篇法规从发起请求到写入文件的耗时", ['hierarchy'], _LATENCY_BUCKETS)
+BYTES_WRITTEN = _counter(
+    'crawler_bytes_written_total', "写入磁盘的字节数：article为文本文件，archive为压缩后的原始响应", ['kind'])
+RATE_LIMITER_WAIT_SECONDS = _histogram(
+    'crawler_rate_limiter_wait_seconds', "发请求前在本地限流器上等待的时间",
+    buckets=(0, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
+LISTING_ROWS = _counter(
+    'crawler_listing_rows_total', "目录接口抓取到的条目数", ['hierarchy'])
+
+# 接口路径到endpoint标签的映射
+_ENDPOINTS = (
+    ('/search/v1/statutes/search', 'statutes_search'),
+    ('/search/v1/casus/search', 'casus_search'),
+    ('/v1/statutes/', 'statute_detail'),
+)
+
+
+def endpoint_of(url):
+    """按URL路径归类接口，避免把statuteId等变量写进标签"""
+    path = urlparse(url).path
+    for prefix, name in _ENDPOINTS:
+        if path.startswith(prefix):
+            return name
+    return 'other'
+
+
+def token_label(token):
+    """token的标签值，不把token明文暴露在指标中"""
+    if not token:
+        return 'none'
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+
+def hierarchy_label(hierarchy_id):
+    return str(hierarchy_id) if hierarchy_id else 'unknown'
+
+
+def record_request(endpoint, status, seconds, token=None):
+    """记录一次接口请求，status为HTTP状态码，网络异常时为'error'"""
+    API_REQUESTS.labels(endpoint, str(status)).inc()
+    API_REQUEST_SECONDS.labels(endpoint).observe(seconds)
+    TOKEN_REQUESTS.labels(token_label(token)).inc()
+
+
+class RedisStateCollector:
+    """抓取指标时从Redis读取共享状态：任务队列深度、token池大小、已下载文档数
+
+    这些是所有机器共享的全局值，只在API服务中注册，避免每个爬虫进程重复上报
+    """
+
+    def __init__(self, redis_conn):
+        from .work_queue import WorkQueue
+        from .dedup import DedupIndex
+        self.redis_conn = redis_conn
+        self.queue = WorkQueue(redis_conn=redis_conn)
+        self.dedup_key = DedupIndex('statutes', redis_conn).done_key
+
+    def describe(self):
+        """只声明指标名，注册时不再调用collect()访问Redis"""
+        yield GaugeMetricFamily('crawler_work_queue_tasks', "任务队列中的任务数", labels=['state'])
+        yield GaugeMetricFamily('crawler_token_pool_size', "Redis中保存的access_token数量")
+        yield GaugeMetricFamily('crawler_dedup_documents', "去重索引中已下载的法规数")
+
+    def collect(self):
+        try:
+            queue_stats = self.queue.stats()
+            pipe = self.redis_conn.pipeline()
+            pipe.llen('access_tokens')
+            pipe.scard(self.dedup_key)
+            token_count, downloaded = pipe.execute()
+        except redis.RedisError as e:
+            print(f"读取监控状态失败: {e}")
+            return
+        queue = GaugeMetricFamily('crawler_work_queue_tasks', "任务队列中的任务数", labels=['state'])
+        for state, value in queue_stats.items():
+            queue.add_metric([state], value)
+        yield queue
+        yield GaugeMetricFamily('crawler_token_pool_size', "Redis中保存的access_token数量", value=token_count)
+        yield GaugeMetricFamily('crawler_dedup_documents', "去重索引中已下载的法规数", value=downloaded)
+
+
+_collector_registered = False
+_server_started = False
+_lock = threading.Lock()
+
+
+def register_redis_collector(redis_conn):
+    """注册Redis状态采集器，重复调用只注册一次"""
+    global _collector_registered
+    if prometheus_client is None:
+        return False
+    with _lock:
+        if not _collector_registered:
+            prometheus_client.REGISTRY.register(RedisStateCollector(redis_conn))
+            _collector_registered = True
+    return True
+
+
+def start_metrics_server(port):
+    """在独立线程中启动指标HTTP端口，供run.py等爬虫进程使用
+
+    Returns:
+        bool: 是否已启动
+    """
+    global _server_started
+    if prometheus_client is None:
+        print("未安装prometheus_client，不启动监控指标端口")
+        return False
+    with _lock:
+        if not _server_started:
+            prometheus_client.start_http_server(port)
+            _server_started = True
+            print(f"监控指标端口已启动: http://0.0.0.0:{port}/metrics")
+    return True
+
+
+def render_latest():
+    """返回(指标文本, Content-Type)，未安装prometheus_client时返回None"""
+    if prometheus_client is None:
+        return None
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -1,14 +1,39 @@
 import requests
+import redis
 import datetime
 import json
 import os
 import time
-from .config import START_YEAR_DOWNLOAD, END_YEAR_DOWNLOAD, MULU_DOWNLODA_TIMEOUT
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .config import START_YEAR_DOWNLOAD, END_YEAR_DOWNLOAD, USE_WORK_QUEUE, LISTING_MODE, LISTING_WORKERS
+from .config import BANKLAW_API_URL
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    ADAPTIVE_PAGE_SIZE, LISTING_PAGE_SIZE_CANDIDATES, LISTING_PAGE_SIZE_TTL,
+    THROTTLE_MAX_RETRIES
+)
 from .crawler_scheduler import CrawlerScheduler
+from .rate_limiter import get_rate_limiter, observe_response, observe_error
+from .http_client import get_session
+from .work_queue import WorkQueue
+from .token_health import OUTCOME_THROTTLED
+from .token_budget import get_token_budget
+from .watermark import WatermarkStore, statute_scope, CASUS_SCOPE
+from . import metrics
+from . import timing
 
 
+# 各目录接口原先使用的每页条数，协商失败时回退到该值
+DEFAULT_PAGE_SIZES = {
+    'statutes': 10,
+    'casus': 30
+}
+# 探测请求都没有得到应答时，暂用默认页大小，间隔多少秒后重新探测
+PAGE_SIZE_REPROBE_INTERVAL = 600
+
 #调用对应的API接口，获取相应月份的数据简报
-def call_api(start_date=None, end_date=None, page_index=0, hierarchy_id=1, access_token=None,if_chufa=0):
+def call_api(start_date=None, end_date=None, page_index=0, hierarchy_id=1, access_token=None,if_chufa=0, page_size=None):
     #获取access_token
     access_token = access_token
     """调用API获取数据
@@ -19,29 +44,17 @@ def call_api(start_date=None, end_date=None, page_index=0, hierarchy_id=1, acces
         page_index: 页码索引
         hierarchy_id: 层级ID
         if_chufa: 是否为处罚数据，0为法规数据，1为处罚数据
+        page_size: 每页条数，默认取DEFAULT_PAGE_SIZES中对应接口的值
         
     Returns:
         API响应的JSON数据
     """
-    headers = {
-        "Accept": "application/json",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
-        "Accept-Language": "zh-CN,zh;q=0.9",
-        "Access-Token": access_token,
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "Content-Type": "application/json; charset=utf-8",
-        "Host": "api2.banklaw.com",
-        "Origin": "https://www.banklaw.com",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
-    }
-    
     if if_chufa == 1:
         # 处罚数据API
-        api_url = "https://api2.banklaw.com/search/v1/casus/search?1742266630148"
+        api_url = f"{BANKLAW_API_URL}/search/v1/casus/search?1742266630148"
         body = {
             "pageIndex": page_index,
-            "pageSize": 30,
+            "pageSize": page_size or DEFAULT_PAGE_SIZES['casus'],
             "sort": 1,
             "exactMatch": True,
             "securityLevel": "",
@@ -55,10 +68,10 @@ def call_api(start_date=None, end_date=None, page_index=0, hierarchy_id=1, acces
         }
     else:
         # 法规数据API
-        api_url = "https://api2.banklaw.com/search/v1/statutes/search?1742208260648"
+        api_url = f"{BANKLAW_API_URL}/search/v1/statutes/search?1742208260648"
         body = {
             "pageIndex": page_index,
-            "pageSize": 10,
+            "pageSize": page_size or DEFAULT_PAGE_SIZES['statutes'],
             "sort": 1,
             "exactMatch": True,
             "securityLevel": "",
@@ -74,16 +87,160 @@ def call_api(start_date=None, end_date=None, page_index=0, hierarchy_id=1, acces
             "statusChangeContainDoubleDate": 0
         }
     
+    endpoint = metrics.endpoint_of(api_url)
     try:
-        response = requests.post(api_url, headers=headers, json=body)
-        #判断是否请求被限制，若被限制立即重新换token
-
-        response.raise_for_status()
-        return response.json()
+        for attempt in range(THROTTLE_MAX_RETRIES + 1):
+            # 当前token今日请求数接近上限时换用今日用量最少的token
+            access_token = get_token_budget().ensure(access_token)
+            # 按token和接口取令牌，被限流后限流器已降速或暂停该token
+            with timing.span('listing.rate_limit'):
+                timing.record('listing.sleep', get_rate_limiter().acquire(access_token, endpoint=endpoint))
+            with timing.span('listing.request'):
+                try:
+                    response = get_session(access_token).post(api_url, json=body)
+                except requests.exceptions.RequestException as e:
+                    observe_error(access_token, endpoint, e)
+                    raise
+            with timing.span('listing.parse'):
+                data = response.json() if response.status_code == 200 else None
+            #判断是否请求被限制，结果同步到token健康缓存和自适应限流
+            outcome, reason = observe_response(access_token, endpoint, response.status_code, data,
+                                               page_index, body['pageSize'])
+            if outcome != OUTCOME_THROTTLED:
+                response.raise_for_status()
+                return data
+            print(f"目录请求被限流（{reason}），降速后重试...")
+        print(f"目录请求连续 {THROTTLE_MAX_RETRIES + 1} 次被限流，放弃本页")
+        return None
     except requests.exceptions.RequestException as e:
         print(f"API调用失败: {e}")
         return None
 
+# {接口: (每页条数, 重新探测的时间戳，探测有结论时为None)}
+class ListingIncompleteError(Exception):
+    """目录请求失败（连续被限流、今日预算用完或网络错误），本次抓取的结果不完整"""
+
+def _listing_rows(data, what):
+    """取出目录响应中的行，返回空列表表示没有更多数据；请求失败时抛出ListingIncompleteError
+
+    call_api在请求失败时返回None，不能当作没有更多数据，否则会用不完整的结果覆盖目录文件并推进水位线
+    """
+    if not data or not isinstance(data.get('data'), dict):
+        raise ListingIncompleteError(f"{what}目录请求失败，放弃本次抓取，不写入目录文件也不推进水位线")
+    return data['data'].get('rows') or []
+
+_page_size_cache = {}
+_page_size_lock = threading.Lock()
+# 每个接口一把探测锁，同一接口只由一个线程探测，探测期间不阻塞其他接口
+_page_size_probe_locks = {}
+
+def _page_size_honoured(data, page_index, page_size):
+    """检查接口是否按请求的页码和每页条数返回了数据
+    
+    Returns:
+        bool: 返回的pageIndex与请求一致且行数等于按total推算的应返回行数时为True，
+              总数不足以验证该页大小时也返回False
+    """
+    if not data or not isinstance(data.get('data'), dict):
+        return False
+    info = data['data']
+    rows = info.get('rows') or []
+    if info.get('pageIndex', page_index) != page_index:
+        return False
+    total = info.get('total')
+    if total is None:
+        return len(rows) == page_size
+    expected = min(page_size, total - page_index * page_size)
+    return expected > 0 and len(rows) == expected
+
+def _page_size_answered(data):
+    """探测请求是否得到了目录接口的有效应答（无论是否按请求的页大小返回）"""
+    return isinstance(data, dict) and isinstance(data.get('data'), dict)
+
+def _cached_page_size(endpoint):
+    """进程内缓存的每页条数，没有或暂用的默认值已到重新探测时间时返回None"""
+    with _page_size_lock:
+        entry = _page_size_cache.get(endpoint)
+    if entry is None:
+        return None
+    page_size, reprobe_at = entry
+    if reprobe_at is not None and reprobe_at <= time.time():
+        return None
+    return page_size
+
+def negotiate_page_size(endpoint, access_token=None):
+    """协商目录接口实际支持的最大每页条数，结果缓存在进程内存和Redis中
+    
+    从大到小依次用候选页大小请求第二页，服务端返回的pageIndex和行数都与请求一致时采用该值。
+    请求第二页是为了同时识别接口把非第一页请求重置为第一页的情况。
+    只有探测得到结论（某个候选值被采用，或所有候选值都得到应答但被截断）时才写入Redis；
+    请求失败或被限流导致没有结论时只在进程内暂用默认值，PAGE_SIZE_REPROBE_INTERVAL秒后重新探测
+    
+    Args:
+        endpoint: 'statutes'法规目录或'casus'处罚案例目录
+        access_token: 探测使用的access_token
+        
+    Returns:
+        int: 每页条数
+    """
+    default = DEFAULT_PAGE_SIZES[endpoint]
+    if not ADAPTIVE_PAGE_SIZE:
+        return default
+    page_size = _cached_page_size(endpoint)
+    if page_size is not None:
+        return page_size
+    with _page_size_lock:
+        probe_lock = _page_size_probe_locks.setdefault(endpoint, threading.Lock())
+    with probe_lock:
+        # 等待期间其他线程可能已经协商完成
+        page_size = _cached_page_size(endpoint)
+        if page_size is not None:
+            return page_size
+        redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD)
+        try:
+            cached = redis_conn.hget('listing:page_size', endpoint)
+        except redis.RedisError as e:
+            print(f"读取页大小缓存失败: {e}")
+            cached = None
+        if cached:
+            with _page_size_lock:
+                _page_size_cache[endpoint] = (int(cached), None)
+            return int(cached)
+        
+        page_size = default
+        settled = True
+        for candidate in sorted(LISTING_PAGE_SIZE_CANDIDATES, reverse=True):
+            if candidate <= default:
+                break
+            print(f"正在探测{endpoint}目录接口每页 {candidate} 条...")
+            if endpoint == 'casus':
+                data = call_api(page_index=1, access_token=access_token, if_chufa=1, page_size=candidate)
+            else:
+                # 用较宽的日期范围保证总数足够验证
+                data = call_api(f"{START_YEAR_DOWNLOAD}-01-01", f"{END_YEAR_DOWNLOAD}-12-31", 1, 1,
+                                access_token, if_chufa=0, page_size=candidate)
+            if _page_size_honoured(data, 1, candidate):
+                page_size = candidate
+                settled = True
+                break
+            if not _page_size_answered(data):
+                settled = False
+        if not settled:
+            print(f"{endpoint}目录接口页大小探测没有得到应答，暂用每页 {page_size} 条，"
+                  f"{PAGE_SIZE_REPROBE_INTERVAL} 秒后重新探测")
+            with _page_size_lock:
+                _page_size_cache[endpoint] = (page_size, time.time() + PAGE_SIZE_REPROBE_INTERVAL)
+            return page_size
+        print(f"{endpoint}目录接口采用每页 {page_size} 条")
+        with _page_size_lock:
+            _page_size_cache[endpoint] = (page_size, None)
+        try:
+            redis_conn.hset('listing:page_size', endpoint, page_size)
+            redis_conn.expire('listing:page_size', LISTING_PAGE_SIZE_TTL)
+        except redis.RedisError as e:
+            print(f"写入页大小缓存失败: {e}")
+        return page_size
+
 def save_response(data, month):
     """保存API响应报文"""
     filename = f"api_response_{month}.json"
@@ -93,6 +250,10 @@ def save_response(data, month):
 
 def process_monthly_data(year, month, hierarchy_id, save_dir,access_token):
     """处理指定年月的数据"""
+    with timing.span('listing.month'):
+        _process_monthly_data(year, month, hierarchy_id, save_dir, access_token)
+
+def _process_monthly_data(year, month, hierarchy_id, save_dir, access_token):
     start_date = f"{year}-{month:02d}-01"
     if month == 12:
         end_date = f"{year}-12-31"
@@ -100,38 +261,53 @@ def process_monthly_data(year, month, hierarchy_id, save_dir,access_token):
         end_date = f"{year}-{month+1:02d}-01"
     
     all_data = []
+    all_rows = []
     page_index = 0
+    with timing.span('listing.page_size'):
+        page_size = negotiate_page_size('statutes', access_token)
     
     while True:
         print(f"正在获取 {year}年{month}月 第{page_index + 1}页数据...")
-        data = call_api(start_date, end_date, page_index, hierarchy_id,access_token, if_chufa=0)
-        
-        if not data or not data.get('data', {}).get('rows'):
+        data = call_api(start_date, end_date, page_index, hierarchy_id,access_token, if_chufa=0, page_size=page_size)
+        # 请求失败时整月放弃，已有的目录文件和水位线保持不变
+        rows = _listing_rows(data, f"{year}年{month}月第{page_index + 1}页")
+        if not rows:
             print("没有更多数据")
             break
             
         # 仅提取statuteId和title字段
-        for item in data['data']['rows']:
+        metrics.LISTING_ROWS.labels(str(hierarchy_id)).inc(len(rows))
+        for item in rows:
             all_data.append({
                 'statuteId': item.get('statuteId'),
                 'title': item.get('title')
             })
+        all_rows.extend(rows)
         
-        print(f"暂停{MULU_DOWNLODA_TIMEOUT}秒后继续获取下一页...")
-        time.sleep(MULU_DOWNLODA_TIMEOUT)
+        # 不足一页说明已是最后一页，省去一次空页请求
+        if len(rows) < page_size:
+            break
         page_index += 1
     
     if all_data:
         filename = os.path.join(save_dir, f"api_response_{month}.json")
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({
-                'year': year,
-                'month': month,
-                'hierarchy_id': hierarchy_id,
-                'total': len(all_data),
-                'data': all_data
-            }, f, ensure_ascii=False, indent=2)
+        with timing.span('listing.write'):
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'year': year,
+                    'month': month,
+                    'hierarchy_id': hierarchy_id,
+                    'total': len(all_data),
+                    'data': all_data
+                }, f, ensure_ascii=False, indent=2)
         print(f"已保存报文: {filename}")
+        if USE_WORK_QUEUE:
+            with timing.span('listing.enqueue'):
+                added = WorkQueue().enqueue(all_data, hierarchy_id, year)
+            print(f"已入队 {added} 个新任务")
+        # 全量抓取同样推进水位线，之后即可切换为增量抓取；整月抓取完成后才推进
+        with timing.span('listing.watermark'):
+            WatermarkStore().observe(statute_scope(hierarchy_id), all_rows)
 def process_data_chufa():
     """处理处罚数据"""
     print("*" * 50 + "开始处理处罚数据" + "*" * 50)
@@ -142,27 +318,36 @@ def process_data_chufa():
         os.makedirs(chufa_dir)
     
     all_data = []
+    all_rows = []
     page_index = 0
+    page_size = negotiate_page_size('casus')
     
     while True:
         print(f"正在获取处罚数据第{page_index + 1}页...")
         # 调用API获取处罚数据，if_chufa=1表示获取处罚数据
-        data = call_api(if_chufa=1, page_index=page_index)
+        data = call_api(if_chufa=1, page_index=page_index, page_size=page_size)
         print(data)
-        
-        if not data or not data.get('data', {}).get('rows'):
+        try:
+            rows = _listing_rows(data, f"处罚数据第{page_index + 1}页")
+        except ListingIncompleteError as e:
+            print(e)
+            return
+        if not rows:
             print("没有更多处罚数据")
             break
         
         # 提取casusId和title字段
-        for item in data['data']['rows']:
+        metrics.LISTING_ROWS.labels('casus').inc(len(rows))
+        for item in rows:
             all_data.append({
                 'casusId': item.get('casusId'),
                 'title': item.get('title')
             })
+        all_rows.extend(rows)
         
-        print("暂停5秒后继续获取下一页...")
-        time.sleep(15)
+        # 不足一页说明已是最后一页
+        if len(rows) < page_size:
+            break
         page_index += 1
     
     if all_data:
@@ -176,16 +361,231 @@ def process_data_chufa():
             }, f, ensure_ascii=False, indent=2)
         print(f"已保存处罚数据: {filename}")
         print(f"共获取到 {len(all_data)} 条处罚数据")
+        WatermarkStore().observe(CASUS_SCOPE, all_rows, id_field='casusId')
     else:
         print("未获取到任何处罚数据")
+    timing.report("处罚数据目录")
+    
+HIERARCHIES = {
+    1: "法律法规",
+    2: "规章制度",
+    3: "行业动态"
+}
+
+def process_data_by_hierarchy_and_year_concurrent(max_workers=None):
+    """并发抓取所有层级、年份、月份的目录
+    
+    每个(层级, 年份, 月份)窗口作为一个任务，按轮询方式分配token池中的token，
+    请求节奏由分布式限流器控制，输出文件与串行模式完全相同
+    """
+    max_workers = max_workers or LISTING_WORKERS
+    craw = CrawlerScheduler()
+    tokens = craw.get_healthy_tokens()
+    if not tokens:
+        access_token = craw.get_access_token()
+        tokens = [access_token] if access_token else []
+    if not tokens:
+        print("没有可用的access_token，无法抓取目录")
+        return
+    
+    windows = []
+    for hierarchy_id, hierarchy_name in HIERARCHIES.items():
+        for year in range(START_YEAR_DOWNLOAD, END_YEAR_DOWNLOAD + 1):
+            year_dir = f'api_responses/hierarchy_{hierarchy_id}_{hierarchy_name}/{year}'
+            os.makedirs(year_dir, exist_ok=True)
+            for month in range(1, 13):
+                windows.append((hierarchy_id, year, month, year_dir))
+    print(f"并发抓取目录: {len(windows)} 个月份窗口，{len(tokens)} 个token，{max_workers} 个线程")
     
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for i, (hierarchy_id, year, month, year_dir) in enumerate(windows):
+            token = tokens[i % len(tokens)]
+            future = executor.submit(process_monthly_data, year, month, hierarchy_id, year_dir, token)
+            futures[future] = (hierarchy_id, year, month)
+        done = 0
+        for future in as_completed(futures):
+            hierarchy_id, year, month = futures[future]
+            done += 1
+            try:
+                future.result()
+            except Exception as e:
+                print(f"抓取 {HIERARCHIES[hierarchy_id]} {year}年{month}月目录失败: {e}")
+            print(f"目录进度: {done}/{len(windows)}，耗时 {time.time() - start:.1f} 秒")
+    timing.report("并发目录抓取")
+
+def _merge_month_file(year_dir, year, month, hierarchy_id, new_items):
+    """把新增条目合并进月份目录文件，按statuteId去重，新条目排在前面
+    
+    Returns:
+        list: 实际新增的条目
+    """
+    filename = os.path.join(year_dir, f"api_response_{month}.json")
+    existing = []
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            existing = json.load(f).get('data') or []
+    known = {item.get('statuteId') for item in existing}
+    added = [item for item in new_items if item['statuteId'] not in known]
+    if not added:
+        return []
+    all_data = added + existing
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({
+            'year': year,
+            'month': month,
+            'hierarchy_id': hierarchy_id,
+            'total': len(all_data),
+            'data': all_data
+        }, f, ensure_ascii=False, indent=2)
+    print(f"已更新报文: {filename}，新增 {len(added)} 条")
+    return added
+
+def process_incremental_by_hierarchy(hierarchy_id, access_token, watermarks=None):
+    """从水位线开始增量抓取某个层级的目录
+    
+    只查询水位线日期到今天的数据；接口按发布日期从新到旧排序（sort=1），
+    遇到水位线上的已知ID即停止翻页。新增条目按发布月份合并进对应的月份目录文件
+    
+    Returns:
+        int: 新增条目数
+    """
+    watermarks = watermarks or WatermarkStore()
+    hierarchy_name = HIERARCHIES[hierarchy_id]
+    scope = statute_scope(hierarchy_id)
+    since, known_ids = watermarks.get(scope)
+    if not since:
+        print(f"{hierarchy_name}还没有水位线，请先执行一次全量目录抓取")
+        return 0
+    
+    start_date = since[:10]
+    end_date = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    page_size = negotiate_page_size('statutes', access_token)
+    print(f"增量抓取{hierarchy_name}目录: {start_date} ~ {end_date}，已知最新ID {len(known_ids)} 个")
+    
+    new_rows = []
+    page_index = 0
+    while True:
+        data = call_api(start_date, end_date, page_index, hierarchy_id, access_token, if_chufa=0, page_size=page_size)
+        rows = _listing_rows(data, f"{hierarchy_name}增量第{page_index + 1}页")
+        if not rows:
+            break
+        metrics.LISTING_ROWS.labels(str(hierarchy_id)).inc(len(rows))
+        reached_known = False
+        for item in rows:
+            if item.get('statuteId') in known_ids:
+                reached_known = True
+                continue
+            new_rows.append(item)
+        if reached_known or len(rows) < page_size:
+            break
+        page_index += 1
+    
+    # 按发布月份归档
+    by_month = {}
+    for item in new_rows:
+        publish_date = item.get('publishDate') or ''
+        if len(publish_date) < 7:
+            print(f"缺少发布日期，跳过: {item.get('title')}")
+            continue
+        key = (int(publish_date[:4]), int(publish_date[5:7]))
+        by_month.setdefault(key, []).append({
+            'statuteId': item.get('statuteId'),
+            'title': item.get('title')
+        })
+    
+    total_added = 0
+    for (year, month), items in sorted(by_month.items()):
+        year_dir = f'api_responses/hierarchy_{hierarchy_id}_{hierarchy_name}/{year}'
+        os.makedirs(year_dir, exist_ok=True)
+        added = _merge_month_file(year_dir, year, month, hierarchy_id, items)
+        if added and USE_WORK_QUEUE:
+            WorkQueue().enqueue(added, hierarchy_id, year)
+        total_added += len(added)
+    
+    watermarks.observe(scope, new_rows)
+    print(f"{hierarchy_name}增量抓取完成，共 {page_index + 1} 次请求，新增 {total_added} 条")
+    return total_added
+
+def process_incremental_chufa(access_token=None, watermarks=None):
+    """从水位线开始增量抓取处罚案例目录，遇到已知ID或更早的发布日期即停止翻页
+    
+    Returns:
+        int: 新增条目数
+    """
+    watermarks = watermarks or WatermarkStore()
+    since, known_ids = watermarks.get(CASUS_SCOPE)
+    if not since:
+        print("处罚案例还没有水位线，请先执行一次全量抓取")
+        return 0
+    
+    page_size = negotiate_page_size('casus', access_token)
+    new_rows = []
+    page_index = 0
+    while True:
+        data = call_api(if_chufa=1, page_index=page_index, access_token=access_token, page_size=page_size)
+        try:
+            rows = _listing_rows(data, f"处罚案例增量第{page_index + 1}页")
+        except ListingIncompleteError as e:
+            print(e)
+            return 0
+        if not rows:
+            break
+        metrics.LISTING_ROWS.labels('casus').inc(len(rows))
+        reached_known = False
+        for item in rows:
+            publish_date = item.get('publishDate') or ''
+            if item.get('casusId') in known_ids or (publish_date and publish_date < since):
+                reached_known = True
+                continue
+            new_rows.append(item)
+        if reached_known or len(rows) < page_size:
+            break
+        page_index += 1
+    
+    filename = os.path.join('api_responses/chufa', "api_response_chufa.json")
+    existing = []
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            existing = json.load(f).get('data') or []
+    known = {item.get('casusId') for item in existing}
+    added = [{'casusId': item.get('casusId'), 'title': item.get('title')}
+             for item in new_rows if item.get('casusId') not in known]
+    if added:
+        os.makedirs('api_responses/chufa', exist_ok=True)
+        all_data = added + existing
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({
+                'type': 'chufa',
+                'total': len(all_data),
+                'data': all_data
+            }, f, ensure_ascii=False, indent=2)
+    watermarks.observe(CASUS_SCOPE, new_rows, id_field='casusId')
+    print(f"处罚案例增量抓取完成，共 {page_index + 1} 次请求，新增 {len(added)} 条")
+    return len(added)
+
+def process_incremental():
+    """增量抓取所有层级的法规目录"""
+    craw = CrawlerScheduler()
+    access_token = craw.get_access_token()
+    watermarks = WatermarkStore()
+    for hierarchy_id in HIERARCHIES:
+        try:
+            process_incremental_by_hierarchy(hierarchy_id, access_token, watermarks)
+        except ListingIncompleteError as e:
+            print(e)
+    timing.report("增量目录抓取")
+
 def process_data_by_hierarchy_and_year():
     """按层级和年份处理数据"""
-    hierarchies = {
-        1: "法律法规",
-        2: "规章制度", 
-        3: "行业动态"
-    }
+    if LISTING_MODE == 'concurrent':
+        process_data_by_hierarchy_and_year_concurrent()
+        return
+    if LISTING_MODE == 'incremental':
+        process_incremental()
+        return
+    hierarchies = HIERARCHIES
     craw = CrawlerScheduler()
     access_token = craw.get_access_token()
     
@@ -207,7 +607,11 @@ def process_data_by_hierarchy_and_year():
             print(f"\n开始处理 {hierarchy_name} {year}年的数据...")
             
             for month in range(1, 13):
-                process_monthly_data(year, month, hierarchy_id, year_dir, access_token)
+                try:
+                    process_monthly_data(year, month, hierarchy_id, year_dir, access_token)
+                except ListingIncompleteError as e:
+                    print(e)
+    timing.report("目录抓取")
 
 def main():
     """主函数，程序入口点"""
@@ -216,8 +620,10 @@ def main():
     print("1. 法规数据 (按层级和年份)")
     print("2. 处罚数据")
     print("3. 全部数据")
+    print("4. 法规数据 (按层级和年份，多个月份并发)")
+    print("5. 增量更新 (从水位线开始抓取法规和处罚数据)")
     
-    choice = input("请输入选择 (1/2/3): ").strip()
+    choice = input("请输入选择 (1/2/3/4/5): ").strip()
     
     if choice == '1':
         process_data_by_hierarchy_and_year()
@@ -226,8 +632,13 @@ def main():
     elif choice == '3':
         process_data_by_hierarchy_and_year()
         process_data_chufa()
+    elif choice == '4':
+        process_data_by_hierarchy_and_year_concurrent()
+    elif choice == '5':
+        process_incremental()
+        process_incremental_chufa()
     else:
-        print("无效的选择，请输入 1, 2 或 3")
+        print("无效的选择，请输入 1 到 5")
 
 if __name__ == "__main__":
     main()
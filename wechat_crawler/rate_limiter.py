@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基于Redis的分布式令牌桶限流器
+每个access_token一个桶，每个目标主机一个全局桶，一次请求需要同时从两个桶各取一个令牌，
+取令牌由Lua脚本原子完成，所有机器、所有进程共享同一份预算
+
+开启ADAPTIVE_RATE_ENABLED时每个(token, 接口)另有一个桶，速率由服务器响应驱动（AIMD）：
+每个成功响应小幅提速，被限流或服务端过载时按AIMD_DECREASE_FACTOR降速；token连续被限流BREAKER_THRESHOLD次后熔断，
+暂停期间该token的请求在限流器上等待，暂停时间随连续熔断次数翻倍。
+token的总桶仍按RATE_LIMIT_TOKEN_RPM扣减，各接口合计不会超过该上限
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from urllib.parse import urlparse
+
+import redis
+import requests
+
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    BANKLAW_API_URL,
+    RATE_LIMIT_TOKEN_RPM, RATE_LIMIT_HOST_RPM, RATE_LIMIT_BURST,
+    ADAPTIVE_RATE_ENABLED, AIMD_MIN_RPM, AIMD_MAX_RPM, AIMD_INCREASE_RPM,
+    AIMD_DECREASE_FACTOR, AIMD_DECREASE_COOLDOWN,
+    BREAKER_THRESHOLD, BREAKER_BASE_SECONDS, BREAKER_MAX_SECONDS
+)
+from .token_health import (
+    get_token_health_cache, classify_response,
+    OUTCOME_OK, OUTCOME_THROTTLED, OUTCOME_OVERLOADED, OUTCOME_ERROR
+)
+from . import metrics
+
+# 默认的全局限流主机
+BANKLAW_API_HOST = urlparse(BANKLAW_API_URL).netloc
+
+# 自适应速率保存在桶中，闲置超过该时间（毫秒）后才恢复初始速率
+ADAPTIVE_STATE_TTL_MS = 3600 * 1000
+
+# KEYS: 需要同时扣减的桶，之后可以附加一个熔断器
+# ARGV: 第一个参数为桶的个数，之后每个桶依次为(容量, 每毫秒补充令牌数)，最后一个参数为桶的过期时间（毫秒）
+# 桶中有rate字段（自适应速率，每分钟请求数）时以它为准
+# 返回值: 0表示已取得令牌，否则为需要等待的毫秒数（此时不扣减任何桶）
+# 使用服务器时间，避免多台机器时钟不一致；需要Redis 5及以上版本
+TOKEN_BUCKET_SCRIPT = """
+local now_t = redis.call('TIME')
+local now = tonumber(now_t[1]) * 1000 + math.floor(tonumber(now_t[2]) / 1000)
+local count = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[#ARGV])
+if #KEYS > count then
+    local open_until = tonumber(redis.call('HGET', KEYS[count + 1], 'open_until') or '0')
+    if open_until > now then
+        return open_until - now
+    end
+end
+local wait = 0
+local levels = {}
+for i = 1, count do
+    local key = KEYS[i]
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts', 'rate')
+    if bucket[3] then
+        rate = tonumber(bucket[3]) / 60000
+    end
+    local tokens = tonumber(bucket[1])
+    local ts = tonumber(bucket[2])
+    if tokens == nil or ts == nil then
+        tokens = capacity
+        ts = now
+    end
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        local need = math.ceil((1 - tokens) / rate)
+        if need > wait then
+            wait = need
+        end
+    end
+end
+if wait == 0 then
+    for i = 1, count do
+        redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+        redis.call('PEXPIRE', KEYS[i], ttl)
+    end
+end
+return wait
+"""
+
+# KEYS[1]: token在该接口的桶, KEYS[2]: token的熔断器
+# ARGV: 响应分类, 初始RPM, 最小RPM, 最大RPM, 每分钟增加的RPM, 降速系数, 降速冷却毫秒,
+#       熔断阈值, 首次熔断毫秒, 熔断上限毫秒, 桶的过期时间（毫秒）
+# 返回值: {调整后的RPM, 本次熔断的毫秒数（0为未熔断）}
+FEEDBACK_SCRIPT = """
+local now_t = redis.call('TIME')
+local now = tonumber(now_t[1]) * 1000 + math.floor(tonumber(now_t[2]) / 1000)
+local outcome = ARGV[1]
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[2])
+local ttl = tonumber(ARGV[11])
+local open_ms = 0
+if outcome == 'ok' then
+    -- 每个成功请求增加 增量/当前速率，满速持续成功时每分钟约增加一个增量
+    rate = math.min(tonumber(ARGV[4]), rate + tonumber(ARGV[5]) / rate)
+    redis.call('HDEL', KEYS[2], 'strikes', 'opens')
+else
+    local decreased_at = tonumber(redis.call('HGET', KEYS[1], 'decreased_at') or '0')
+    if now - decreased_at >= tonumber(ARGV[7]) then
+        rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[6]))
+        redis.call('HSET', KEYS[1], 'decreased_at', tostring(now))
+    end
+    -- 清空桶中积攒的令牌，降速立即生效
+    redis.call('HSET', KEYS[1], 'tokens', '0', 'ts', tostring(now))
+    local open_until = tonumber(redis.call('HGET', KEYS[2], 'open_until') or '0')
+    -- 熔断期间返回的是熔断前发出的请求，不再累计
+    if outcome == 'throttled' and now >= open_until then
+        local strikes = redis.call('HINCRBY', KEYS[2], 'strikes', 1)
+        local opens = tonumber(redis.call('HGET', KEYS[2], 'opens') or '0')
+        -- 暂停结束后仍被限流时立即再次熔断
+        if strikes >= tonumber(ARGV[8]) or opens > 0 then
+            opens = redis.call('HINCRBY', KEYS[2], 'opens', 1)
+            open_ms = math.min(tonumber(ARGV[10]), tonumber(ARGV[9]) * 2 ^ (opens - 1))
+            redis.call('HSET', KEYS[2], 'open_until', tostring(now + open_ms), 'strikes', '0')
+        end
+        redis.call('PEXPIRE', KEYS[2], ttl + open_ms)
+    end
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+redis.call('PEXPIRE', KEYS[1], ttl)
+return {tostring(rate), open_ms}
+"""
+
+
+def classify_error(exc):
+    """对请求异常分类：超时视为服务端过载，其余网络错误与请求速率无关"""
+    if isinstance(exc, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+        return OUTCOME_OVERLOADED
+    return OUTCOME_ERROR
+
+
+class RateLimiter:
+    """分布式令牌桶限流器，按每分钟请求数（RPM）配置预算"""
+
+    def __init__(self, redis_conn=None, token_rpm=None, host_rpm=None, burst=None, adaptive=None):
+        """初始化限流器
+
+        Args:
+            redis_conn: Redis连接，默认按配置文件新建
+            token_rpm: 单个access_token每分钟允许的请求数，自适应时为初始速率
+            host_rpm: 单个主机每分钟允许的请求数（所有token合计）
+            burst: 桶容量，即允许的瞬时突发请求数
+            adaptive: 是否按服务器响应调节速率，默认取ADAPTIVE_RATE_ENABLED
+        """
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self.token_rpm = token_rpm or RATE_LIMIT_TOKEN_RPM
+        self.host_rpm = host_rpm or RATE_LIMIT_HOST_RPM
+        self.burst = burst or RATE_LIMIT_BURST
+        self.adaptive = ADAPTIVE_RATE_ENABLED if adaptive is None else adaptive
+        self._script = self.redis_conn.register_script(TOKEN_BUCKET_SCRIPT)
+        self._feedback_script = self.redis_conn.register_script(FEEDBACK_SCRIPT)
+        # 本进程最近一次看到的速率，{(token, 接口): RPM}，只在速率变化时打印
+        self._rates = {}
+
+    @staticmethod
+    def _digest(access_token):
+        """不把token明文写进键名"""
+        return hashlib.sha1(access_token.encode('utf-8')).hexdigest()[:16]
+
+    def _token_key(self, access_token, endpoint=None):
+        """token桶的键名，自适应时每个接口一个桶"""
+        if self.adaptive and endpoint:
+            return f"ratelimit:token:{self._digest(access_token)}:{endpoint}"
+        return f"ratelimit:token:{self._digest(access_token)}"
+
+    def _breaker_key(self, access_token):
+        return f"ratelimit:breaker:{self._digest(access_token)}"
+
+    def _ttl(self):
+        """桶在闲置两个补满周期后自动过期"""
+        slowest = min(self.token_rpm, self.host_rpm)
+        ttl = int(2 * self.burst * 60000 / slowest) + 1000
+        if self.adaptive:
+            ttl = max(ttl, ADAPTIVE_STATE_TTL_MS)
+        return ttl
+
+    def _buckets(self, access_token, host, endpoint=None):
+        """返回本次请求需要扣减的桶及其参数"""
+        keys = []
+        args = []
+        if access_token:
+            keys.append(self._token_key(access_token, endpoint))
+            args.extend([self.burst, self.token_rpm / 60000.0])
+            # 自适应时接口桶之外同时扣减token的总桶，token在各接口合计的速率仍不超过token_rpm
+            if self.adaptive and endpoint:
+                keys.append(self._token_key(access_token))
+                args.extend([self.burst, self.token_rpm / 60000.0])
+        if host:
+            keys.append(f"ratelimit:host:{host}")
+            args.extend([self.burst, self.host_rpm / 60000.0])
+        count = len(keys)
+        if access_token and self.adaptive:
+            keys.append(self._breaker_key(access_token))
+        return keys, [count] + args + [self._ttl()]
+
+    def try_acquire(self, access_token=None, host=BANKLAW_API_HOST, endpoint=None):
+        """尝试取一个令牌
+
+        Args:
+            endpoint: 接口名（如statute_detail），自适应时按接口使用各自的速率
+
+        Returns:
+            float: 0表示已取得令牌，否则为建议等待的秒数
+        """
+        keys, args = self._buckets(access_token, host, endpoint)
+        if not keys:
+            return 0
+        try:
+            wait_ms = self._script(keys=keys, args=args)
+        except redis.RedisError as e:
+            # Redis不可用时退化为本进程内按token预算匀速等待
+            print(f"限流器访问Redis失败，按本地速率等待: {e}")
+            time.sleep(60.0 / self.token_rpm)
+            return 0
+        return int(wait_ms) / 1000.0
+
+    def acquire(self, access_token=None, host=BANKLAW_API_HOST, endpoint=None):
+        """阻塞直到取得令牌，token熔断期间一直等待到暂停结束
+
+        Returns:
+            float: 本次实际等待的秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(access_token, host, endpoint)
+            if wait <= 0:
+                metrics.RATE_LIMITER_WAIT_SECONDS.observe(waited)
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, access_token=None, host=BANKLAW_API_HOST, endpoint=None):
+        """acquire的协程版本，等待期间不阻塞事件循环"""
+        loop = asyncio.get_event_loop()
+        waited = 0.0
+        while True:
+            wait = await loop.run_in_executor(None, self.try_acquire, access_token, host, endpoint)
+            if wait <= 0:
+                metrics.RATE_LIMITER_WAIT_SECONDS.observe(waited)
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def feedback(self, access_token, endpoint, outcome):
+        """按响应分类调整token在该接口的速率，并更新熔断器
+
+        成功时加性提速，被限流或过载时乘性降速，连续被限流时熔断；其他分类不影响速率
+
+        Returns:
+            float: 调整后的每分钟请求数，未调整时返回None
+        """
+        if not (self.adaptive and access_token and endpoint):
+            return None
+        if outcome not in (OUTCOME_OK, OUTCOME_THROTTLED, OUTCOME_OVERLOADED):
+            return None
+        try:
+            rate, open_ms = self._feedback_script(
+                keys=[self._token_key(access_token, endpoint), self._breaker_key(access_token)],
+                args=[outcome, self.token_rpm, AIMD_MIN_RPM, AIMD_MAX_RPM, AIMD_INCREASE_RPM,
+                      AIMD_DECREASE_FACTOR, int(AIMD_DECREASE_COOLDOWN * 1000), BREAKER_THRESHOLD,
+                      int(BREAKER_BASE_SECONDS * 1000), int(BREAKER_MAX_SECONDS * 1000), self._ttl()])
+        except redis.RedisError as e:
+            print(f"更新自适应限流状态失败: {e}")
+            return None
+        rate = float(rate)
+        token = metrics.token_label(access_token)
+        metrics.ADAPTIVE_RATE.labels(token, endpoint).set(rate)
+        previous = self._rates.get((access_token, endpoint))
+        self._rates[(access_token, endpoint)] = rate
+        if outcome != OUTCOME_OK and rate != previous:
+            print(f"{endpoint}接口{'被限流' if outcome == OUTCOME_THROTTLED else '过载'}，"
+                  f"token {access_token[:10]}... 速率调整为每分钟 {rate:.1f} 次")
+        if int(open_ms):
+            metrics.BREAKER_OPENS.labels(token).inc()
+            print(f"token {access_token[:10]}... 连续被限流，暂停 {int(open_ms) / 1000:.0f} 秒")
+        return rate
+
+    def state(self, access_token, endpoints=()):
+        """token当前的自适应速率和熔断状态
+
+        Returns:
+            dict: {'rates': {接口: 每分钟请求数}, 'paused_seconds': 剩余暂停秒数}
+        """
+        pipe = self.redis_conn.pipeline()
+        for endpoint in endpoints:
+            pipe.hget(self._token_key(access_token, endpoint), 'rate')
+        pipe.hget(self._breaker_key(access_token), 'open_until')
+        values = pipe.execute()
+        rates = {endpoint: float(value) if value else float(self.token_rpm)
+                 for endpoint, value in zip(endpoints, values)}
+        open_until = int(values[-1] or 0) / 1000.0
+        return {'rates': rates, 'paused_seconds': max(0.0, open_until - time.time())}
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """获取进程内共享的限流器实例"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def observe_response(access_token, endpoint, status_code, data=None, page_index=None, page_size=None):
+    """对一次接口响应分类，结果同时反馈给token健康缓存和自适应限流
+
+    目录和详情请求收到响应后都调用这里，page_index和page_size为目录请求的页码和每页条数
+
+    Returns:
+        tuple: (分类, 原因)
+    """
+    outcome, reason = classify_response(status_code, data, page_index, page_size)
+    get_token_health_cache().record_response(access_token, status_code, data, page_index, page_size)
+    get_rate_limiter().feedback(access_token, endpoint, outcome)
+    return outcome, reason
+
+
+def observe_error(access_token, endpoint, exc):
+    """请求没有收到响应时的反馈，超时按服务端过载降速
+
+    Returns:
+        str: 分类
+    """
+    outcome = classify_error(exc)
+    get_rate_limiter().feedback(access_token, endpoint, outcome)
+    return outcome
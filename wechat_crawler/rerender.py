@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线批量重新渲染
+遍历原始响应归档，用进程池并行执行extract_article_from_json并原子写入文本文件，
+修改输出格式后无需再请求接口
+
+用法: python -m wechat_crawler.rerender [--output-dir 目录] [--workers 进程数] [--hierarchy 层级ID] [--year 年份]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .archive import latest_records, decompress_frame
+from .config import ARCHIVE_DIR
+from .crawler import extract_article_from_json
+from .dedup import assign_paths
+
+
+def _write_atomic(content, file_path):
+    """先写临时文件再替换，中断时不会留下半个文件"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+
+
+def _render_chunk(archive_dir, jobs):
+    """在子进程中渲染一批记录，同一分片只打开一次
+
+    Args:
+        jobs: [(索引记录, 输出路径)]
+
+    Returns:
+        tuple: (成功数量, 失败列表[(id, 错误)])
+    """
+    handles = {}
+    success = 0
+    failed = []
+    try:
+        for record, file_path in jobs:
+            try:
+                shard = record['shard']
+                if shard not in handles:
+                    handles[shard] = open(os.path.join(archive_dir, shard), 'rb')
+                f = handles[shard]
+                f.seek(record['offset'])
+                body = decompress_frame(f.read(record['length']), os.path.splitext(shard)[1])
+                _write_atomic(extract_article_from_json(body), file_path)
+                success += 1
+            except Exception as e:
+                failed.append((record.get('id'), str(e)))
+    finally:
+        for f in handles.values():
+            f.close()
+    return success, failed
+
+
+def plan_jobs(archive_dir=None, output_dir=None, hierarchy_id=None, year=None):
+    """读取归档索引，确定每篇文档的输出路径
+
+    同一ID归档过多次时取fetched_at最新的一次；输出路径沿用下载时去重索引记录的文件，
+    没有记录的按标题确定，见dedup.assign_paths
+
+    Returns:
+        list: [(索引记录, 输出路径)]，按分片和偏移排序
+    """
+    latest = [record for record in latest_records(archive_dir).values()
+              if (hierarchy_id is None or record.get('hierarchy_id') == hierarchy_id)
+              and (year is None or record.get('year') == year)]
+    paths = assign_paths(((record['id'], record.get('title'), record.get('hierarchy_id'), record.get('year'))
+                          for record in latest), output_dir)
+    jobs = [(record, paths[record['id']]) for record in latest]
+    jobs.sort(key=lambda job: (job[0]['shard'], job[0]['offset']))
+    return jobs
+
+
+def rerender_archive(archive_dir=None, output_dir=None, workers=None, chunk_size=200,
+                     hierarchy_id=None, year=None):
+    """把归档中的原始响应全部重新渲染为文本文件
+
+    Args:
+        archive_dir: 归档目录，默认取ARCHIVE_DIR
+        output_dir: 输出目录，默认取SAVE_DIR，目录结构与下载时一致
+        workers: 进程数，默认为CPU核数
+        chunk_size: 每个子任务处理的文档数
+        hierarchy_id: 只处理指定层级
+        year: 只处理指定年份
+
+    Returns:
+        tuple: (成功数量, 失败数量)
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    jobs = plan_jobs(archive_dir, output_dir, hierarchy_id, year)
+    if not jobs:
+        print(f"归档目录 {archive_dir} 中没有可渲染的记录")
+        return 0, 0
+    workers = workers or os.cpu_count() or 1
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    print(f"开始重新渲染 {len(jobs)} 篇文档，进程数: {workers}，子任务数: {len(chunks)}")
+
+    start = time.time()
+    total_success = 0
+    total_failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_render_chunk, archive_dir, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            success, failed = future.result()
+            total_success += success
+            total_failed += len(failed)
+            for doc_id, error in failed:
+                print(f"渲染失败: {doc_id} {error}")
+            elapsed = time.time() - start
+            done = total_success + total_failed
+            print(f"进度: {done}/{len(jobs)}，{done / elapsed:.1f} 篇/秒")
+
+    elapsed = time.time() - start
+    print(f"重新渲染完成，成功: {total_success}, 失败: {total_failed}，"
+          f"耗时 {elapsed:.1f} 秒，{(total_success + total_failed) / elapsed:.1f} 篇/秒")
+    return total_success, total_failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从原始响应归档离线重新渲染法规文本")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help="归档目录")
+    parser.add_argument('--output-dir', default=SAVE_DIR, help="输出目录")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument('--chunk-size', type=int, default=200, help="每个子任务处理的文档数")
+    parser.add_argument('--hierarchy', type=int, default=None, help="只处理指定层级ID")
+    parser.add_argument('--year', type=int, default=None, help="只处理指定年份")
+    args = parser.parse_args()
+    rerender_archive(args.archive_dir, args.output_dir, args.workers, args.chunk_size,
+                     args.hierarchy, args.year)
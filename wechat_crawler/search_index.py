@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+已下载法规的全文检索索引（SQLite FTS5）
+索引标题、发文字号、发布日期、层级、发布机构和正文，下载写入文件时同步入索引，
+也可以对已有的downloaded_regulations目录或原始响应归档增量建立索引
+
+中文分词：连续的中文片段拆成重叠的二元组并补上片段末字，查询词按同样规则拆分后做短语匹配，
+效果等同于子串匹配，倒排表比逐字索引小得多；数字和英文交给FTS5的unicode61分词
+
+正文只保存一份：已写入文件的文档只把分词结果写入倒排表，检索片段和全文从文件按块读取，
+没有对应文件的文档（如只在归档中的）才把正文存入doc_bodies
+
+用法: python -m wechat_crawler.search_index [--archive] [--rebuild]
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from .config import SAVE_DIR, SEARCH_INDEX_PATH, SEARCH_INDEX_ON_WRITE
+
+_CJK_RUN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_WORD_RE = re.compile(r'[^\W_]+')
+_HIERARCHY_DIR_RE = re.compile(r'hierarchy_(\d+)_(.+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    doc_key TEXT NOT NULL UNIQUE,
+    statute_id TEXT,
+    title TEXT,
+    document_no TEXT,
+    publish_date TEXT,
+    hierarchy_id INTEGER,
+    hierarchy_name TEXT,
+    department TEXT,
+    path TEXT UNIQUE,
+    mtime REAL,
+    fts_rowid INTEGER
+);
+-- 没有对应文件的文档的正文，单独存放，检索和分面统计只读取很小的docs行
+CREATE TABLE IF NOT EXISTS doc_bodies (
+    id INTEGER PRIMARY KEY,
+    body TEXT
+);
+CREATE INDEX IF NOT EXISTS docs_hierarchy ON docs(hierarchy_id);
+CREATE INDEX IF NOT EXISTS docs_publish_date ON docs(publish_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    title, document_no, department, body,
+    content='', tokenize='unicode61 remove_diacritics 0'
+);
+"""
+
+# 可以单独检索的字段
+SEARCH_FIELDS = ('title', 'document_no', 'department', 'body')
+
+
+def _cjk_tokens(run, final_unigram=True):
+    """中文片段的二元组，final_unigram为True时补上片段末字"""
+    if len(run) == 1:
+        return [run]
+    grams = [run[i:i + 2] for i in range(len(run) - 1)]
+    if final_unigram:
+        grams.append(run[-1])
+    return grams
+
+
+def tokenize(text):
+    """写入索引前的分词，返回以空格分隔的文本"""
+    return _CJK_RUN_RE.sub(lambda m: ' ' + ' '.join(_cjk_tokens(m.group())) + ' ', text or '')
+
+
+class FileChunks:
+    """按行切分读取文本文件的可迭代对象，每块约chunk_size个字符
+
+    中文片段不会跨行，逐块分词的结果与整篇分词相同
+    """
+
+    def __init__(self, path, chunk_size=65536):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = []
+            size = 0
+            for line in f:
+                lines.append(line)
+                size += len(line)
+                if size >= self.chunk_size:
+                    yield ''.join(lines)
+                    lines = []
+                    size = 0
+            if lines:
+                yield ''.join(lines)
+
+
+def _body_chunks(body, path):
+    """文档正文的文本块：字符串原样返回，为None时从文件读取，文件不存在时为空"""
+    if isinstance(body, str):
+        return [body]
+    if body is not None:
+        return body
+    if path and os.path.exists(path):
+        return FileChunks(path)
+    return []
+
+
+def _term_phrase(term):
+    """把一个查询词转换为FTS5短语
+
+    查询词中最后一个中文片段不补末字（它在文档中可能位于更长片段的中间），
+    只有一个字时改为前缀匹配
+    """
+    runs = list(_CJK_RUN_RE.finditer(term))
+    tokens = []
+    prefix = False
+    pos = 0
+    for i, match in enumerate(runs):
+        tokens.extend(_WORD_RE.findall(term[pos:match.start()]))
+        run = match.group()
+        last = i == len(runs) - 1 and not _WORD_RE.search(term[match.end():])
+        if last and len(run) == 1:
+            tokens.append(run)
+            prefix = True
+        else:
+            tokens.extend(_cjk_tokens(run, final_unigram=not last))
+        pos = match.end()
+    tokens.extend(_WORD_RE.findall(term[pos:]))
+    if not tokens:
+        return None
+    return '"' + ' '.join(tokens) + '"' + (' *' if prefix else '')
+
+
+def build_match(query, field=None):
+    """把用户输入转换为FTS5查询表达式，空格分隔的多个词之间为AND关系"""
+    phrases = [p for p in (_term_phrase(t) for t in (query or '').split()) if p]
+    if not phrases:
+        return None
+    expression = ' AND '.join(phrases)
+    if field:
+        if field not in SEARCH_FIELDS:
+            raise ValueError(f"不支持的检索字段: {field}")
+        expression = f"{field} : ({expression})"
+    return expression
+
+
+def _snippet(chunks, query, width=60):
+    """截取正文中第一个含查询词的文本块里该词附近的片段，都不含时取开头"""
+    terms = (query or '').split()
+    head = None
+    for chunk in chunks:
+        if head is None:
+            head = chunk[:width * 2]
+        for term in terms:
+            position = chunk.find(term)
+            if position >= 0:
+                start = max(0, position - width)
+                return ' '.join(chunk[start:position + width].split())
+    return ' '.join((head or '').split())
+
+
+class SearchIndex:
+    """法规全文检索索引，写入线程安全，多个进程可以共用一个数据库文件"""
+
+    def __init__(self, path=None):
+        self.path = path or SEARCH_INDEX_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+        # 检索时用于分面统计的文档元数据缓存，以及全文索引rowid到文档id的映射
+        self._meta = None
+        self._fts_ids = None
+        self._meta_version = None
+
+    def _migrate(self):
+        """旧版本的docs表没有fts_rowid列，全文索引的rowid与文档id相同"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(docs)")]
+        if 'fts_rowid' in columns:
+            return
+        try:
+            with self.conn:
+                self.conn.execute("ALTER TABLE docs ADD COLUMN fts_rowid INTEGER")
+                self.conn.execute("UPDATE docs SET fts_rowid = id")
+        except sqlite3.OperationalError:
+            # 其他进程已经完成迁移
+            pass
+
+    def _delete_rows(self, rows):
+        """删除文档
+
+        无内容FTS表需要提供写入时的原值才能删除倒排记录；正文保存在文件中的文档，
+        文件此时已被覆盖，倒排记录留在表中，它的rowid不再对应任何文档，检索时被忽略，
+        新文档使用新的rowid，不会与之混淆；rebuild时一并清除
+        """
+        for row in rows:
+            if row['body'] is not None:
+                self.conn.execute(
+                    "INSERT INTO docs_fts(docs_fts, rowid, title, document_no, department, body) "
+                    "VALUES('delete', ?, ?, ?, ?, ?)",
+                    (row['fts_rowid'], tokenize(row['title']), tokenize(row['document_no']),
+                     tokenize(row['department']), tokenize(row['body']))
+                )
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (row['id'],))
+            self.conn.execute("DELETE FROM doc_bodies WHERE id = ?", (row['id'],))
+
+    def _add(self, doc):
+        statute_id = doc.get('statute_id')
+        path = doc.get('path')
+        doc_key = statute_id or f"file:{path}"
+        # 同一ID或同一文件只保留最新的一条
+        old = self.conn.execute(
+            "SELECT d.id, d.fts_rowid, d.title, d.document_no, d.department, b.body FROM docs d "
+            "LEFT JOIN doc_bodies b ON b.id = d.id WHERE d.doc_key = ? OR d.path = ?",
+            (doc_key, path)
+        ).fetchall()
+        self._delete_rows(old)
+        body = doc.get('body')
+        # 正文已写入文件时只分词不另存，分词按块进行，不把整篇正文读入内存
+        on_disk = bool(path) and os.path.exists(path)
+        if not on_disk and body is not None and not isinstance(body, str):
+            body = ''.join(body)
+        chunks = _body_chunks(body, path)
+        fts = self.conn.execute(
+            "INSERT INTO docs_fts(title, document_no, department, body) VALUES (?, ?, ?, ?)",
+            (tokenize(doc.get('title')), tokenize(doc.get('document_no')),
+             tokenize(doc.get('department')), ' '.join(tokenize(chunk) for chunk in chunks))
+        )
+        cursor = self.conn.execute(
+            "INSERT INTO docs(doc_key, statute_id, title, document_no, publish_date, hierarchy_id, "
+            "hierarchy_name, department, path, mtime, fts_rowid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (doc_key, statute_id, doc.get('title'), doc.get('document_no'), doc.get('publish_date'),
+             doc.get('hierarchy_id'), doc.get('hierarchy_name'), doc.get('department'), path,
+             doc.get('mtime'), fts.lastrowid)
+        )
+        if not on_disk:
+            self.conn.execute("INSERT INTO doc_bodies(id, body) VALUES (?, ?)", (cursor.lastrowid, body))
+
+    def add(self, doc):
+        """加入或更新一篇文档
+
+        Args:
+            doc: 字典，包含statute_id、title、document_no、publish_date、hierarchy_id、
+                 hierarchy_name、department、path、mtime、body，缺少的字段为空；
+                 body可以是字符串、按行切分的文本块（如FileChunks），
+                 或为None表示从path读取
+        """
+        self.add_many([doc])
+
+    def add_many(self, docs):
+        """在一个事务中批量加入文档"""
+        with self._lock:
+            with self.conn:
+                for doc in docs:
+                    self._add(doc)
+            # 本连接的写入不会改变data_version，需要手动清空缓存
+            self._meta = None
+            self._fts_ids = None
+
+    def indexed_files(self):
+        """已索引的文件及其修改时间 {path: mtime}"""
+        with self._lock:
+            rows = self.conn.execute("SELECT path, mtime FROM docs WHERE path IS NOT NULL").fetchall()
+        return {row['path']: row['mtime'] for row in rows}
+
+    def indexed_ids(self):
+        """已索引的statuteId及其文件路径 {statute_id: path}"""
+        with self._lock:
+            rows = self.conn.execute("SELECT statute_id, path FROM docs WHERE statute_id IS NOT NULL").fetchall()
+        return {row['statute_id']: row['path'] for row in rows}
+
+    def _load_meta(self):
+        """返回 ({id: (层级ID, 年份, 发布机构, 发布日期)}, {全文索引rowid: id})，其他连接写入过数据库后重新加载"""
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._meta is None or version != self._meta_version:
+            rows = self.conn.execute(
+                "SELECT id, hierarchy_id, substr(publish_date, 1, 4), department, publish_date, fts_rowid FROM docs"
+            ).fetchall()
+            self._meta = {row[0]: tuple(row[1:5]) for row in rows}
+            self._fts_ids = {row[5]: row[0] for row in rows}
+            self._meta_version = version
+        return self._meta, self._fts_ids
+
+    @staticmethod
+    def _facets(meta, ids, filters, limit):
+        """一次遍历命中文档统计分面并过滤，每个维度的统计忽略该维度自身的过滤条件
+
+        Returns:
+            tuple: (满足全部过滤条件的id列表, 分面字典)
+        """
+        keys = ('hierarchy_id', 'year', 'department')
+        active = [i for i, key in enumerate(keys) if filters[key] is not None]
+        wanted = [filters[key] for key in keys]
+        counters = [Counter(), Counter(), Counter()]
+        matched = []
+        for doc_id in ids:
+            values = meta.get(doc_id)
+            if values is None:
+                continue
+            failed = [i for i in active if values[i] != wanted[i]]
+            if not failed:
+                matched.append(doc_id)
+                for i in range(3):
+                    counters[i][values[i]] += 1
+            elif len(failed) == 1:
+                counters[failed[0]][values[failed[0]]] += 1
+        facets = {}
+        for name, counter in zip(('hierarchy', 'year', 'department'), counters):
+            facets[name] = [{'value': str(value), 'count': count}
+                            for value, count in counter.most_common() if value][:limit]
+        return matched, facets
+
+    def search(self, query='', field=None, hierarchy_id=None, year=None, department=None,
+               page=1, page_size=20, facet_limit=20):
+        """检索文档
+
+        Args:
+            query: 检索词，多个词用空格分隔，为空时按发布日期倒序浏览
+            field: 只在指定字段中检索，见SEARCH_FIELDS
+            hierarchy_id, year, department: 过滤条件
+            page: 页码，从1开始
+            page_size: 每页条数
+
+        Returns:
+            dict: {total, page, page_size, results, facets}，
+                  facets中每个维度的统计不受该维度自身过滤条件的影响
+        """
+        match = build_match(query, field)
+        if query and query.strip() and match is None:
+            return {'total': 0, 'page': page, 'page_size': page_size, 'results': [],
+                    'facets': {'hierarchy': [], 'year': [], 'department': []}}
+        filters = {'hierarchy_id': hierarchy_id, 'year': str(year) if year is not None else None,
+                   'department': department or None}
+        offset = (page - 1) * page_size
+        with self._lock:
+            meta, fts_ids = self._load_meta()
+            if match:
+                # 只执行一次全文匹配，相关度、总数和分面都基于这次结果；不对应任何文档的倒排记录忽略
+                ranks = {}
+                for rowid, score in self.conn.execute(
+                    "SELECT rowid, bm25(docs_fts, 10.0, 5.0, 2.0, 1.0) FROM docs_fts WHERE docs_fts MATCH ?",
+                    (match,)
+                ):
+                    doc_id = fts_ids.get(rowid)
+                    if doc_id is not None:
+                        ranks[doc_id] = score
+                matched, facets = self._facets(meta, ranks, filters, facet_limit)
+                page_ids = heapq.nsmallest(offset + page_size, matched, key=ranks.__getitem__)[offset:]
+            else:
+                matched, facets = self._facets(meta, meta, filters, facet_limit)
+                page_ids = heapq.nlargest(offset + page_size, matched,
+                                          key=lambda doc_id: meta[doc_id][3] or '')[offset:]
+            rows = {}
+            if page_ids:
+                placeholders = ','.join('?' * len(page_ids))
+                for row in self.conn.execute(
+                    f"SELECT d.id, d.statute_id, d.title, d.document_no, d.publish_date, d.hierarchy_id, "
+                    f"d.hierarchy_name, d.department, d.path, b.body FROM docs d "
+                    f"LEFT JOIN doc_bodies b ON b.id = d.id WHERE d.id IN ({placeholders})", page_ids
+                ):
+                    rows[row['id']] = row
+
+        results = []
+        for doc_id in page_ids:
+            row = rows[doc_id]
+            item = {k: row[k] for k in row.keys() if k not in ('id', 'body')}
+            item['snippet'] = _snippet(_body_chunks(row['body'], row['path']), query)
+            results.append(item)
+        return {'total': len(matched), 'page': page, 'page_size': page_size, 'results': results, 'facets': facets}
+
+    def get(self, statute_id):
+        """按statuteId取文档全文，不存在时返回None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT d.statute_id, d.title, d.document_no, d.publish_date, d.hierarchy_id, d.hierarchy_name, "
+                "d.department, d.path, b.body FROM docs d LEFT JOIN doc_bodies b ON b.id = d.id "
+                "WHERE d.statute_id = ?", (statute_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        document = dict(row)
+        document['body'] = ''.join(_body_chunks(document['body'], document['path']))
+        return document
+
+    def stats(self):
+        """索引中的文档数"""
+        with self._lock:
+            count = self.conn.execute("SELECT count(*) FROM docs").fetchone()[0]
+        return {'documents': count, 'path': self.path}
+
+    def rebuild(self):
+        """清空索引"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM docs")
+                self.conn.execute("DELETE FROM doc_bodies")
+                self.conn.execute("INSERT INTO docs_fts(docs_fts) VALUES('delete-all')")
+            self._meta = None
+            self._fts_ids = None
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_article(text):
+    """从渲染后的文章中取出标题和发布时间"""
+    title = None
+    publish_date = None
+    for line in text.split("\n", 8)[:8]:
+        if title is None and line.startswith("# "):
+            title = line[2:]
+        elif line.startswith("发布时间: "):
+            publish_date = line[len("发布时间: "):]
+            break
+    return title, publish_date
+
+
+def index_text_tree(index, save_dir=None, batch_size=500):
+    """增量索引已下载的文本文件，修改时间未变的文件跳过
+
+    文本文件中没有发文字号和发布机构，需要这两项时使用index_archive
+
+    Returns:
+        int: 新索引的文件数
+    """
+    save_dir = save_dir or SAVE_DIR
+    known = index.indexed_files()
+    batch = []
+    added = 0
+    for root, _, files in os.walk(save_dir):
+        parts = os.path.relpath(root, save_dir).split(os.sep)
+        match = _HIERARCHY_DIR_RE.match(parts[0]) if parts else None
+        for name in files:
+            if not name.endswith('.txt'):
+                continue
+            path = os.path.join(root, name)
+            mtime = os.path.getmtime(path)
+            if known.get(path) == mtime:
+                continue
+            # 只读取开头几行取标题和发布时间，正文在写入索引时按块读取
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                head = ''.join(itertools.islice(f, 8))
+            title, publish_date = parse_article(head)
+            # 没有发布时间的文件用所在的年份目录，保证年份分面可用
+            if not publish_date and len(parts) > 1 and parts[1].isdigit():
+                publish_date = parts[1]
+            batch.append({
+                'title': title or name[:-4],
+                'publish_date': publish_date,
+                'hierarchy_id': int(match.group(1)) if match else None,
+                'hierarchy_name': match.group(2) if match else None,
+                'path': path,
+                'mtime': mtime,
+                'body': None,
+            })
+            if len(batch) >= batch_size:
+                index.add_many(batch)
+                added += len(batch)
+                batch = []
+    if batch:
+        index.add_many(batch)
+        added += len(batch)
+    print(f"文本文件索引完成，新增或更新 {added} 篇，索引共 {index.stats()['documents']} 篇")
+    return added
+
+
+def document_from_detail(statute_id, detail, body, hierarchy_id=None, path=None):
+    """把详情接口的data字段整理为索引文档"""
+    from .crawler import HIERARCHIES
+    return {
+        'statute_id': statute_id,
+        'title': detail.get('title'),
+        'document_no': detail.get('documentNo'),
+        'publish_date': detail.get('publishDate'),
+        'hierarchy_id': hierarchy_id,
+        'hierarchy_name': HIERARCHIES.get(hierarchy_id) if hierarchy_id else None,
+        'department': detail.get('publishingDepartment') or detail.get('department'),
+        'path': path,
+        'mtime': os.path.getmtime(path) if path and os.path.exists(path) else None,
+        'body': body,
+    }
+
+
+def index_archive(index, archive_dir=None, save_dir=None, batch_size=500):
+    """从原始响应归档增量建立索引，包含发文字号和发布机构，已索引的ID跳过
+
+    同一ID归档过多次时取fetched_at最新的一次；文件路径沿用下载时去重索引记录的文件，
+    没有记录的按标题确定，与下载和重新渲染时一致
+
+    Returns:
+        int: 新索引的文档数
+    """
+    import json
+    from .archive import latest_records, read_record
+    from .crawler import extract_article_from_json
+    from .dedup import assign_paths
+
+    known = index.indexed_ids()
+    records = [record for doc_id, record in latest_records(archive_dir).items() if doc_id not in known]
+    paths = assign_paths(((record['id'], record.get('title'), record.get('hierarchy_id'), record.get('year'))
+                          for record in records), save_dir,
+                         taken={path: statute_id for statute_id, path in known.items() if path})
+    batch = []
+    added = 0
+    for record in records:
+        try:
+            data = json.loads(read_record(record, archive_dir))
+            body = extract_article_from_json(data)
+        except Exception as e:
+            print(f"读取归档记录 {record['id']} 失败: {e}")
+            continue
+        batch.append(document_from_detail(record['id'], data['data'], body, record.get('hierarchy_id'),
+                                          paths[record['id']]))
+        if len(batch) >= batch_size:
+            index.add_many(batch)
+            added += len(batch)
+            batch = []
+    if batch:
+        index.add_many(batch)
+        added += len(batch)
+    print(f"归档索引完成，新增 {added} 篇，索引共 {index.stats()['documents']} 篇")
+    return added
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """获取进程内共享的检索索引"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
+
+
+def get_write_index():
+    """下载时同步写入的索引，未开启SEARCH_INDEX_ON_WRITE时返回None"""
+    return get_search_index() if SEARCH_INDEX_ON_WRITE else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为已下载的法规建立全文检索索引")
+    parser.add_argument('--archive', action='store_true', help="从原始响应归档建立索引（包含发文字号和发布机构）")
+    parser.add_argument('--rebuild', action='store_true', help="清空后重建")
+    args = parser.parse_args()
+    search_index = get_search_index()
+    if args.rebuild:
+        search_index.rebuild()
+    if args.archive:
+        index_archive(search_index)
+    index_text_tree(search_index)
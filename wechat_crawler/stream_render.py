@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+法规详情的流式解析与渲染
+needSentence=true时大法规的详情响应有数MB，整体json.loads会把全部段落和句子载入内存；
+这里用事件驱动的ijson边下载边解析data.paragraphs，只取groupId和content，
+段落清理后立即写入临时文件，单篇文档在途时只占用很少的内存
+
+输出与extract_article_from_json完全一致：段落按groupId稳定排序，
+响应中groupId乱序时按记录的偏移重新排列临时文件中的段落
+"""
+
+import os
+import re
+import shutil
+from operator import itemgetter
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# 段落中的HTML标签
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# 需要保留的顶层字段：事件前缀 -> 字段名
+_META_FIELDS = {
+    'code': 'code',
+    'message': 'message',
+    'data.title': 'title',
+    'data.publishDate': 'publishDate',
+    'data.documentNo': 'documentNo',
+    'data.publishingDepartment': 'publishingDepartment',
+    'data.department': 'department',
+}
+_PARAGRAPH_PREFIX = 'data.paragraphs.item'
+_PARAGRAPH_FIELDS = {
+    'data.paragraphs.item.groupId': 'groupId',
+    'data.paragraphs.item.content': 'content',
+}
+
+
+class ArticleStreamWriter:
+    """接收ijson解析事件，把段落写入临时文件，commit时生成最终文章"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self._body_path = f"{file_path}.body{os.getpid()}-{id(self)}"
+        self._body = open(self._body_path, 'w+b')
+        self._size = 0
+        # 每个非空段落在临时文件中的位置：(groupId, 偏移, 长度)
+        self._segments = []
+        self._in_order = True
+        self._last_group = None
+        self._current = None
+        self._has_paragraphs = False
+        self.meta = {}
+
+    def feed(self, prefix, event, value):
+        """处理一个解析事件"""
+        if prefix == _PARAGRAPH_PREFIX:
+            if event == 'start_map':
+                self._current = {}
+            elif event == 'end_map':
+                self._emit(self._current)
+                self._current = None
+        elif prefix in _PARAGRAPH_FIELDS:
+            if self._current is not None:
+                self._current[_PARAGRAPH_FIELDS[prefix]] = value
+        elif prefix == 'data.paragraphs' and event == 'start_array':
+            self._has_paragraphs = True
+        elif prefix in _META_FIELDS and event in ('string', 'number'):
+            self.meta[_META_FIELDS[prefix]] = value
+
+    def _emit(self, paragraph):
+        group_id = paragraph['groupId']
+        content = HTML_TAG_RE.sub('', paragraph['content'])
+        if self._last_group is not None and group_id < self._last_group:
+            self._in_order = False
+        self._last_group = group_id
+        # 跳过空段落
+        if not content or content.isspace():
+            return
+        encoded = (content + "\n\n").encode('utf-8')
+        self._body.write(encoded)
+        self._segments.append((group_id, self._size, len(encoded)))
+        self._size += len(encoded)
+
+    def commit(self):
+        """写出标题和排序后的段落，原子替换到目标路径"""
+        if 'title' not in self.meta or 'publishDate' not in self.meta or not self._has_paragraphs:
+            raise Exception("详情响应缺少title、publishDate或paragraphs")
+        header = f"# {self.meta['title']}\n\n发布时间: {self.meta['publishDate']}\n\n"
+        tmp_path = f"{self.file_path}.tmp{os.getpid()}-{id(self)}"
+        self._body.flush()
+        with open(tmp_path, 'wb') as out:
+            out.write(header.encode('utf-8'))
+            if self._in_order:
+                self._body.seek(0)
+                shutil.copyfileobj(self._body, out)
+            else:
+                for _, offset, length in sorted(self._segments, key=itemgetter(0)):
+                    self._body.seek(offset)
+                    out.write(self._body.read(length))
+        os.replace(tmp_path, self.file_path)
+
+    def close(self):
+        """删除临时文件，无论是否commit都需要调用"""
+        self._body.close()
+        if os.path.exists(self._body_path):
+            os.remove(self._body_path)
+
+
+class ChunkReader:
+    """把iter_content包装成ijson需要的文件对象，读到的原始字节同时交给sink（如归档）"""
+
+    def __init__(self, chunks, sink=None):
+        self._chunks = iter(chunks)
+        self._sink = sink
+        self._buffer = b''
+
+    def read(self, size=-1):
+        # ijson先用read(0)探测返回类型
+        if size == 0:
+            return b''
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return b''
+            if self._sink is not None and self._buffer:
+                self._sink.write(self._buffer)
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class AsyncChunkReader:
+    """aiohttp响应流的异步版本，供ijson的异步接口使用"""
+
+    def __init__(self, content, chunk_size, sink=None):
+        self._content = content
+        self._chunk_size = chunk_size
+        self._sink = sink
+
+    async def read(self, size=-1):
+        if size == 0:
+            return b''
+        data = await self._content.read(size if size and size > 0 else self._chunk_size)
+        if self._sink is not None and data:
+            self._sink.write(data)
+        return data
+
+
+def stream_to_writer(reader, writer):
+    """同步解析响应流并交给writer"""
+    for prefix, event, value in ijson.parse(reader):
+        writer.feed(prefix, event, value)
+
+
+async def stream_to_writer_async(reader, writer):
+    """异步解析响应流并交给writer"""
+    async for prefix, event, value in ijson.parse(reader):
+        writer.feed(prefix, event, value)
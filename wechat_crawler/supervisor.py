@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多进程分片爬取
+把(层级, 年份)的组合作为分片，由一个主进程管理固定数量的工作进程并行爬取：
+每个工作进程爬完一个分片后退出，异常退出的分片等待一段时间后重新启动，断点续传保证从中断处继续；
+所有工作进程共用Redis中的token池、每日预算和限流器，只有主进程会在token不足时提示扫码登录；
+主进程定期从断点进度和失败重试队列汇总各分片的进度
+
+用法: python run.py --supervisor
+      python -m wechat_crawler.supervisor [--workers 4] [--hierarchies 1,2,3] [--start-year 2022] [--end-year 2025]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from .config import (
+    START_YEAR, END_YEAR, METRICS_PORT,
+    SUPERVISOR_WORKERS, SUPERVISOR_HIERARCHIES, SUPERVISOR_MAX_RESTARTS,
+    SUPERVISOR_REPORT_INTERVAL, SUPERVISOR_LOG_DIR
+)
+from .crawler import HIERARCHIES
+from .checkpoint import get_checkpoint
+from .failure_store import get_failure_store
+
+STATE_PENDING = 'pending'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+STATE_NAMES = {
+    STATE_PENDING: "等待",
+    STATE_RUNNING: "运行中",
+    STATE_DONE: "完成",
+    STATE_FAILED: "放弃",
+}
+
+# 异常退出后重启前的等待秒数，按重启次数翻倍
+RESTART_BASE_DELAY = 10
+RESTART_MAX_DELAY = 300
+
+
+def _run_shard(hierarchy_id, year, log_path, metrics_port=0):
+    """工作进程入口：爬取一个分片，输出写入该分片的日志文件"""
+    log = open(log_path, 'a', encoding='utf-8', buffering=1)
+    sys.stdout = sys.stderr = log
+    if metrics_port:
+        from .metrics import start_metrics_server
+        start_metrics_server(metrics_port)
+    from .crawler_scheduler import CrawlerScheduler
+    print(f"===== {time.strftime('%Y-%m-%d %H:%M:%S')} 开始爬取 {HIERARCHIES[hierarchy_id]} {year}年 =====")
+    # 工作进程不弹出扫码登录，token不足时等待主进程补充
+    scheduler = CrawlerScheduler(allow_login=False)
+    scheduler.start_crawler(hierarchy_id=hierarchy_id, year=year)
+    print(f"===== {time.strftime('%Y-%m-%d %H:%M:%S')} 分片完成 =====")
+
+
+class Shard:
+    """一个(层级, 年份)分片及其工作进程的状态"""
+
+    def __init__(self, hierarchy_id, year):
+        self.hierarchy_id = hierarchy_id
+        self.year = year
+        self.state = STATE_PENDING
+        self.restarts = 0
+        self.process = None
+        self.slot = None
+        self.retry_at = 0
+
+    @property
+    def name(self):
+        return f"{HIERARCHIES[self.hierarchy_id]} {self.year}年"
+
+
+class Supervisor:
+    """按(层级, 年份)分片启动工作进程，重启异常退出的进程并汇总进度"""
+
+    def __init__(self, hierarchies=None, start_year=None, end_year=None, workers=None,
+                 max_restarts=None, scheduler=None):
+        """初始化
+
+        Args:
+            hierarchies: 爬取的层级ID列表，默认取SUPERVISOR_HIERARCHIES
+            start_year: 开始年份，默认取START_YEAR
+            end_year: 结束年份，默认取END_YEAR
+            workers: 工作进程数，默认取SUPERVISOR_WORKERS，为0时取CPU核数
+            max_restarts: 分片异常退出后最多重启的次数
+            scheduler: 主进程中用于检查和补充token的CrawlerScheduler，为None时不维护token池
+        """
+        hierarchies = hierarchies or SUPERVISOR_HIERARCHIES
+        start_year = start_year or START_YEAR
+        end_year = end_year or END_YEAR
+        # 同一年份的各层级排在一起，并行的工作进程分散在不同层级的目录文件上
+        self.shards = [Shard(hierarchy_id, year)
+                       for year in range(start_year, end_year + 1)
+                       for hierarchy_id in hierarchies]
+        workers = workers or SUPERVISOR_WORKERS or os.cpu_count() or 1
+        self.workers = max(1, min(workers, len(self.shards)))
+        self.max_restarts = SUPERVISOR_MAX_RESTARTS if max_restarts is None else max_restarts
+        self.scheduler = scheduler
+        self.checkpoint = get_checkpoint()
+        self.failures = get_failure_store()
+        # 工作进程重新导入模块，不继承主进程的Redis连接和线程
+        self.ctx = multiprocessing.get_context('spawn')
+        self.started_at = None
+
+    def _log_path(self, shard):
+        return os.path.join(SUPERVISOR_LOG_DIR, f"hierarchy_{shard.hierarchy_id}_{shard.year}.log")
+
+    def _running(self):
+        return [shard for shard in self.shards if shard.state == STATE_RUNNING]
+
+    def _start(self, shard, slot):
+        # 每个工作进程在METRICS_PORT之后按槽位使用独立的指标端口
+        metrics_port = METRICS_PORT + 1 + slot if METRICS_PORT else 0
+        shard.process = self.ctx.Process(
+            target=_run_shard,
+            args=(shard.hierarchy_id, shard.year, self._log_path(shard), metrics_port),
+            name=f"crawler-{shard.hierarchy_id}-{shard.year}"
+        )
+        shard.process.start()
+        shard.slot = slot
+        shard.state = STATE_RUNNING
+        print(f"启动工作进程 {shard.process.pid}: {shard.name}，日志: {self._log_path(shard)}")
+
+    def _launch(self):
+        """在空闲槽位上启动等待中的分片"""
+        running = self._running()
+        free_slots = sorted(set(range(self.workers)) - {shard.slot for shard in running})
+        now = time.time()
+        for shard in self.shards:
+            if not free_slots:
+                break
+            if shard.state == STATE_PENDING and shard.retry_at <= now:
+                self._start(shard, free_slots.pop(0))
+
+    def _reap(self):
+        """回收已退出的工作进程，异常退出的分片安排重启"""
+        for shard in self._running():
+            if shard.process.is_alive():
+                continue
+            shard.process.join()
+            exitcode = shard.process.exitcode
+            shard.process = None
+            shard.slot = None
+            if exitcode == 0:
+                shard.state = STATE_DONE
+                print(f"分片完成: {shard.name}")
+                continue
+            if shard.restarts >= self.max_restarts:
+                shard.state = STATE_FAILED
+                print(f"分片 {shard.name} 已重启 {shard.restarts} 次仍异常退出（退出码 {exitcode}），放弃")
+                continue
+            shard.restarts += 1
+            delay = min(RESTART_MAX_DELAY, RESTART_BASE_DELAY * 2 ** (shard.restarts - 1))
+            shard.state = STATE_PENDING
+            shard.retry_at = time.time() + delay
+            print(f"分片 {shard.name} 的工作进程异常退出（退出码 {exitcode}），{delay} 秒后第 {shard.restarts} 次重启")
+
+    def _maintain_tokens(self):
+        """检查token池，不足或全部失效时在主进程中扫码补充"""
+        if self.scheduler is None:
+            return
+        try:
+            if not self.scheduler.get_access_token():
+                print("没有可用的access_token，工作进程等待中")
+        except Exception as e:
+            print(f"检查token池失败: {e}")
+
+    def _progress(self, shard):
+        """分片的进度: (已完成月份, 有进度的月份, 已处理条目, 条目总数, 待重试条目)"""
+        months_done = months = items_done = items = 0
+        if self.checkpoint is not None:
+            for _, _, _, offset, total, done in self.checkpoint.status(shard.hierarchy_id, shard.year):
+                months += 1
+                months_done += int(done)
+                items_done += offset
+                items += total
+        return months_done, months, items_done, items, self.failures.pending_count(shard.hierarchy_id, shard.year)
+
+    def report(self):
+        """打印各分片的状态和进度汇总"""
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        counts = {state: 0 for state in STATE_NAMES}
+        for shard in self.shards:
+            counts[shard.state] += 1
+        print("=" * 72)
+        print(f"分片进度 {time.strftime('%H:%M:%S')}（已运行 {elapsed / 60:.1f} 分钟）"
+              f" 运行中 {counts[STATE_RUNNING]}/{self.workers}，完成 {counts[STATE_DONE]}/{len(self.shards)}，"
+              f"放弃 {counts[STATE_FAILED]}")
+        total_done = total_items = 0
+        for shard in self.shards:
+            try:
+                months_done, months, items_done, items, pending = self._progress(shard)
+            except Exception as e:
+                print(f"{shard.name} 读取进度失败: {e}")
+                continue
+            total_done += items_done
+            total_items += items
+            print(f"{shard.name} [{STATE_NAMES[shard.state]}] 月份 {months_done}/{months}，"
+                  f"条目 {items_done}/{items}，待重试 {pending}，重启 {shard.restarts} 次")
+        print(f"合计已处理 {total_done}/{total_items} 条")
+        print("=" * 72)
+
+    def _stop_all(self):
+        for shard in self._running():
+            shard.process.terminate()
+        for shard in self._running():
+            shard.process.join(10)
+            shard.state = STATE_PENDING
+
+    def run(self):
+        """运行到所有分片完成或放弃
+
+        Returns:
+            bool: 是否所有分片都已完成
+        """
+        os.makedirs(SUPERVISOR_LOG_DIR, exist_ok=True)
+        self.started_at = time.time()
+        print(f"共 {len(self.shards)} 个分片，工作进程数: {self.workers}")
+        last_report = time.time()
+        try:
+            while any(shard.state in (STATE_PENDING, STATE_RUNNING) for shard in self.shards):
+                self._reap()
+                self._launch()
+                if time.time() - last_report >= SUPERVISOR_REPORT_INTERVAL:
+                    self._maintain_tokens()
+                    self.report()
+                    last_report = time.time()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n正在停止工作进程...")
+            self._stop_all()
+            raise
+        self.report()
+        return all(shard.state == STATE_DONE for shard in self.shards)
+
+
+def run_supervisor(scheduler=None):
+    """按配置文件运行多进程分片爬取，供main调用"""
+    return Supervisor(scheduler=scheduler).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程按(层级, 年份)分片爬取法规详情")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认取SUPERVISOR_WORKERS")
+    parser.add_argument('--hierarchies', default=None, help="层级ID，逗号分隔，如1,2,3")
+    parser.add_argument('--start-year', type=int, default=None, help="开始年份")
+    parser.add_argument('--end-year', type=int, default=None, help="结束年份")
+    args = parser.parse_args()
+    hierarchies = [int(h) for h in args.hierarchies.split(',') if h] if args.hierarchies else None
+    from .crawler_scheduler import CrawlerScheduler
+    scheduler = CrawlerScheduler()
+    scheduler.show_tokens_status()
+    if not scheduler.get_access_token():
+        print("没有可用的健康access_token，将尝试通过微信扫码登录获取")
+        scheduler.ensure_enough_tokens()
+    supervisor = Supervisor(hierarchies, args.start_year, args.end_year, args.workers, scheduler=scheduler)
+    sys.exit(0 if supervisor.run() else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分阶段耗时统计
+在目录抓取、详情请求、解析、写入和限流休眠等阶段外包一层span，记录每次耗时，
+每轮抓取结束时打印各阶段的次数、总耗时、占墙钟时间的比例和分位数，用于判断瓶颈在哪一步
+
+TIMING_SPANS_ENABLED为False时span()返回同一个空对象，不取时间也不加锁，开销可以忽略
+
+用法:
+    with timing.span('detail.request'):
+        response = session.get(url)
+    timing.record('detail.sleep', waited)
+    timing.report("法律法规 2023年")
+"""
+
+import math
+import threading
+import time
+from array import array
+
+from .config import TIMING_SPANS_ENABLED
+
+
+class _NullSpan:
+    """未开启统计时使用的空span"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'started')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 出错的阶段同样计入，失败请求的耗时也是瓶颈的一部分
+        self.recorder.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def percentile(values, pct):
+    """已排序序列的分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+class SpanRecorder:
+    """按阶段名收集耗时，多线程共用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # 耗时用array保存，百万级样本也只占几MB
+            self._durations = {}
+            self._started = time.perf_counter()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = array('d')
+            durations.append(seconds)
+
+    def summary(self):
+        """各阶段的统计，按总耗时从高到低排列
+
+        Returns:
+            tuple: (墙钟秒数, [{'stage', 'count', 'total', 'mean', 'p50', 'p95', 'max'}, ...])
+        """
+        with self._lock:
+            wall = time.perf_counter() - self._started
+            snapshot = {name: sorted(values) for name, values in self._durations.items()}
+        stages = []
+        for name, values in snapshot.items():
+            total = sum(values)
+            stages.append({
+                'stage': name,
+                'count': len(values),
+                'total': total,
+                'mean': total / len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'max': values[-1],
+            })
+        stages.sort(key=lambda stage: stage['total'], reverse=True)
+        return wall, stages
+
+    def report(self, title=""):
+        """打印本轮的阶段耗时汇总并清零，没有任何记录时不打印"""
+        wall, stages = self.summary()
+        self.reset()
+        if not stages:
+            return
+        print("=" * 60)
+        print(f"阶段耗时汇总 {title}（墙钟 {wall:.2f} 秒）")
+        # 中文表头每个字占两列，宽度相应减小以与数据列对齐
+        print(f"{'阶段':<22}{'次数':>6}{'总计(秒)':>8}{'占比':>6}{'平均(ms)':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'最大(ms)':>8}")
+        for stage in stages:
+            share = stage['total'] / wall * 100 if wall else 0.0
+            print(f"{stage['stage']:<24}{stage['count']:>8}{stage['total']:>11.2f}{share:>7.1f}%"
+                  f"{stage['mean'] * 1000:>10.1f}{stage['p50'] * 1000:>10.1f}"
+                  f"{stage['p95'] * 1000:>10.1f}{stage['max'] * 1000:>10.1f}")
+        print("多线程或并发抓取时各阶段耗时会重叠，占比之和可能超过100%；*.sleep是*.rate_limit中实际休眠的部分")
+        print("=" * 60)
+
+
+_recorder = SpanRecorder() if TIMING_SPANS_ENABLED else None
+
+
+def enable(enabled=True):
+    """运行时开启或关闭统计，用于基准测试等场景"""
+    global _recorder
+    _recorder = SpanRecorder() if enabled else None
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def span(name):
+    """统计一个阶段的耗时，用作with语句"""
+    if _recorder is None:
+        return _NULL_SPAN
+    return _recorder.span(name)
+
+
+def record(name, seconds):
+    """直接记录一段已知的耗时，如限流器返回的休眠秒数"""
+    if _recorder is not None:
+        _recorder.record(name, seconds)
+
+
+def report(title=""):
+    """打印并清零本轮汇总，未开启统计时什么也不做"""
+    if _recorder is not None:
+        _recorder.report(title)
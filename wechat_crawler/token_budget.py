@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+access_token每日请求预算
+每个token每天的请求数记在Redis计数器中（当天零点过期），所有请求路径发请求前都先扣减一次，
+达到MAX_REQUESTS_PER_COOKIE的请求不会发出，避免触发网站的“您今日请求数已超过限制”；
+爬虫在用量接近上限（剩余不足TOKEN_BUDGET_MARGIN）时切换到今日用量最少的健康token
+"""
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+
+import redis
+import requests
+
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    MAX_REQUESTS_PER_COOKIE, TOKEN_BUDGET_MARGIN
+)
+from .token_health import get_token_health_cache
+
+# KEYS[1]: 当天的计数器
+# ARGV: 每日上限, 计数器过期的时间戳（秒）
+# 返回值: 扣减后的用量；已达上限时不扣减，返回当前用量的相反数
+CONSUME_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used >= tonumber(ARGV[1]) then
+    return -used
+end
+used = redis.call('INCR', KEYS[1])
+if used == 1 then
+    redis.call('EXPIREAT', KEYS[1], ARGV[2])
+end
+return used
+"""
+
+
+class TokenBudgetExceeded(requests.exceptions.RequestException):
+    """token今日请求数已达上限，请求没有发出
+
+    继承RequestException，现有按请求失败处理的代码路径无需改动
+    """
+
+
+class TokenBudget:
+    """按自然日统计每个access_token的请求数"""
+
+    def __init__(self, redis_conn=None, limit=None, margin=None):
+        """初始化预算
+
+        Args:
+            redis_conn: Redis连接，默认按配置文件新建
+            limit: 每个token每天允许的请求数，默认取MAX_REQUESTS_PER_COOKIE，0为不限制
+            margin: 剩余请求数不超过该值时视为接近上限，默认取TOKEN_BUDGET_MARGIN
+        """
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self.limit = MAX_REQUESTS_PER_COOKIE if limit is None else limit
+        self.margin = TOKEN_BUDGET_MARGIN if margin is None else margin
+        self.health_cache = get_token_health_cache()
+        self._script = self.redis_conn.register_script(CONSUME_SCRIPT)
+        # 本进程最近一次看到的用量，{token: 用量}，跨天时清空
+        self._usage = {}
+        self._day = None
+        # 已切换的token，{原token: 替换token}，目录抓取等沿用原token传参的调用方不必每次重新选择
+        self._replacements = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.limit > 0
+
+    @staticmethod
+    def _today():
+        return datetime.date.today().strftime('%Y%m%d')
+
+    def _key(self, token, day=None):
+        """当天计数器的键名，不把token明文写进键名"""
+        digest = hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+        return f"token_usage:{day or self._today()}:{digest}"
+
+    @staticmethod
+    def _next_midnight():
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        return int(time.mktime(tomorrow.timetuple()))
+
+    def _remember(self, token, used):
+        today = self._today()
+        with self._lock:
+            if self._day != today:
+                self._usage = {}
+                self._replacements = {}
+                self._day = today
+            self._usage[token] = used
+
+    def _remembered(self, token):
+        with self._lock:
+            if self._day != self._today():
+                return None
+            return self._usage.get(token)
+
+    def consume(self, token):
+        """发请求前扣减一次用量
+
+        Returns:
+            int: 扣减后的今日用量，未开启预算时为0
+
+        Raises:
+            TokenBudgetExceeded: 今日用量已达上限
+        """
+        if not self.enabled or not token:
+            return 0
+        try:
+            used = int(self._script(keys=[self._key(token)], args=[self.limit, self._next_midnight()]))
+        except redis.RedisError as e:
+            # Redis不可用时不阻断请求，由网站的限制和token健康检查兜底
+            print(f"扣减token请求预算失败: {e}")
+            return 0
+        if used < 0:
+            self._remember(token, -used)
+            raise TokenBudgetExceeded(f"access_token今日请求数已达上限 {self.limit}: {token[:10]}...")
+        self._remember(token, used)
+        return used
+
+    def usage_many(self, tokens):
+        """一次读取多个token的今日用量
+
+        Returns:
+            dict: {token: 用量}
+        """
+        tokens = list(tokens)
+        if not tokens:
+            return {}
+        try:
+            values = self.redis_conn.mget([self._key(token) for token in tokens])
+        except redis.RedisError as e:
+            print(f"读取token请求预算失败: {e}")
+            return {token: 0 for token in tokens}
+        usage = {}
+        for token, value in zip(tokens, values):
+            usage[token] = int(value or 0)
+            self._remember(token, usage[token])
+        return usage
+
+    def usage(self, token):
+        """token今日用量，优先使用本进程最近一次扣减时看到的值"""
+        used = self._remembered(token)
+        if used is None:
+            used = self.usage_many([token])[token]
+        return used
+
+    def near_limit(self, token):
+        """今日剩余请求数是否已不超过margin，需要切换token"""
+        if not self.enabled or not token:
+            return False
+        return self.usage(token) >= self.limit - self.margin
+
+    def is_exhausted(self, token):
+        """今日请求数是否已用完"""
+        if not self.enabled or not token:
+            return False
+        return self.usage(token) >= self.limit
+
+    def available(self, tokens):
+        """按今日用量从少到多排列未接近上限的token"""
+        tokens = [token for token in tokens if token]
+        if not self.enabled:
+            return tokens
+        usage = self.usage_many(tokens)
+        return sorted((token for token in tokens if usage[token] < self.limit - self.margin),
+                      key=lambda token: usage[token])
+
+    def pick(self, tokens, exclude=()):
+        """从候选token中选出今日用量最少且未接近上限的一个，全部接近上限时返回None"""
+        available = self.available(token for token in tokens if token not in exclude)
+        return available[0] if available else None
+
+    def pool_tokens(self):
+        """Redis列表access_tokens中健康缓存未标记为失效的token"""
+        try:
+            raw_tokens = self.redis_conn.lrange('access_tokens', 0, -1)
+        except redis.RedisError as e:
+            print(f"读取token列表失败: {e}")
+            return []
+        tokens = []
+        for raw in raw_tokens:
+            try:
+                token = json.loads(raw.decode('utf-8'))['token']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if self.health_cache.is_healthy(token) is not False:
+                tokens.append(token)
+        return tokens
+
+    def ensure(self, token):
+        """返回可以继续使用的token
+
+        当前token未接近上限时原样返回，否则从token池中换一个今日用量最少的
+
+        Raises:
+            TokenBudgetExceeded: token池中所有token都已接近上限
+        """
+        if not self.near_limit(token):
+            return token
+        with self._lock:
+            replacement = self._replacements.get(token)
+        if replacement is not None and not self.near_limit(replacement):
+            return replacement
+        replacement = self.pick(self.pool_tokens(), exclude=(token, replacement))
+        if replacement is None:
+            raise TokenBudgetExceeded(f"所有access_token今日请求数都已接近上限 {self.limit}")
+        print(f"access_token {token[:10]}... 今日已请求 {self.usage(token)} 次，切换到 {replacement[:10]}...")
+        with self._lock:
+            self._replacements[token] = replacement
+        return replacement
+
+
+_token_budget = None
+_token_budget_lock = threading.Lock()
+
+
+def get_token_budget():
+    """获取进程内共享的token请求预算"""
+    global _token_budget
+    with _token_budget_lock:
+        if _token_budget is None:
+            _token_budget = TokenBudget()
+        return _token_budget
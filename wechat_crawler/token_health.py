@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+access_token健康状态缓存
+健康状态同时保存在进程内存和Redis中，每条记录包含状态、检查时间和有效期；
+爬虫的真实请求结果会被动更新缓存，只有缓存过期时才需要主动发起探测请求
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+import redis
+
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    TOKEN_HEALTH_TTL, TOKEN_REJECTED_CODES
+)
+from . import metrics
+
+STATUS_HEALTHY = 'healthy'
+STATUS_UNHEALTHY = 'unhealthy'
+
+# 接口响应的分类，目录、详情和健康探测共用
+OUTCOME_OK = 'ok'
+OUTCOME_THROTTLED = 'throttled'  # 被限流：HTTP 429、“超过限制”、非第一页查询被重置到第一页
+OUTCOME_REJECTED = 'rejected'  # token不可用：HTTP 401/403或TOKEN_REJECTED_CODES中的业务错误码
+OUTCOME_OVERLOADED = 'overloaded'  # 服务端过载：HTTP 502/503/504或请求超时
+OUTCOME_ERROR = 'error'  # 与token和请求速率无关的错误，如单条数据404、其他业务错误码
+
+PAGE_RESET_REASON = "非第一页查询被重置到第一页"
+
+
+def classify_response(status_code, data=None, page_index=None, page_size=None):
+    """对接口响应分类
+
+    Args:
+        status_code: HTTP状态码
+        data: 已解析的响应JSON，解析失败时为None
+        page_index: 目录请求的页码，大于0时检查是否被悄悄重置到第一页
+        page_size: 目录请求的每页条数，用于区分限流和每页条数超过上限导致的重置
+
+    Returns:
+        tuple: (分类, 原因)
+    """
+    if status_code == 429:
+        return OUTCOME_THROTTLED, "HTTP 429"
+    if status_code in (401, 403):
+        return OUTCOME_REJECTED, f"HTTP {status_code}"
+    if status_code in (502, 503, 504):
+        return OUTCOME_OVERLOADED, f"HTTP {status_code}"
+    if status_code != 200:
+        return OUTCOME_ERROR, f"HTTP {status_code}"
+    if not isinstance(data, dict):
+        return OUTCOME_OK, ''
+    message = data.get('message') or ''
+    if '超过限制' in message:
+        return OUTCOME_THROTTLED, message
+    code = data.get('code', 0)
+    if code == 429:
+        return OUTCOME_THROTTLED, message or "code 429"
+    if code in TOKEN_REJECTED_CODES:
+        return OUTCOME_REJECTED, message or f"code {code}"
+    if code != 0:
+        # 其他业务错误（如参数错误、数据不存在）与token无关，不能因此把token移出池子
+        return OUTCOME_ERROR, message or f"code {code}"
+    # 被限流时目录接口有时不报错，而是返回第一页的数据；
+    # 每页条数超过上限时接口同样会重置到第一页，但返回的pageSize与请求不同，不算限流
+    info = data.get('data')
+    if page_index and isinstance(info, dict) and info.get('pageIndex') == 0:
+        if page_size is None or info.get('pageSize') in (None, page_size):
+            return OUTCOME_THROTTLED, PAGE_RESET_REASON
+    return OUTCOME_OK, message
+
+
+def response_is_healthy(status_code, data=None, page_index=None, page_size=None):
+    """根据接口响应判断token是否仍然可用
+
+    被限流只说明请求过快，由限流器降速和熔断暂停该token，不记为不健康，否则调度器会把token移出池子
+
+    Returns:
+        tuple: (是否健康, 原因)，被限流、单条数据404或服务端错误等无法判断token的情况返回(None, 原因)
+    """
+    outcome, reason = classify_response(status_code, data, page_index, page_size)
+    if outcome == OUTCOME_OK:
+        return True, reason
+    if outcome == OUTCOME_REJECTED:
+        return False, reason
+    return None, reason
+
+
+class TokenHealthCache:
+    """带有效期的token健康状态缓存"""
+
+    def __init__(self, redis_conn=None, ttl=None):
+        """初始化缓存
+
+        Args:
+            redis_conn: Redis连接，默认按配置文件新建
+            ttl: 健康状态的有效期（秒），过期后需要重新探测
+        """
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self.ttl = ttl or TOKEN_HEALTH_TTL
+        self._local = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        """缓存键名，不把token明文写进键名"""
+        return "token_health:" + hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _is_fresh(entry):
+        return entry is not None and time.time() - entry['checked_at'] < entry['ttl']
+
+    def get(self, token):
+        """获取未过期的健康记录，没有或已过期时返回None
+
+        Returns:
+            dict: {'status', 'checked_at', 'ttl', 'reason'}
+        """
+        with self._lock:
+            entry = self._local.get(token)
+        if self._is_fresh(entry):
+            return entry
+        # 本进程没有新鲜记录时再查Redis，其他进程或机器可能刚更新过
+        try:
+            raw = self.redis_conn.get(self._key(token))
+        except redis.RedisError as e:
+            print(f"读取token健康缓存失败: {e}")
+            return None
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        if not self._is_fresh(entry):
+            return None
+        with self._lock:
+            self._local[token] = entry
+        return entry
+
+    def is_healthy(self, token):
+        """返回缓存中的健康状态：True/False，缓存缺失或过期时返回None"""
+        entry = self.get(token)
+        if entry is None:
+            return None
+        return entry['status'] == STATUS_HEALTHY
+
+    def set(self, token, healthy, reason='', ttl=None):
+        """写入一条健康记录（内存和Redis）"""
+        entry = {
+            'status': STATUS_HEALTHY if healthy else STATUS_UNHEALTHY,
+            'checked_at': time.time(),
+            'ttl': ttl or self.ttl,
+            'reason': reason
+        }
+        with self._lock:
+            self._local[token] = entry
+        try:
+            self.redis_conn.set(self._key(token), json.dumps(entry, ensure_ascii=False), ex=int(entry['ttl']))
+        except redis.RedisError as e:
+            print(f"写入token健康缓存失败: {e}")
+        return entry
+
+    def record_response(self, token, status_code, data=None, page_index=None, page_size=None):
+        """根据爬虫真实请求的响应被动更新缓存
+
+        状态未变化且记录仍在前半个有效期内时不重复写Redis
+
+        Returns:
+            bool: 本次响应是否表明token健康，无法判断时返回None
+        """
+        healthy, reason = response_is_healthy(status_code, data, page_index, page_size)
+        if status_code == 429:
+            metrics.RATE_LIMIT_HITS.labels(metrics.token_label(token), 'http_429').inc()
+        elif '超过限制' in reason:
+            metrics.RATE_LIMIT_HITS.labels(metrics.token_label(token), 'quota_exceeded').inc()
+        elif reason == PAGE_RESET_REASON:
+            metrics.RATE_LIMIT_HITS.labels(metrics.token_label(token), 'page_reset').inc()
+        if not token or healthy is None:
+            return healthy
+        with self._lock:
+            entry = self._local.get(token)
+        status = STATUS_HEALTHY if healthy else STATUS_UNHEALTHY
+        if (entry is not None and entry['status'] == status
+                and time.time() - entry['checked_at'] < entry['ttl'] / 2):
+            return healthy
+        self.set(token, healthy, reason)
+        if not healthy:
+            print(f"token请求异常，已标记为不健康: {token[:10]}... ({reason})")
+        return healthy
+
+    def invalidate(self, token):
+        """删除token的健康记录"""
+        with self._lock:
+            self._local.pop(token, None)
+        try:
+            self.redis_conn.delete(self._key(token))
+        except redis.RedisError as e:
+            print(f"删除token健康缓存失败: {e}")
+
+
+_health_cache = None
+_health_cache_lock = threading.Lock()
+
+
+def get_token_health_cache():
+    """获取进程内共享的token健康缓存"""
+    global _health_cache
+    with _health_cache_lock:
+        if _health_cache is None:
+            _health_cache = TokenHealthCache()
+        return _health_cache
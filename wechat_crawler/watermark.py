@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+目录增量抓取水位线
+每个层级（以及处罚案例）记录已见过的最新publishDate和该日期下的ID集合，
+增量抓取时只从水位线日期开始查询，遇到已知ID即停止翻页
+"""
+
+import redis
+
+from .config import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD
+
+# 原子推进水位线：日期更新时替换ID集合，日期相同时合并ID集合，日期更旧时忽略
+# KEYS: 日期键, ID集合键；ARGV: 日期, id1, id2...
+# 返回1表示水位线有变化
+ADVANCE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if (not current) or ARGV[1] > current then
+    redis.call('SET', KEYS[1], ARGV[1])
+    redis.call('DEL', KEYS[2])
+elseif ARGV[1] < current then
+    return 0
+end
+for i = 2, #ARGV do
+    redis.call('SADD', KEYS[2], ARGV[i])
+end
+return 1
+"""
+
+
+def statute_scope(hierarchy_id):
+    """法规目录的水位线名称"""
+    return f"statutes:{hierarchy_id}"
+
+
+CASUS_SCOPE = "casus"
+
+
+class WatermarkStore:
+    """保存在Redis中的目录水位线"""
+
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self._advance = self.redis_conn.register_script(ADVANCE_SCRIPT)
+
+    @staticmethod
+    def _keys(scope):
+        return [f"listing:watermark:{scope}", f"listing:watermark:{scope}:ids"]
+
+    def get(self, scope):
+        """读取水位线
+
+        Returns:
+            tuple: (最新publishDate字符串, 该日期下已知ID集合)，没有水位线时返回(None, 空集合)
+        """
+        date_key, ids_key = self._keys(scope)
+        pipe = self.redis_conn.pipeline()
+        pipe.get(date_key)
+        pipe.smembers(ids_key)
+        date, ids = pipe.execute()
+        if not date:
+            return None, set()
+        return date.decode('utf-8'), {i.decode('utf-8') for i in ids}
+
+    def observe(self, scope, rows, id_field='statuteId'):
+        """用一批目录行推进水位线，只取其中最新日期的行
+
+        Args:
+            scope: 水位线名称，见statute_scope和CASUS_SCOPE
+            rows: 接口返回的目录行，需要包含publishDate
+            id_field: ID字段名，法规为statuteId，处罚案例为casusId
+
+        Returns:
+            bool: 水位线是否有变化
+        """
+        dated = [(row.get('publishDate'), row.get(id_field)) for row in rows]
+        dated = [(d, i) for d, i in dated if d and i]
+        if not dated:
+            return False
+        newest = max(d for d, _ in dated)
+        ids = [i for d, i in dated if d == newest]
+        return bool(self._advance(keys=self._keys(scope), args=[newest] + ids))
+
+    def reset(self, scope):
+        """删除水位线，下次增量抓取前需要重新全量抓取"""
+        self.redis_conn.delete(*self._keys(scope))
@@ -12,8 +12,9 @@ import re  # 用于正则表达式匹配
 import random  # 用于随机选择
 from .config import (  # 从配置文件导入相关配置
     REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
-    QR_CODE_PATH, HEADLESS
+    QR_CODE_PATH, HEADLESS, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
 )
+from .http_client import build_headers  # banklaw.com统一请求头
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
@@ -231,7 +232,9 @@ class WechatLogin:
         # 获取用户输入的标识信息
         # user_name = input("请输入用户标识（例如：张三的手机）: ")
         #请求get获取用户详细信息
-        respone_user = requests.get('https://oss.banklaw.com/ucenter/v1/users/me/audit_status?time=1742291419792&1742291419792',headers = {'Access-Token':token})
+        # 登录时的一次性请求不经过共享Session，不扣减token的每日抓取预算，也不计入抓取接口的监控指标
+        respone_user = requests.get('https://oss.banklaw.com/ucenter/v1/users/me/audit_status?time=1742291419792&1742291419792',
+                                    headers=build_headers(token), timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
         user_name = respone_user.json().get('data').get('name')
         # 创建token信息对象
         token_info = {
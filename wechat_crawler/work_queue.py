@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基于Redis的法规下载任务队列
+目录数据（statuteId、标题、层级、年份）只入队一次，任意机器上的工作进程以租约方式领取任务，
+写入成功后确认，租约到期未确认的任务自动回到队列，增加机器即可线性提高吞吐
+"""
+
+import glob
+import json
+import os
+import re
+
+import redis
+
+from .config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD,
+    WORK_QUEUE_LEASE_SECONDS
+)
+
+# 入队：同一个ID只会入队一次
+# KEYS: seen集合, items哈希, pending列表；ARGV: id1, payload1, id2, payload2...
+# 返回新入队的数量
+ENQUEUE_SCRIPT = """
+local added = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+        redis.call('RPUSH', KEYS[3], ARGV[i])
+        added = added + 1
+    end
+end
+return added
+"""
+
+# 领取：先把过期租约放回队首，再领取最多count个任务
+# KEYS: pending列表, leases有序集合, items哈希；ARGV: 租约毫秒数, count
+# 返回 {id1, payload1, id2, payload2...}
+CLAIM_SCRIPT = """
+local now_t = redis.call('TIME')
+local now = tonumber(now_t[1]) * 1000 + math.floor(tonumber(now_t[2]) / 1000)
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+for i = #expired, 1, -1 do
+    redis.call('ZREM', KEYS[2], expired[i])
+    redis.call('LPUSH', KEYS[1], expired[i])
+end
+local result = {}
+local count = tonumber(ARGV[2])
+while #result < count * 2 do
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then
+        break
+    end
+    local payload = redis.call('HGET', KEYS[3], id)
+    if payload then
+        redis.call('ZADD', KEYS[2], now + tonumber(ARGV[1]), id)
+        table.insert(result, id)
+        table.insert(result, payload)
+    end
+end
+return result
+"""
+
+# 放弃租约：任务立即回到队尾，租约已过期被他人领取时不做处理
+# KEYS: pending列表, leases有序集合；ARGV: id
+RELEASE_SCRIPT = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class WorkQueue:
+    """带可见性超时租约的分布式任务队列"""
+
+    def __init__(self, name='statutes', redis_conn=None, lease_seconds=None):
+        """初始化任务队列
+
+        Args:
+            name: 队列名称，不同类型的任务使用不同队列
+            redis_conn: Redis连接，默认按配置文件新建
+            lease_seconds: 租约时长（秒），超时未确认的任务会重新分配
+        """
+        self.redis_conn = redis_conn or redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD
+        )
+        self.lease_seconds = lease_seconds or WORK_QUEUE_LEASE_SECONDS
+        prefix = f"crawl:queue:{name}"
+        self.pending_key = f"{prefix}:pending"
+        self.leases_key = f"{prefix}:leases"
+        self.items_key = f"{prefix}:items"
+        self.seen_key = f"{prefix}:seen"
+        self._enqueue = self.redis_conn.register_script(ENQUEUE_SCRIPT)
+        self._claim = self.redis_conn.register_script(CLAIM_SCRIPT)
+        self._release = self.redis_conn.register_script(RELEASE_SCRIPT)
+
+    def enqueue(self, items, hierarchy_id, year, batch_size=500):
+        """批量入队目录条目，已入队过的ID会被忽略
+
+        Args:
+            items: 目录条目列表，每项至少包含statuteId和title
+            hierarchy_id: 层级ID
+            year: 年份
+
+        Returns:
+            int: 新入队的数量
+        """
+        added = 0
+        args = []
+        for item in items:
+            statute_id = item.get('statuteId') or item.get('id')
+            if not statute_id:
+                continue
+            payload = {
+                'statuteId': statute_id,
+                'title': item.get('title'),
+                'hierarchy_id': hierarchy_id,
+                'year': year
+            }
+            args.extend([statute_id, json.dumps(payload, ensure_ascii=False)])
+            if len(args) >= batch_size * 2:
+                added += self._enqueue(keys=[self.seen_key, self.items_key, self.pending_key], args=args)
+                args = []
+        if args:
+            added += self._enqueue(keys=[self.seen_key, self.items_key, self.pending_key], args=args)
+        return added
+
+    def claim(self, count=1):
+        """领取最多count个任务
+
+        Returns:
+            list: 任务字典列表，每项包含statuteId、title、hierarchy_id、year
+        """
+        result = self._claim(
+            keys=[self.pending_key, self.leases_key, self.items_key],
+            args=[int(self.lease_seconds * 1000), count]
+        )
+        return [json.loads(result[i + 1]) for i in range(0, len(result), 2)]
+
+    def ack(self, statute_id):
+        """确认任务已完成，删除任务数据"""
+        pipe = self.redis_conn.pipeline()
+        pipe.zrem(self.leases_key, statute_id)
+        pipe.hdel(self.items_key, statute_id)
+        pipe.execute()
+
+    def release(self, statute_id):
+        """放弃任务租约，任务立即回到队列等待重试"""
+        return bool(self._release(keys=[self.pending_key, self.leases_key], args=[statute_id]))
+
+    def defer(self, item, retry_at):
+        """推迟任务到retry_at（时间戳）之后才能再次领取，用于等待失败重试的退避时间
+
+        租约到期的任务在下一次领取时回到队首，这里把租约到期时间改为retry_at，
+        并在任务数据中标记retry，成功后由消费者清除失败记录
+        """
+        statute_id = item['statuteId']
+        pipe = self.redis_conn.pipeline()
+        pipe.zadd(self.leases_key, {statute_id: int(retry_at * 1000)}, xx=True)
+        pipe.hset(self.items_key, statute_id, json.dumps(dict(item, retry=True), ensure_ascii=False))
+        pipe.execute()
+
+    def extend(self, statute_id, lease_seconds=None):
+        """延长任务租约，处理耗时较长时调用"""
+        lease_seconds = lease_seconds or self.lease_seconds
+        now = self.redis_conn.time()
+        deadline = now[0] * 1000 + now[1] // 1000 + int(lease_seconds * 1000)
+        return bool(self.redis_conn.zadd(self.leases_key, {statute_id: deadline}, xx=True, ch=True))
+
+    def stats(self):
+        """返回队列状态：等待中、租约中的任务数"""
+        pipe = self.redis_conn.pipeline()
+        pipe.llen(self.pending_key)
+        pipe.zcard(self.leases_key)
+        pending, leased = pipe.execute()
+        return {'pending': pending, 'leased': leased}
+
+    def is_drained(self):
+        """队列中既没有等待的任务也没有租约中的任务"""
+        stats = self.stats()
+        return stats['pending'] == 0 and stats['leased'] == 0
+
+
+def enqueue_from_api_responses(queue, base_dir='api_responses'):
+    """把已有的目录文件全部入队，重复执行只会入队新增条目
+
+    Returns:
+        int: 新入队的数量
+    """
+    pattern = os.path.join(base_dir, 'hierarchy_*', '*', 'api_response_*.json')
+    added = 0
+    for file_path in sorted(glob.glob(pattern)):
+        year_dir = os.path.dirname(file_path)
+        match = re.match(r'hierarchy_(\d+)_', os.path.basename(os.path.dirname(year_dir)))
+        if not match:
+            continue
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取目录文件 {file_path} 失败: {e}")
+            continue
+        hierarchy_id = data.get('hierarchy_id') or int(match.group(1))
+        year = data.get('year') or int(os.path.basename(year_dir))
+        added += queue.enqueue(data.get('data') or [], hierarchy_id, year)
+    print(f"目录文件入队完成，新增任务 {added} 个，队列状态: {queue.stats()}")
+    return added